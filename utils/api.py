@@ -0,0 +1,239 @@
+"""Shared asynchronous OpenAI client for the voice assistant.
+
+One OpenAIPool is created per process and shared by every session. It wraps
+a single AsyncOpenAI client whose HTTP connection pool is reused across
+callers, and caps the number of in-flight requests per endpoint so a burst
+of callers queues locally instead of opening unbounded connections.
+
+Every request also goes through the endpoint's adaptive rate limiter, a
+deadline, retries with jittered backoff and a circuit breaker (see
+resilience.py). Transcription and speech requests still running after the
+endpoint's recent p95 latency are hedged: a second identical request is sent
+and whichever answers first wins. A streamed chat completion is only retried
+before its first chunk, so a caller never hears part of a reply twice. When
+a circuit is open, requests to that endpoint fail at once with
+CircuitOpenError and the session falls back to cached phrases. Streamed
+speech is retried the same way and is not hedged.
+
+All methods must be awaited on the event loop that owns the pool.
+Cancelling the awaiting task aborts the underlying HTTP request.
+"""
+import io
+import asyncio
+import contextlib
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from resilience import RateLimiter, CircuitBreaker, LatencyTracker, retry, is_retryable
+
+# Connection pool shared by all endpoints
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+
+# Maximum concurrent requests per endpoint
+ENDPOINT_CONCURRENCY = {
+    "chat": 32,
+    "transcription": 16,
+    "speech": 16
+}
+
+# Requests per minute per endpoint; lowered automatically while the API answers 429
+REQUESTS_PER_MINUTE = {
+    "chat": 5000,
+    "transcription": 1000,
+    "speech": 1000
+}
+
+# Seconds a request may take before it is abandoned and retried.
+# For a streamed chat completion this covers the response headers, and
+# STREAM_IDLE_TIMEOUT then bounds each gap between chunks.
+DEADLINES = {
+    "chat": 30.0,
+    "transcription": 15.0,
+    "speech": 15.0
+}
+STREAM_IDLE_TIMEOUT = 15.0
+SPEECH_CHUNK_BYTES = 4800  # Streamed speech is read in chunks of 100 ms of 24 kHz 16-bit audio
+
+# Endpoints whose requests are hedged, with the delay used before their p95 has been measured
+HEDGE_DELAY = {
+    "transcription": 2.0,
+    "speech": 1.5
+}
+MIN_HEDGE_DELAY = 0.25  # Never hedge sooner than this, however fast the endpoint has been
+
+
+class OpenAIPool:
+    """AsyncOpenAI client with a shared connection pool and per-endpoint concurrency limits"""
+
+    def __init__(self, api_key=None, concurrency=None, base_url=None, requests_per_minute=None, deadlines=None,
+                 hedge=True):
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+        )
+        # Raises openai.OpenAIError when no key is given and OPENAI_API_KEY is unset.
+        # base_url (or OPENAI_BASE_URL) can point at a local stand-in such as benchmark.py --serve
+        # Retries are done here, with the rate limiter and circuit breaker in the loop, not by the SDK
+        self.client = AsyncOpenAI(api_key=api_key or None, base_url=base_url, http_client=http_client,
+                                  max_retries=0)
+        limits = dict(ENDPOINT_CONCURRENCY, **(concurrency or {}))
+        self.semaphores = {endpoint: asyncio.Semaphore(limit) for endpoint, limit in limits.items()}
+        rates = dict(REQUESTS_PER_MINUTE, **(requests_per_minute or {}))
+        self.limiters = {endpoint: RateLimiter.per_minute(rpm, burst=max(1, rpm // 60))
+                         for endpoint, rpm in rates.items()}
+        self.deadlines = dict(DEADLINES, **(deadlines or {}))
+        self.breakers = {endpoint: CircuitBreaker(endpoint) for endpoint in limits}
+        self.latencies = {endpoint: LatencyTracker(HEDGE_DELAY.get(endpoint)) for endpoint in limits}
+        self.hedge = hedge
+        self.hedges = 0  # Hedged requests sent
+        self.hedge_wins = 0  # ...that answered before the original
+
+    @contextlib.asynccontextmanager
+    async def slot(self, endpoint):
+        """Hold one of the endpoint's concurrency slots"""
+        async with self.semaphores[endpoint]:
+            yield
+
+    def available(self, endpoint):
+        """False while the endpoint's circuit is open"""
+        return not self.breakers[endpoint].is_open
+
+    async def request(self, endpoint, make_request, hold_slot=True, hedge=True):
+        """Send make_request() through the endpoint's breaker, rate limiter, deadline and retries"""
+        breaker = self.breakers[endpoint]
+        limiter = self.limiters[endpoint]
+        hedged = hedge and self.hedge and endpoint in HEDGE_DELAY
+
+        async def attempt():
+            await limiter.acquire()
+            started = asyncio.get_running_loop().time()
+            try:
+                async with asyncio.timeout(self.deadlines[endpoint]):
+                    if hedged:
+                        result = await self.hedged(endpoint, make_request)
+                    elif hold_slot:
+                        async with self.slot(endpoint):
+                            result = await make_request()
+                    else:
+                        result = await make_request()
+            except openai.RateLimitError:
+                limiter.decrease()
+                raise
+            limiter.increase()
+            self.latencies[endpoint].add(asyncio.get_running_loop().time() - started)
+            return result
+
+        trial = breaker.check()
+        try:
+            result = await retry(attempt)
+        except Exception as e:
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                # The endpoint answered; the request itself was refused (bad input, auth, content policy)
+                breaker.record_success()
+            raise
+        finally:
+            # Cancelled (dropped speculation, barge-in, stop) before any verdict: the circuit stays as it was
+            if trial:
+                breaker.end_trial()
+        breaker.record_success()
+        return result
+
+    async def hedged(self, endpoint, make_request):
+        """Await make_request(); if it runs past the endpoint's p95, race a second copy against it"""
+        async def one():
+            async with self.slot(endpoint):
+                return await make_request()
+
+        delay = max(MIN_HEDGE_DELAY, self.latencies[endpoint].percentile(95))
+        original = asyncio.ensure_future(one())
+        tasks = [original]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tasks.append(asyncio.ensure_future(one()))
+            error = None
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        if task is not original:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def chat(self, **kwargs):
+        """Create a chat completion and return the full response"""
+        return await self.request("chat", lambda: self.client.chat.completions.create(**kwargs))
+
+    async def chat_stream(self, **kwargs):
+        """Stream a chat completion, yielding chunks; the slot is held until the stream ends"""
+        async with self.slot("chat"):
+            stream = await self.request(
+                "chat", lambda: self.client.chat.completions.create(stream=True, **kwargs), hold_slot=False
+            )
+            async with stream:
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        async with asyncio.timeout(STREAM_IDLE_TIMEOUT):
+                            chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+
+    async def transcribe(self, **kwargs):
+        """Transcribe audio and return the text"""
+        upload = kwargs.pop("file")
+        data = upload.getvalue() if hasattr(upload, "getvalue") else upload.read()
+        name = getattr(upload, "name", "audio.wav")
+
+        async def send():
+            # Retries and hedges each need their own copy of the upload
+            audio_file = io.BytesIO(data)
+            audio_file.name = name
+            transcript = await self.client.audio.transcriptions.create(file=audio_file, **kwargs)
+            return transcript.text
+        return await self.request("transcription", send)
+
+    async def speech(self, **kwargs):
+        """Synthesize speech and return the audio bytes"""
+        async def send():
+            response = await self.client.audio.speech.create(**kwargs)
+            return await response.aread()
+        return await self.request("speech", send)
+
+    async def speech_stream(self, **kwargs):
+        """Synthesize speech, yielding the audio bytes as they arrive; the slot is held until the stream ends"""
+        async with self.slot("speech"):
+            # Only opening the response is retried; a hedge would leave the losing response open
+            response = await self.request(
+                "speech", lambda: self.client.audio.speech.with_streaming_response.create(**kwargs).__aenter__(),
+                hold_slot=False, hedge=False
+            )
+            try:
+                chunks = response.iter_bytes(SPEECH_CHUNK_BYTES).__aiter__()
+                while True:
+                    try:
+                        async with asyncio.timeout(STREAM_IDLE_TIMEOUT):
+                            chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+            finally:
+                await response.close()
+
+    async def check_connection(self):
+        """Make a minimal chat request to confirm the API key works"""
+        await self.chat(model="gpt-4o", messages=[{"role": "user", "content": "Hello"}], max_tokens=5)
+
+    async def aclose(self):
+        await self.client.close()
@@ -0,0 +1,104 @@
+"""In-memory audio buffers for the voice assistant.
+
+The microphone callback writes into an AudioRingBuffer; each utterance is then
+copied into one preallocated CaptureBuffer per session and encoded in memory
+(see upload.py), so a turn never touches the filesystem between the microphone
+and the Whisper upload.
+"""
+import io
+import wave
+import numpy as np
+
+
+class AudioRingBuffer:
+    """Single-producer, single-consumer ring buffer of int16 samples.
+
+    Positions are absolute sample counts since the buffer was created. The
+    producer copies samples in and then publishes the new write position with
+    a single assignment, so the reader never needs a lock: it only reads
+    samples below the published position. A reader that falls more than
+    capacity samples behind skips ahead and the gap is counted in overruns.
+    """
+
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self.write_pos = 0
+        self.overruns = 0
+
+    def write(self, samples):
+        """Append samples (producer side; never blocks)"""
+        total = len(samples)
+        if total > self.capacity:
+            samples = samples[-self.capacity:]
+        count = len(samples)
+        start = (self.write_pos + total - count) % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = samples[:first]
+        self.data[:count - first] = samples[first:]
+        self.write_pos += total
+
+    def read(self, position, max_count=None):
+        """Copy samples from position up to the write position; returns (samples, new_position)"""
+        end = self.write_pos
+        if end - position > self.capacity:
+            self.overruns += 1
+            position = end - self.capacity
+        if max_count is not None:
+            end = min(end, position + max_count)
+        count = end - position
+        start = position % self.capacity
+        first = min(count, self.capacity - start)
+        samples = np.empty(count, dtype=np.int16)
+        samples[:first] = self.data[start:start + first]
+        samples[first:] = self.data[:count - first]
+        return samples, end
+
+
+class CaptureBuffer:
+    """Preallocated int16 buffer that recorded chunks are copied into"""
+
+    def __init__(self, rate, max_seconds):
+        self.rate = rate
+        self.data = np.zeros(int(rate * max_seconds), dtype=np.int16)
+        self.length = 0
+
+    def reset(self):
+        """Start a new recording without reallocating"""
+        self.length = 0
+
+    def append(self, samples):
+        """Copy samples into the buffer; returns False once the buffer is full"""
+        count = min(len(samples), len(self.data) - self.length)
+        self.data[self.length:self.length + count] = samples[:count]
+        self.length += count
+        return count == len(samples)
+
+    def keep_last(self, count):
+        """Drop everything except the most recent count samples"""
+        if self.length > count:
+            self.data[:count] = self.data[self.length - count:self.length]
+            self.length = count
+
+    @property
+    def duration(self):
+        return self.length / float(self.rate)
+
+    def samples(self):
+        """Return a view of the recorded samples (valid until the next reset)"""
+        return self.data[:self.length]
+
+
+def encode_wav(samples, rate, name="speech.wav"):
+    """Encode int16 mono samples as a WAV file in memory, ready for upload"""
+    wav_file = io.BytesIO()
+    with wave.open(wav_file, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        # wave accepts any buffer, so the samples are written without an intermediate bytes copy
+        wf.writeframes(memoryview(np.ascontiguousarray(samples)))
+    wav_file.seek(0)
+    # The OpenAI client uses the name to tell Whisper the file format
+    wav_file.name = name
+    return wav_file
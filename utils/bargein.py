@@ -0,0 +1,92 @@
+"""Barge-in detection: noticing the caller talking over the assistant.
+
+While a reply plays, the microphone also picks up the assistant's own voice
+from the speakers, so the normal detector would hear "speech" all the time.
+BargeInDetector instead predicts how loud that echo should be from what was
+just played (PlaybackMeter) and an estimate of the speaker-to-microphone
+coupling, and only counts frames that are well above both the predicted
+echo and the noise floor. A longer onset than the normal detector's keeps
+short echo peaks from interrupting the assistant.
+
+This is level-based echo handling, not echo cancellation: with loud speakers
+and a sensitive microphone, use a headset or raise ECHO_MARGIN_DB.
+"""
+import time
+import threading
+from collections import deque
+import numpy as np
+from vad import FRAME_MS, frame_features
+
+ECHO_TAIL = 0.3  # Seconds of playback considered when predicting echo (output latency plus room reverb)
+ECHO_MARGIN_DB = 10.0  # How far above the predicted echo the microphone must be
+BARGE_IN_MARGIN_DB = 12.0  # How far above the noise floor the microphone must be
+BARGE_IN_ONSET_MS = 200  # Consecutive loud frames needed to interrupt
+INITIAL_COUPLING_DB = -6.0  # Microphone level relative to playback level, before it has been measured
+COUPLING_FALL = 0.1  # Adaptation weight when the measured coupling is lower than the estimate
+COUPLING_RISE = 0.01  # ...and when it is higher, so the caller's own voice barely moves it
+SILENT_DB = -100.0
+
+
+class PlaybackMeter:
+    """Levels of recently played audio, written by the playback thread"""
+
+    def __init__(self):
+        self.levels = deque(maxlen=256)  # (time played, level in dB)
+        self.lock = threading.Lock()
+
+    def add(self, pcm):
+        """Record the level of a chunk of 16-bit PCM that is about to be played"""
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        level = 10.0 * np.log10(float(np.mean(samples * samples)) + 1e-10) if len(samples) else SILENT_DB
+        with self.lock:
+            self.levels.append((time.perf_counter(), level))
+
+    def level_db(self, window=ECHO_TAIL):
+        """Loudest level played within the last window seconds"""
+        cutoff = time.perf_counter() - window
+        with self.lock:
+            recent = [level for played, level in self.levels if played >= cutoff]
+        return max(recent) if recent else SILENT_DB
+
+
+class BargeInDetector:
+    """Echo-aware detector for speech over the assistant's playback"""
+
+    def __init__(self, rate, noise_floor_db, meter, frame_ms=FRAME_MS, onset_ms=BARGE_IN_ONSET_MS):
+        self.rate = rate
+        self.frame_length = int(rate * frame_ms / 1000)
+        self.noise_floor_db = noise_floor_db
+        self.meter = meter
+        self.onset_frames = max(1, int(round(onset_ms / frame_ms)))
+        self.coupling_db = INITIAL_COUPLING_DB
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._consumed = 0  # Samples fed so far, including pending ones
+        self._run = 0
+
+    def process(self, samples):
+        """Feed microphone samples; returns the sample offset where barge-in speech began, or None"""
+        samples = np.concatenate((self._pending, np.asarray(samples, dtype=np.int16)))
+        start = self._consumed - len(self._pending)
+        count = len(samples) // self.frame_length
+        self._pending = samples[count * self.frame_length:]
+        self._consumed = start + len(samples)
+        if count == 0:
+            return None
+
+        energy_db, _ = frame_features(samples[:count * self.frame_length].reshape(count, self.frame_length))
+        echo_db = self.meter.level_db()
+        threshold = max(self.noise_floor_db + BARGE_IN_MARGIN_DB, echo_db + self.coupling_db + ECHO_MARGIN_DB)
+
+        for index, level in enumerate(energy_db):
+            if level > threshold:
+                self._run += 1
+                if self._run >= self.onset_frames:
+                    return start + (index + 1 - self._run) * self.frame_length
+                continue
+            self._run = 0
+            if echo_db > SILENT_DB and level > self.noise_floor_db + 6.0:
+                # Only frames that clearly contain echo say anything about the coupling
+                measured = level - echo_db
+                weight = COUPLING_FALL if measured < self.coupling_db else COUPLING_RISE
+                self.coupling_db += weight * (measured - self.coupling_db)
+        return None
@@ -0,0 +1,180 @@
+"""Batch transcription and post-call analytics for recorded intake calls.
+
+Each WAV file is split into utterances with the same voice activity detector
+and endpointing as a live call, transcribed with the session's
+transcribe_audio, and replayed through process_with_llm and
+update_task_progress, so the fields and task checklist match what the
+assistant would have collected live. Calls run concurrently on a worker pool;
+every request goes through OpenAIPool's per-endpoint rate limiter and is
+retried on transient errors (see api.py). Requests are not hedged: a batch
+run cares about throughput and quota, not tail latency.
+
+One JSON line per call is appended to the output file. Calls already in it
+are skipped, so an interrupted overnight run picks up where it stopped.
+
+    python batch.py recordings/ --output results.jsonl [--language Spanish] [--workers 8] [--stt local]
+"""
+import os
+import sys
+import json
+import glob
+import time
+import asyncio
+import argparse
+import numpy as np
+from vad import read_wav, detect_segments
+from api import OpenAIPool
+from providers import create_transcriber, PROVIDERS, STT_PROVIDER
+from session import VoiceSession, LANGUAGES, SILENCE_DURATION, TRIM_MARGIN
+from tasks import TASKS
+
+WORKERS = 8  # Calls processed at once
+REQUESTS_PER_MINUTE = {
+    "transcription": 300,
+    "chat": 500
+}
+
+
+def split_utterances(samples, rate):
+    """Cut a recording into utterances the way the live endpointer would"""
+    utterances = []
+    for start, end in detect_segments(samples, rate):
+        # Pauses shorter than the endpointing silence don't end an utterance
+        if utterances and start - utterances[-1][1] < SILENCE_DURATION:
+            utterances[-1][1] = end
+        else:
+            utterances.append([start, end])
+    return [samples[max(0, int((start - TRIM_MARGIN) * rate)):int((end + TRIM_MARGIN) * rate)]
+            for start, end in utterances]
+
+
+def prepare_call(path, stt):
+    """Read, segment and prepare one recording for the STT provider (blocking; runs in a worker thread)"""
+    samples, rate = read_wav(path)
+    return len(samples) / float(rate), [stt.prepare(utterance, rate) for utterance in split_utterances(samples, rate)]
+
+
+class BatchProcessor:
+    """Run recorded calls through transcription, extraction and task tracking"""
+
+    def __init__(self, api, language="English", workers=WORKERS, stt=None):
+        self.api = api
+        self.stt = stt or create_transcriber("openai", api)
+        self.language = language
+        self.workers = asyncio.Semaphore(workers)
+
+    async def process_call(self, path):
+        async with self.workers:
+            started = time.perf_counter()
+            record = {"file": path, "language": self.language}
+            loop = asyncio.get_running_loop()
+            try:
+                duration, uploads = await loop.run_in_executor(None, prepare_call, path, self.stt)
+                record.update(duration=round(duration, 2), utterances=len(uploads))
+                session = VoiceSession(self.api, None, loop, language=self.language, stt=self.stt,
+                                       session_id=os.path.splitext(os.path.basename(path))[0])
+
+                transcripts = await asyncio.gather(*(session.transcribe_audio(upload, report=False)
+                                                     for upload in uploads))
+
+                # The LLM sees the call turn by turn, in order, as it would have live
+                for text in transcripts:
+                    if text.strip():
+                        await session.process_with_llm(text)
+                session.update_task_progress()
+
+                record.update(
+                    transcript=[text for text in transcripts if text.strip()],
+                    fields=dict(session.context.fields),
+                    tasks_completed=list(session.completed_tasks),
+                    completed_count=sum(session.completed_tasks)
+                )
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+            record["seconds"] = round(time.perf_counter() - started, 2)
+            return record
+
+
+def find_recordings(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "**", "*.wav"), recursive=True))
+        else:
+            files.append(path)
+    return sorted(set(files))
+
+
+def already_done(output):
+    """Files with a successful result in an earlier run"""
+    done = set()
+    if os.path.exists(output):
+        with open(output, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short when the previous run was killed
+                if "error" not in record:
+                    done.add(record["file"])
+    return done
+
+
+def summarize(records):
+    ok = [r for r in records if "error" not in r]
+    print(f"\n{len(records)} call(s), {len(records) - len(ok)} failed")
+    if ok:
+        for index, task in enumerate(TASKS):
+            share = np.mean([r["tasks_completed"][index] for r in ok])
+            print(f"  {task:<45} {share:6.1%}")
+        print(f"  {'All tasks':<45} {np.mean([r['completed_count'] == len(TASKS) for r in ok]):6.1%}")
+
+
+async def run(args):
+    files = find_recordings(args.paths)
+    done = already_done(args.output)
+    todo = [path for path in files if path not in done]
+    print(f"{len(files)} recording(s), {len(files) - len(todo)} already processed, {len(todo)} to go")
+
+    api = OpenAIPool(concurrency={"transcription": args.workers * 2, "chat": args.workers},
+                     requests_per_minute={"transcription": args.stt_rpm, "chat": args.chat_rpm}, hedge=False)
+    stt = create_transcriber(args.stt, api)
+    processor = BatchProcessor(api, args.language, args.workers, stt)
+    records = []
+    started = time.perf_counter()
+    try:
+        with open(args.output, "a", encoding="utf-8") as out:
+            for future in asyncio.as_completed([processor.process_call(path) for path in todo]):
+                record = await future
+                records.append(record)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                status = record.get("error") or f"{record['completed_count']}/{len(TASKS)} tasks"
+                print(f"[{len(records)}/{len(todo)}] {record['file']}: {status}")
+    finally:
+        stt.close()
+        await api.aclose()
+    print(f"Processed in {time.perf_counter() - started:.1f}s")
+    summarize(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe and analyse recorded intake calls")
+    parser.add_argument("paths", nargs="+", help="WAV files or directories of them")
+    parser.add_argument("--output", default="results.jsonl", help="JSON lines file to append results to")
+    parser.add_argument("--language", default="English", choices=list(LANGUAGES.keys()))
+    parser.add_argument("--workers", type=int, default=WORKERS, help="calls processed at once")
+    parser.add_argument("--stt", default=STT_PROVIDER, choices=PROVIDERS,
+                        help="speech-to-text provider; local keeps the recordings on this machine")
+    parser.add_argument("--stt-rpm", type=int, default=REQUESTS_PER_MINUTE["transcription"],
+                        help="transcription requests per minute")
+    parser.add_argument("--chat-rpm", type=int, default=REQUESTS_PER_MINUTE["chat"], help="chat requests per minute")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again with the same --output to continue")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+"""Offline benchmark for the voice pipeline.
+
+Runs N synthetic callers through the real session code (capture, VAD,
+encoding, streaming LLM, TTS, playback) without a microphone, speakers or
+the OpenAI API:
+
+  - FakeOpenAIServer answers chat (streamed and not), transcription and
+    speech requests on localhost after a configurable latency and jitter.
+    Speech is streamed in chunks, faster than real time.
+  - ReplayAudio stands in for pyaudio.PyAudio. Each caller's input stream
+    delivers background noise, and one utterance from the WAV fixtures each
+    time the assistant finishes a turn; output streams consume audio at the
+    rate it would play.
+
+--speed compresses caller audio and playback (not network latency), so a
+benchmark of many turns doesn't take real time. Capture and endpoint stages
+are reported in audio seconds either way.
+
+    python benchmark.py --callers 8 --turns 5 [--speed 4] [fixtures/*.wav]
+    python benchmark.py --latency chat=0.6,speech=0.3 --jitter 0.1
+    python benchmark.py --speculative
+    python benchmark.py --no-response-cache  # every turn goes to the fake model
+    python benchmark.py --stt local          # on-box transcription (see providers.py)
+    python benchmark.py --serve --port 8700
+
+With --serve only the fake API runs, e.g. for trying voice.py offline with
+OPENAI_BASE_URL=http://127.0.0.1:8700/v1.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import Counter
+import numpy as np
+from context import FIELDS
+from vad import read_wav
+from upload import resample
+from api import OpenAIPool
+from providers import create_transcriber, create_speaker, PROVIDERS
+from session import SessionManager, RATE, TTS_RATE
+
+# Fake server: seconds before the first byte of each response
+LATENCY = {
+    "chat": 0.35,
+    "transcription": 0.25,
+    "speech": 0.2
+}
+JITTER = 0.05  # Standard deviation added to every latency
+TOKEN_INTERVAL = 0.015  # Seconds between streamed chunks
+TOKEN_CHARS = 4  # Characters of content per streamed chunk
+SPEECH_SECONDS_PER_CHAR = 0.06  # Length of the audio returned for speech requests
+SPEECH_CHUNK_SECONDS = 0.25  # Audio per streamed speech chunk
+SPEECH_REALTIME_FACTOR = 5.0  # The fake TTS produces audio this many times faster than it plays
+
+# Synthetic callers
+NOISE_LEVEL = 100  # Background noise standard deviation (about -50 dBFS)
+UTTERANCE_SECONDS = 1.5  # Length of the generated utterance when no fixtures are given
+
+TRANSCRIPTS = [
+    "I'm calling to schedule an MRI of my left knee.",
+    "My name is Jordan Lee and my phone number is 555 0134.",
+    "I was born on March 3rd 1980 and I live at 12 Elm Street.",
+    "My insurance is Blue Cross and the policy number is BC 4471.",
+    "I'm free on Tuesday or Thursday afternoons.",
+    "Could you repeat that?",
+    "Yes."
+]
+REPLIES = [
+    "Thank you for calling. Could you please confirm the best phone number to reach you?",
+    "Got it, thank you. What is your full name and date of birth?",
+    "Thanks. Which insurance provider do you have, and what is the policy number?",
+    "I have noted that. When are you available for a pre-op consultation?"
+]
+GREETING = "Hello, I'm the clinic's AI assistant. I'll help you get ready for your radiology appointment."
+SUMMARY = "The caller wants to schedule an MRI and has started giving intake details."
+
+
+class FakeOpenAIServer:
+    """Minimal HTTP server for the OpenAI endpoints the assistant uses"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, jitter=JITTER,
+                 token_interval=TOKEN_INTERVAL, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = dict(LATENCY, **(latency or {}))
+        self.jitter = jitter
+        self.token_interval = token_interval
+        self.random = random.Random(seed)
+        self.requests = Counter()
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self):
+        """Serve on a background thread with its own event loop"""
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=serve, name="fake-openai", daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self.base_url
+
+    def stop(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(timeout=5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+
+    async def shutdown(self):
+        """Stop accepting connections and end the ones still open"""
+        self.server.close()
+        handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in handlers:
+            task.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    def delay(self, endpoint):
+        return max(0.0, self.random.gauss(self.latency[endpoint], self.jitter))
+
+    async def handle(self, reader, writer):
+        """Serve requests on one keep-alive connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await read_body(reader, headers)
+                await self.route(method, path.split("?")[0], headers, body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            pass  # shutdown() closing an idle keep-alive connection; ending normally keeps asyncio quiet
+        finally:
+            writer.close()
+
+    async def route(self, method, path, headers, body, writer):
+        if path.endswith("/chat/completions"):
+            self.requests["chat"] += 1
+            await self.chat(json.loads(body), writer)
+        elif path.endswith("/audio/transcriptions"):
+            self.requests["transcription"] += 1
+            await asyncio.sleep(self.delay("transcription"))
+            text = self.random.choice(TRANSCRIPTS)
+            await respond(writer, 200, json.dumps({"text": text}).encode("utf-8"))
+        elif path.endswith("/audio/speech"):
+            self.requests["speech"] += 1
+            request = json.loads(body)
+            await asyncio.sleep(self.delay("speech"))
+            frames = int(len(request.get("input", "")) * SPEECH_SECONDS_PER_CHAR * TTS_RATE)
+            await self.speech(frames, writer)
+        else:
+            await respond(writer, 404, json.dumps({"error": {"message": f"Unknown path {path}"}}).encode("utf-8"))
+
+    async def speech(self, frames, writer):
+        """Stream silence in chunks, generated faster than real time like the speech endpoint's"""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+        # An odd size, so chunks end mid-sample as real network reads can
+        step = 2 * int(SPEECH_CHUNK_SECONDS * TTS_RATE) + 1
+        for start in range(0, 2 * frames, step):
+            await send_chunk(writer, bytes(min(step, 2 * frames - start)))
+            await asyncio.sleep(SPEECH_CHUNK_SECONDS / SPEECH_REALTIME_FACTOR)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def chat(self, request, writer):
+        """Answer like the model would for each kind of chat request the assistant makes"""
+        response_type = (request.get("response_format") or {}).get("type")
+        if response_type == "json_schema":
+            content = json.dumps({"reply": self.random.choice(REPLIES), "fields": {name: None for name in FIELDS}})
+        elif response_type == "json_object":
+            content = json.dumps({"summary": SUMMARY, "fields": {}})
+        else:
+            content = GREETING
+        base = {"id": f"chatcmpl-{self.random.getrandbits(48):x}", "created": int(time.time()),
+                "model": request.get("model", "gpt-4o")}
+
+        await asyncio.sleep(self.delay("chat"))
+        if not request.get("stream"):
+            body = dict(base, object="chat.completion", choices=[{
+                "index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                usage={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+            await respond(writer, 200, json.dumps(body).encode("utf-8"))
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+        for start in range(0, len(content), TOKEN_CHARS):
+            delta = {"content": content[start:start + TOKEN_CHARS]}
+            if start == 0:
+                delta["role"] = "assistant"
+            chunk = dict(base, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+            await send_chunk(writer, f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            await asyncio.sleep(self.token_interval)
+        final = dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        await send_chunk(writer, f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def read_body(reader, headers):
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"]))
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        parts = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                return b"".join(parts)
+            parts.append(await reader.readexactly(size))
+            await reader.readline()
+    return b""
+
+
+async def respond(writer, status, body, content_type="application/json"):
+    reason = {200: "OK", 404: "Not Found"}[status]
+    writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+
+async def send_chunk(writer, data):
+    writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+    await writer.drain()
+
+
+def synthetic_utterance(rate, seconds=UTTERANCE_SECONDS, seed=0):
+    """Voiced-sounding test signal: a harmonic tone with a syllable-rate envelope"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(rate * seconds)) / float(rate)
+    pitch = rng.uniform(110, 220)
+    tone = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4 * t)  # About four syllables a second
+    return np.clip(3000 * tone * envelope, -32768, 32767).astype(np.int16)
+
+
+def load_fixtures(paths, rate):
+    """Read WAV fixtures and resample them to the capture rate"""
+    fixtures = []
+    for path in paths:
+        samples, file_rate = read_wav(path)
+        fixtures.append(resample(samples, file_rate, rate))
+    return fixtures or [synthetic_utterance(rate, seed=seed) for seed in range(3)]
+
+
+class Caller:
+    """One synthetic caller: background noise, plus an utterance whenever it is their turn"""
+
+    def __init__(self, fixtures, seed):
+        self.fixtures = fixtures
+        self.random = np.random.default_rng(seed)
+        self.pending = np.zeros(0, dtype=np.int16)
+        self.lock = threading.Lock()
+        self.turns = 0
+
+    def say_next(self):
+        with self.lock:
+            utterance = self.fixtures[self.turns % len(self.fixtures)]
+            self.pending = np.concatenate((self.pending, utterance))
+            self.turns += 1
+
+    def next_chunk(self, count):
+        chunk = np.clip(self.random.normal(0, NOISE_LEVEL, count), -32768, 32767).astype(np.int16)
+        with self.lock:
+            speech, self.pending = self.pending[:count], self.pending[count:]
+        chunk[:len(speech)] = speech
+        return chunk
+
+
+class ReplayInputStream:
+    """Callback-mode input stream fed from a Caller in (scaled) real time"""
+
+    def __init__(self, caller, rate, frames_per_buffer, stream_callback, speed):
+        self.caller = caller
+        self.rate = rate
+        self.frames = frames_per_buffer
+        self.callback = stream_callback
+        self.speed = speed
+        self.running = False
+        self.thread = None
+
+    def start_stream(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="replay-input", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        interval = self.frames / float(self.rate) / self.speed
+        deadline = time.perf_counter()
+        while self.running:
+            self.callback(self.caller.next_chunk(self.frames).tobytes(), self.frames, None, 0)
+            deadline += interval
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+
+    def stop_stream(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def close(self):
+        self.stop_stream()
+
+
+class ReplayOutputStream:
+    """Callback-mode output stream that asks for audio at the (scaled) rate it would play"""
+
+    def __init__(self, rate, frames_per_buffer, stream_callback, speed):
+        self.rate = rate
+        self.frames = frames_per_buffer
+        self.callback = stream_callback
+        self.speed = speed
+        self.running = False
+        self.thread = None
+
+    def start_stream(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="replay-output", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        interval = self.frames / float(self.rate) / self.speed
+        deadline = time.perf_counter()
+        while self.running:
+            self.callback(None, self.frames, None, 0)
+            deadline += interval
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+
+    def get_output_latency(self):
+        return 0.0
+
+    def stop_stream(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def close(self):
+        self.stop_stream()
+
+
+class ReplayAudio:
+    """Stand-in for pyaudio.PyAudio; device index N belongs to callers[N]"""
+
+    def __init__(self, callers, speed=1.0):
+        self.callers = callers
+        self.speed = speed
+
+    def open(self, rate, input=False, output=False, input_device_index=None, output_device_index=None,
+             frames_per_buffer=1024, stream_callback=None, **kwargs):
+        if input:
+            caller = self.callers[input_device_index]
+            return ReplayInputStream(caller, rate, frames_per_buffer, stream_callback, self.speed)
+        return ReplayOutputStream(rate, frames_per_buffer, stream_callback, self.speed)
+
+    # Enumeration for the DeviceRegistry: one duplex device per caller, every rate supported
+
+    def get_host_api_info_by_index(self, host_api):
+        return {"deviceCount": len(self.callers), "defaultInputDevice": 0, "defaultOutputDevice": 0}
+
+    def get_device_info_by_host_api_device_index(self, host_api, index):
+        return {"index": index, "name": f"caller {index}", "maxInputChannels": 1, "maxOutputChannels": 1,
+                "defaultSampleRate": float(RATE)}
+
+    def is_format_supported(self, rate, **kwargs):
+        return True
+
+    def terminate(self):
+        pass
+
+
+def run_benchmark(callers=4, turns=5, fixtures=(), speed=1.0, latency=None, jitter=JITTER,
+                  trace_path=None, seed=0, speculative=False, stt="openai", tts="openai", response_cache=True):
+    """Run the callers to completion and return (manager, server, wall seconds, turns completed)"""
+    server = FakeOpenAIServer(latency=latency, jitter=jitter, seed=seed)
+    base_url = server.start()
+    samples = load_fixtures(fixtures, RATE)
+    people = [Caller(samples, seed + i) for i in range(callers)]
+    audio = ReplayAudio(people, speed)
+    counts = Counter()
+    errors = []
+
+    def on_event(session, event, data):
+        if event != "trace":
+            return
+        trace = data["trace"]
+        if trace["error"]:
+            errors.append(trace["error"])
+        if trace["source"] == "voice":
+            counts[session.session_id] += 1
+        if counts[session.session_id] < turns:
+            # The reply has finished playing: the caller answers
+            people[session.input_device_index].say_next()
+        else:
+            session.stop()
+
+    cache_dir = tempfile.mkdtemp(prefix="voice-benchmark-")  # Cold caches: every greeting and reply hits the server
+    api = OpenAIPool(api_key="benchmark", base_url=base_url)
+    manager = SessionManager(api, audio=audio, cache_dir=cache_dir, trace_path=trace_path,
+                             store_path=os.path.join(cache_dir, "conversations.db"),
+                             stt=create_transcriber(stt, api), tts=create_speaker(tts, api),
+                             response_cache=response_cache)
+    manager.stt.wait_ready()  # Loading a local model isn't part of any turn
+    manager.tts.wait_ready()
+    started = time.perf_counter()
+    for index in range(callers):
+        session = manager.create_session(input_device_index=index, output_device_index=index, on_event=on_event)
+        session.speculative = speculative
+        manager.start_session(session)
+    manager.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        print(f"{len(errors)} turn(s) failed, e.g. {errors[0]}")
+    return manager, server, elapsed, sum(counts.values())
+
+
+def parse_latency(text):
+    """Parse "chat=0.4,speech=0.2" into a dict of seconds"""
+    latency = {}
+    for item in filter(None, (text or "").split(",")):
+        endpoint, value = item.split("=")
+        if endpoint not in LATENCY:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {endpoint!r}; use {', '.join(LATENCY)}")
+        latency[endpoint] = float(value)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the voice pipeline against a local fake OpenAI API")
+    parser.add_argument("fixtures", nargs="*", help="WAV files spoken by the callers (default: synthetic speech)")
+    parser.add_argument("--callers", type=int, default=4, help="concurrent synthetic callers")
+    parser.add_argument("--turns", type=int, default=5, help="turns per caller")
+    parser.add_argument("--speed", type=float, default=1.0, help="audio time compression factor")
+    parser.add_argument("--latency", type=parse_latency, default=None,
+                        help="per-endpoint latency in seconds, e.g. chat=0.4,transcription=0.3")
+    parser.add_argument("--jitter", type=float, default=JITTER, help="latency standard deviation in seconds")
+    parser.add_argument("--trace", default=None, help="append per-turn timings to this JSON lines file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--speculative", action="store_true", help="start replies during pauses (see speculation.py)")
+    parser.add_argument("--stt", default="openai", choices=PROVIDERS, help="speech-to-text provider")
+    parser.add_argument("--tts", default="openai", choices=PROVIDERS, help="text-to-speech provider")
+    parser.add_argument("--no-response-cache", action="store_true",
+                        help="send every turn to the fake model (see responses.py)")
+    parser.add_argument("--serve", action="store_true", help="only run the fake API server")
+    parser.add_argument("--port", type=int, default=8700, help="port for --serve")
+    args = parser.parse_args()
+
+    if args.serve:
+        server = FakeOpenAIServer(port=args.port, latency=args.latency, jitter=args.jitter, seed=args.seed)
+        print(f"Fake OpenAI API listening on {server.start()}")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            server.stop()
+        return
+
+    manager, server, elapsed, completed = run_benchmark(
+        args.callers, args.turns, args.fixtures, args.speed, args.latency, args.jitter, args.trace, args.seed,
+        args.speculative, args.stt, args.tts, not args.no_response_cache)
+    try:
+        print(f"\n{args.callers} caller(s), {completed} turn(s) in {elapsed:.1f}s "
+              f"({completed / elapsed:.2f} turns/s), requests: {dict(server.requests)}")
+        if args.speculative:
+            stats = sum((session.speculation_stats for session in manager.sessions.values()), Counter())
+            print(f"Speculation: {dict(stats)}")
+        print(f"Hedged requests: {manager.api.hedges} ({manager.api.hedge_wins} answered first)")
+        if manager.responses:
+            print(f"Response cache: {manager.responses.stats()}")
+        print()
+        print(manager.latency.format_summary())
+        print()
+        print(manager.latency.format_histogram("first_audio"))
+    finally:
+        # Executor workers are joined at interpreter exit; without closing, a blocked one hangs the process
+        manager.close()
+        server.stop()
+
+if __name__ == "__main__":
+    main()
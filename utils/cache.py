@@ -0,0 +1,203 @@
+"""Persistent caches for the voice assistant.
+
+SpeechCache stores synthesized audio on disk, content-addressed by the
+(text, voice, model, format) that produced it, so the same sentence is only
+ever paid for once. Entries are evicted least-recently-used once the cache
+grows past its size limit, and the most recently used entries are also kept
+in memory so greetings play without touching the disk. lookup() only touches
+memory, so it is safe on the event loop; read() does the disk I/O and belongs
+in a worker thread. inflight lets concurrent misses of the same phrase share
+one synthesis (see session.py).
+
+PhraseBook stores fixed phrases such as the per-language greeting, so the
+greeting text doesn't need an LLM call on every pickup.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "VOICE_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "healthcare-voice-assistant")
+)
+MAX_DISK_BYTES = 500 * 1024 * 1024  # Roughly 3 hours of 24 kHz PCM
+MAX_MEMORY_BYTES = 32 * 1024 * 1024
+AUDIO_SUFFIX = ".audio"
+
+
+def atomic_write(path, data):
+    """Write a file so readers never see a partial one"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SpeechCache:
+    """Size-bounded LRU cache of synthesized speech, on disk with a hot in-memory layer"""
+
+    def __init__(self, directory=None, max_bytes=MAX_DISK_BYTES, memory_bytes=MAX_MEMORY_BYTES):
+        self.directory = os.path.join(directory or DEFAULT_CACHE_DIR, "speech")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # digest -> size on disk, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        # digest -> audio bytes, least recently used first
+        self.memory = OrderedDict()
+        self.memory_total = 0
+        # digest -> asyncio future of the audio being synthesized right now; only used on the event loop
+        self.inflight = {}
+        self._load_index()
+
+    @staticmethod
+    def key(text, voice, model, audio_format):
+        """Content address for one synthesized phrase"""
+        payload = json.dumps([model, voice, audio_format, text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + AUDIO_SUFFIX)
+
+    def _load_index(self):
+        """Rebuild the LRU order from file modification times"""
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(AUDIO_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            found.append((stat.st_mtime, name[:-len(AUDIO_SUFFIX)], stat.st_size))
+        for _, digest, size in sorted(found):
+            self.entries[digest] = size
+            self.total_bytes += size
+        self._delete(self._evict())
+
+    def get(self, text, voice, model, audio_format):
+        """Return cached audio bytes, or None (may read the disk)"""
+        audio, digest = self.lookup(text, voice, model, audio_format)
+        return self.read(digest) if digest is not None else audio
+
+    def lookup(self, text, voice, model, audio_format):
+        """Check the index and the in-memory layer without blocking; returns (audio, digest).
+
+        digest is None unless the entry is only on disk, in which case read(digest) fetches it.
+        """
+        digest = self.key(text, voice, model, audio_format)
+        with self.lock:
+            if digest not in self.entries:
+                self.misses += 1
+                return None, None
+            self.entries.move_to_end(digest)
+            audio = self.memory.get(digest)
+            if audio is not None:
+                self.memory.move_to_end(digest)
+                self.hits += 1
+                return audio, None
+        return None, digest
+
+    def read(self, digest):
+        """Load an entry found by lookup() from disk (blocking); None if the file has gone"""
+        try:
+            with open(self._path(digest), "rb") as f:
+                audio = f.read()
+            # Persist recency so the LRU order survives a restart
+            os.utime(self._path(digest))
+        except OSError:
+            with self.lock:
+                self.total_bytes -= self.entries.pop(digest, 0)
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+            self._remember(digest, audio)
+        return audio
+
+    def put(self, text, voice, model, audio_format, audio):
+        """Store synthesized audio (blocking disk write; run it off the event loop)"""
+        digest = self.key(text, voice, model, audio_format)
+        atomic_write(self._path(digest), audio)
+        with self.lock:
+            self.total_bytes += len(audio) - self.entries.pop(digest, 0)
+            self.entries[digest] = len(audio)
+            self._remember(digest, audio)
+            evicted = self._evict()
+        # Outside the lock, so lookups on the event loop never wait for the disk
+        self._delete(evicted)
+
+    def _remember(self, digest, audio):
+        """Keep audio in the in-memory layer (call with the lock held)"""
+        if len(audio) > self.memory_bytes:
+            return
+        self.memory_total += len(audio) - len(self.memory.pop(digest, b""))
+        self.memory[digest] = audio
+        while self.memory_total > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_total -= len(evicted)
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits; returns their digests (call with the lock held)"""
+        evicted = []
+        while self.total_bytes > self.max_bytes and self.entries:
+            digest, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            audio = self.memory.pop(digest, None)
+            if audio is not None:
+                self.memory_total -= len(audio)
+            evicted.append(digest)
+        return evicted
+
+    def _delete(self, digests):
+        for digest in digests:
+            try:
+                os.unlink(self._path(digest))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.total_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+class PhraseBook:
+    """Fixed phrases per language (e.g. the greeting), persisted as JSON"""
+
+    def __init__(self, name, directory=None):
+        directory = directory or DEFAULT_CACHE_DIR
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.json")
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.phrases = json.load(f)
+        except (OSError, ValueError):
+            self.phrases = {}
+
+    def get(self, language):
+        with self.lock:
+            return self.phrases.get(language)
+
+    def put(self, language, text):
+        # Write under the lock so concurrent puts can't save an older snapshot last
+        with self.lock:
+            self.phrases[language] = text
+            atomic_write(self.path, json.dumps(self.phrases, ensure_ascii=False, indent=2).encode("utf-8"))
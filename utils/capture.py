@@ -0,0 +1,89 @@
+"""Persistent microphone capture for a voice session.
+
+AudioCapture keeps one callback-mode PyAudio input stream open for the whole
+session. PortAudio's callback thread only copies each chunk into an
+AudioRingBuffer and wakes the event loop; it never waits on the consumer.
+The session reads from any position in the ring, so the audio just before
+speech onset is still available as pre-roll, and a slow consumer loses
+nothing as long as it catches up within RING_SECONDS.
+"""
+import asyncio
+import pyaudio
+import numpy as np
+from audio_buffer import AudioRingBuffer
+
+RING_SECONDS = 30  # Audio kept in the ring buffer
+DATA_TIMEOUT = 2.0  # Seconds without any callback before the device is considered gone
+
+
+class AudioCapture:
+    """Callback-mode input stream that writes into a ring buffer"""
+
+    def __init__(self, audio, device_index, rate, chunk, loop, seconds=RING_SECONDS):
+        self.audio = audio
+        self.device_index = device_index
+        self.rate = rate
+        self.chunk = chunk
+        self.loop = loop
+        self.ring = AudioRingBuffer(int(rate * seconds))
+        self.stream = None
+        self.overflows = 0
+        self._data_ready = asyncio.Event()
+
+    def open(self):
+        """Open and start the input stream (blocking)"""
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.rate,
+            input=True,
+            input_device_index=self.device_index,
+            frames_per_buffer=self.chunk,
+            stream_callback=self._callback
+        )
+        self.stream.start_stream()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """Runs on PortAudio's thread: copy the chunk and wake the consumer"""
+        self.ring.write(np.frombuffer(in_data, dtype=np.int16))
+        if status & pyaudio.paInputOverflow:
+            self.overflows += 1
+        try:
+            self.loop.call_soon_threadsafe(self._data_ready.set)
+        except RuntimeError:
+            pass  # The loop has closed; the stream is about to be closed too
+        return (None, pyaudio.paContinue)
+
+    @property
+    def position(self):
+        """Absolute sample position of the newest captured audio"""
+        return self.ring.write_pos
+
+    async def wait(self, position, timeout=DATA_TIMEOUT):
+        """Wait until audio past position has been captured"""
+        while self.ring.write_pos <= position:
+            self._data_ready.clear()
+            if self.ring.write_pos > position:
+                break
+            try:
+                # Not wait_for(): on 3.11 it drops a cancellation that arrives as the event is set,
+                # and a barge-in watcher that ignores cancel() hangs the turn
+                async with asyncio.timeout(timeout):
+                    await self._data_ready.wait()
+            except TimeoutError:
+                raise IOError(f"No audio from input device {self.device_index}")
+
+    async def read(self, position):
+        """Wait for new audio and return (samples, new_position)"""
+        await self.wait(position)
+        return self.ring.read(position)
+
+    def close(self):
+        """Stop and close the input stream (blocking)"""
+        if self.stream is not None:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception:
+                pass
+            self.stream = None
@@ -0,0 +1,161 @@
+"""Bounded conversation context for the intake LLM.
+
+Instead of resending the whole call every turn, the prompt is built from:
+
+    [stable system prompt]            same for every turn of a call, so it is
+                                      served from the provider's prompt cache
+    [running summary]                 older turns folded into a few sentences
+    [recent turns, verbatim]          kept under CONTEXT_TOKEN_BUDGET
+    [call state]                      current task and the collected fields
+
+Folding happens in the background after a turn, using a small model in JSON
+mode that returns both the updated summary and any intake fields it found.
+Until a fold finishes, the turns being folded are still sent verbatim. The
+fields are handed to the owner's on_fields callback (the session saves and
+reports them), or merged here if there is none.
+"""
+import json
+import asyncio
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o tokenizer
+except Exception:
+    _encoding = None
+
+CONTEXT_TOKEN_BUDGET = 1500  # Tokens of verbatim turns before older ones are folded into the summary
+FOLD_TARGET = 0.5  # After folding, verbatim turns use at most this share of the budget
+MIN_RECENT_MESSAGES = 4  # Always keep at least the last two exchanges verbatim
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators per message
+SUMMARY_MODEL = "gpt-4o-mini"
+
+# Intake fields tracked across the call, with the description given to the model
+FIELDS = {
+    "reason_for_call": "why the patient is calling",
+    "phone": "phone number, as confirmed by the patient",
+    "name": "patient's full name",
+    "date_of_birth": "date of birth",
+    "address": "home address",
+    "insurance_provider": "insurance company",
+    "policy_number": "insurance policy or member number",
+    "eligibility": "whether insurance eligibility was verified",
+    "imaging": "imaging requested (MRI, CT, X-ray, ...) and body part",
+    "availability": "when the patient is available for the pre-op consult"
+}
+
+
+def count_tokens(text):
+    """Count tokens with tiktoken when installed, else estimate from UTF-8 length"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # About 4 bytes per token for English; CJK and Devanagari are 3 bytes per character
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def message_tokens(message):
+    return count_tokens(message["content"] or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationContext:
+    """Recent turns verbatim, older turns as a running summary, plus collected fields"""
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, min_recent=MIN_RECENT_MESSAGES):
+        self.token_budget = token_budget
+        self.min_recent = min_recent
+        self.messages = []  # Verbatim turns, oldest first
+        self.folding = []  # Turns handed to the summarizer but not yet folded in
+        self.summary = ""
+        self.fields = {}
+        self.compaction = None
+
+    def add(self, role, content):
+        self.messages.append({"role": role, "content": content})
+
+    def update_fields(self, fields):
+        """Merge newly collected fields; empty values never overwrite known ones"""
+        for name, value in fields.items():
+            if name in FIELDS and value not in (None, "", "unknown"):
+                self.fields[name] = value
+
+    @property
+    def verbatim_tokens(self):
+        return sum(message_tokens(m) for m in self.messages)
+
+    def build_messages(self, system_message, state_message=None, pending=None):
+        """Assemble the prompt for the next LLM call; pending turns are included without being recorded"""
+        messages = [system_message]
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the call so far:\n{self.summary}"})
+        messages.extend(self.folding)
+        messages.extend(self.messages)
+        messages.extend(pending or [])
+        if state_message:
+            messages.append(state_message)
+        return messages
+
+    def fields_text(self):
+        """Collected fields as a short block for the prompt"""
+        if not self.fields:
+            return "Nothing collected yet."
+        return "\n".join(f"- {name}: {value}" for name, value in self.fields.items())
+
+    def schedule_compaction(self, api, on_fields=None):
+        """Start folding older turns in the background if the budget is exceeded; see compact()"""
+        if self.compaction is not None and not self.compaction.done():
+            return
+        if self.verbatim_tokens <= self.token_budget:
+            return
+        self.compaction = asyncio.ensure_future(self.compact(api, on_fields))
+
+    def cancel(self):
+        if self.compaction is not None:
+            self.compaction.cancel()
+
+    async def compact(self, api, on_fields=None):
+        """Fold the oldest turns into the summary; on_fields(fields) receives the fields found in them"""
+        target = self.token_budget * FOLD_TARGET
+        tokens = self.verbatim_tokens
+        count = 0
+        while len(self.messages) - count > self.min_recent and tokens > target:
+            tokens -= message_tokens(self.messages[count])
+            count += 1
+        if count == 0:
+            return
+        self.folding, self.messages = self.messages[:count], self.messages[count:]
+
+        try:
+            summary, fields = await self.summarize(api, self.folding)
+        except BaseException as e:
+            # Put the turns back so nothing is lost; the next turn will try again
+            self.messages = self.folding + self.messages
+            self.folding = []
+            if not isinstance(e, Exception):
+                raise
+            print(f"Context compaction failed: {e}")
+            return
+
+        self.summary = summary
+        self.folding = []
+        (on_fields or self.update_fields)(fields)
+
+    async def summarize(self, api, messages):
+        """Ask the summary model to merge turns into the running summary"""
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        field_list = "\n".join(f"- {name}: {description}" for name, description in FIELDS.items())
+        response = await api.chat(
+            model=SUMMARY_MODEL,
+            response_format={"type": "json_object"},
+            temperature=0,
+            messages=[
+                {"role": "system", "content": (
+                    "You maintain the running summary of a phone call between a radiology clinic's "
+                    "intake assistant and a patient. Return JSON with two keys: \"summary\", the "
+                    "existing summary updated with the new turns in at most 120 words, and "
+                    "\"fields\", an object with any of these fields stated in the new turns:\n"
+                    f"{field_list}\nOmit fields that were not stated."
+                )},
+                {"role": "user", "content": f"Existing summary:\n{self.summary or '(none)'}\n\nNew turns:\n{transcript}"}
+            ]
+        )
+        result = json.loads(response.choices[0].message.content)
+        return result.get("summary", self.summary), result.get("fields") or {}
@@ -0,0 +1,250 @@
+"""Audio device registry: enumeration, validation, hot-plug and per-session binding.
+
+DeviceRegistry enumerates the devices of one host API once and caches them.
+Before a session starts, bind() checks that its input and output devices
+exist, support the sample rate and channel count the pipeline uses, and are
+not already held by another running session. So a wrong or missing device
+index fails at start-up rather than mid-call. Each concurrent session gets
+its own headset.
+
+PortAudio only rescans devices when it is initialised, so a running process
+never sees a headset plugged in after start-up on its own. The watcher
+thread therefore enumerates in a short-lived child process every
+HOTPLUG_POLL seconds. When the devices or defaults change it marks the
+registry stale and tells its listeners. reinitialize() then restarts
+PortAudio in place, which closes every stream, so the SessionManager only
+calls it while no session is running.
+
+List devices and check them against the pipeline's formats:
+    python devices.py
+"""
+import time
+import threading
+import multiprocessing
+import concurrent.futures
+import pyaudio
+
+HOST_API = 0  # Host API whose devices are offered (MME on Windows, ALSA on Linux)
+HOTPLUG_POLL = 5.0  # Seconds between device scans
+SCAN_TIMEOUT = 20.0  # A scan taking longer than this is abandoned
+
+
+class DeviceError(Exception):
+    """A device is missing, busy or can't handle the pipeline's format"""
+
+
+def enumerate_devices(audio, host_api=HOST_API):
+    """Return (devices, default input index, default output index), querying each device once"""
+    info = audio.get_host_api_info_by_index(host_api)
+    devices = []
+    for i in range(info.get("deviceCount")):
+        device = audio.get_device_info_by_host_api_device_index(host_api, i)
+        devices.append({
+            "index": device["index"],
+            "name": device["name"],
+            "inputs": device["maxInputChannels"],
+            "outputs": device["maxOutputChannels"],
+            "rate": device["defaultSampleRate"]
+        })
+    default_input = info.get("defaultInputDevice", -1)
+    default_output = info.get("defaultOutputDevice", -1)
+    return devices, (default_input if default_input >= 0 else None), (default_output if default_output >= 0 else None)
+
+
+def scan_devices(host_api=HOST_API):
+    """Enumerate with a fresh PortAudio (runs in a child process, so it sees hot-plugged devices)"""
+    audio = pyaudio.PyAudio()
+    try:
+        return enumerate_devices(audio, host_api)
+    finally:
+        audio.terminate()
+
+
+def snapshot(scan):
+    """What a scan says about the hardware, independent of index order"""
+    devices, default_input, default_output = scan
+    names = {device["index"]: device["name"] for device in devices}
+    return (sorted((d["name"], d["inputs"], d["outputs"]) for d in devices),
+            names.get(default_input), names.get(default_output))
+
+
+def describe_changes(before, after):
+    """{"added": [names], "removed": [names], "default_input": name, "default_output": name} for what differs"""
+    old, new = [name for name, _, _ in before[0]], [name for name, _, _ in after[0]]
+    changes = {
+        "added": sorted(set(new) - set(old)),
+        "removed": sorted(set(old) - set(new))
+    }
+    if before[1] != after[1]:
+        changes["default_input"] = after[1]
+    if before[2] != after[2]:
+        changes["default_output"] = after[2]
+    return changes
+
+
+class DeviceRegistry:
+    """Cached device list, format validation, session bindings and hot-plug watching"""
+
+    def __init__(self, audio, host_api=HOST_API, poll_interval=HOTPLUG_POLL):
+        self.audio = audio
+        self.host_api = host_api
+        self.poll_interval = poll_interval
+        self.lock = threading.RLock()
+        self.bindings = {}  # session_id -> {"input": index, "output": index}
+        self.listeners = []
+        self.stale = False  # The hardware changed since PortAudio was initialised
+        self._stop = threading.Event()
+        self.thread = None
+        self.refresh()
+
+    def refresh(self):
+        """Re-read the device list from the live PortAudio instance"""
+        with self.lock:
+            self.devices, self.default_input, self.default_output = enumerate_devices(self.audio, self.host_api)
+            self.by_index = {device["index"]: device for device in self.devices}
+
+    def inputs(self):
+        with self.lock:
+            return [device for device in self.devices if device["inputs"] > 0]
+
+    def outputs(self):
+        with self.lock:
+            return [device for device in self.devices if device["outputs"] > 0]
+
+    def name(self, index):
+        with self.lock:
+            device = self.by_index.get(self.resolve(index, input=True) if index is None else index)
+        return device["name"] if device else f"device {index}"
+
+    def resolve(self, index, input):
+        """The device index to use, with None meaning the default device"""
+        if index is not None:
+            return index
+        default = self.default_input if input else self.default_output
+        if default is None:
+            raise DeviceError(f"There is no default {'input' if input else 'output'} device")
+        return default
+
+    def validate(self, index, rate, channels=1, input=True):
+        """Raise DeviceError unless the device can capture (or play) 16-bit audio at rate; returns its index"""
+        kind = "input" if input else "output"
+        with self.lock:
+            index = self.resolve(index, input)
+            device = self.by_index.get(index)
+        if device is None:
+            raise DeviceError(f"There is no audio device {index}")
+        if device["inputs" if input else "outputs"] < channels:
+            raise DeviceError(f"Device {index} ({device['name']}) is not an {kind} device")
+        try:
+            if input:
+                self.audio.is_format_supported(rate, input_device=index, input_channels=channels,
+                                               input_format=pyaudio.paInt16)
+            else:
+                self.audio.is_format_supported(rate, output_device=index, output_channels=channels,
+                                               output_format=pyaudio.paInt16)
+        except ValueError as e:
+            raise DeviceError(f"Device {index} ({device['name']}) can't {'record' if input else 'play'} "
+                              f"{rate} Hz 16-bit {kind} (its default rate is {device['rate']:.0f} Hz): {e}")
+        return index
+
+    def bind(self, session_id, input_index, output_index, input_rate, output_rate):
+        """Validate a session's devices and reserve them for it; raises DeviceError"""
+        with self.lock:
+            input_index = self.validate(input_index, input_rate, input=True)
+            output_index = self.validate(output_index, output_rate, input=False)
+            for other, binding in self.bindings.items():
+                if other == session_id:
+                    continue
+                if binding["input"] == input_index:
+                    raise DeviceError(f"Device {input_index} ({self.by_index[input_index]['name']}) "
+                                      f"is already the microphone of session {other}")
+                if binding["output"] == output_index:
+                    raise DeviceError(f"Device {output_index} ({self.by_index[output_index]['name']}) "
+                                      f"is already the speaker of session {other}")
+            self.bindings[session_id] = {"input": input_index, "output": output_index}
+
+    def release(self, session_id):
+        with self.lock:
+            self.bindings.pop(session_id, None)
+
+    def bound(self):
+        """{session_id: {"input": index, "output": index}}"""
+        with self.lock:
+            return {session_id: dict(binding) for session_id, binding in self.bindings.items()}
+
+    def reinitialize(self):
+        """Restart PortAudio so it sees the current hardware; closes every open stream"""
+        with self.lock:
+            self.audio.terminate()
+            # Same object, so the sessions and manager holding it see the new device list
+            pyaudio.PyAudio.__init__(self.audio)
+            self.refresh()
+            self.stale = False
+            # Indices may have moved; bindings are re-made when sessions start
+            self.bindings.clear()
+        print(f"Audio devices re-enumerated: {len(self.inputs())} input(s), {len(self.outputs())} output(s)")
+
+    def add_listener(self, callback):
+        """callback(changes) is called on the watcher thread when the hardware changes"""
+        self.listeners.append(callback)
+
+    def start(self):
+        """Start watching for hot-plugged devices and default-device changes"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._watch, name="device-watcher", daemon=True)
+            self.thread.start()
+
+    def _watch(self):
+        # One fresh process per scan: a PortAudio that was already initialised wouldn't see new devices
+        executor = concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"),
+                                                          max_tasks_per_child=1)
+        with self.lock:
+            last = snapshot((self.devices, self.default_input, self.default_output))
+        try:
+            while not self._stop.wait(self.poll_interval):
+                started = time.perf_counter()
+                try:
+                    current = snapshot(executor.submit(scan_devices, self.host_api).result(SCAN_TIMEOUT))
+                except Exception as e:
+                    print(f"Device scan failed ({e}); hot-plug detection stopped")
+                    return
+                if current == last:
+                    continue
+                changes = describe_changes(last, current)
+                last = current
+                self.stale = True
+                print(f"Audio devices changed ({time.perf_counter() - started:.1f}s scan): {changes}")
+                for callback in list(self.listeners):
+                    try:
+                        callback(changes)
+                    except Exception as e:
+                        print(f"Device listener error: {e}")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    from session import RATE, TTS_RATE
+    audio = pyaudio.PyAudio()
+    try:
+        registry = DeviceRegistry(audio)
+        for kind, devices, rate, default in (("Input", registry.inputs(), RATE, registry.default_input),
+                                             ("Output", registry.outputs(), TTS_RATE, registry.default_output)):
+            print(f"\n{kind} devices ({rate} Hz 16-bit mono needed):")
+            for device in devices:
+                try:
+                    registry.validate(device["index"], rate, input=kind == "Input")
+                    status = "ok"
+                except DeviceError as e:
+                    status = f"unsupported: {e}"
+                marker = "*" if device["index"] == default else " "
+                print(f" {marker}{kind} Device id {device['index']} - {device['name']}  [{status}]")
+        print("\n* default device")
+    finally:
+        audio.terminate()
+
+if __name__ == "__main__":
+    main()
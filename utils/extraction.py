@@ -0,0 +1,111 @@
+"""Structured replies: spoken text and extracted intake fields from one LLM call.
+
+The intake model answers with JSON matching INTAKE_RESPONSE_FORMAT:
+
+    {"reply": "what to say to the caller", "fields": {"name": ..., ...}}
+
+"reply" comes first, so ReplyStreamParser can decode it from the streamed
+JSON token by token and the caller hears the reply while the model is still
+writing it. The fields are parsed once the stream ends.
+"""
+import json
+from context import FIELDS
+
+INTAKE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "intake_turn",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "reply": {
+                    "type": "string",
+                    "description": "What to say to the caller next"
+                },
+                "fields": {
+                    "type": "object",
+                    "description": "Intake fields the caller has stated so far; null when not yet known",
+                    "properties": {
+                        name: {"type": ["string", "null"], "description": description}
+                        for name, description in FIELDS.items()
+                    },
+                    "required": list(FIELDS),
+                    "additionalProperties": False
+                }
+            },
+            "required": ["reply", "fields"],
+            "additionalProperties": False
+        }
+    }
+}
+
+
+class ReplyStreamParser:
+    """Decode the "reply" string out of a streamed JSON object as it arrives"""
+
+    def __init__(self, key="reply"):
+        self.key = key
+        self.raw = ""
+        self.reply = ""
+        self._start = None  # Index just past the reply's opening quote
+        self._pos = None  # Next undecoded index inside the reply
+        self.reply_done = False
+
+    def feed(self, token):
+        """Add streamed JSON text and return any newly decoded reply text"""
+        self.raw += token
+        if self.reply_done:
+            return ""
+        if self._start is None and not self._find_start():
+            return ""
+
+        decoded = []
+        raw = self.raw
+        pos = self._pos
+        while pos < len(raw):
+            char = raw[pos]
+            if char == '"':
+                self.reply_done = True
+                pos += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                pos += 1
+                continue
+            # Escape sequence: wait until it has fully arrived
+            length = 6 if raw[pos + 1:pos + 2] == "u" else 2
+            if pos + length > len(raw):
+                break
+            if length == 6 and 0xD800 <= int(raw[pos + 2:pos + 6], 16) <= 0xDBFF:
+                length = 12  # High surrogate: decode together with its pair
+                if pos + length > len(raw):
+                    break
+            decoded.append(json.loads(f'"{raw[pos:pos + length]}"'))
+            pos += length
+
+        self._pos = pos
+        text = "".join(decoded)
+        self.reply += text
+        return text
+
+    def _find_start(self):
+        """Locate the opening quote of the reply value"""
+        marker = self.raw.find(f'"{self.key}"')
+        if marker < 0:
+            return False
+        colon = self.raw.find(":", marker + len(self.key) + 2)
+        if colon < 0:
+            return False
+        quote = self.raw.find('"', colon + 1)
+        if quote < 0:
+            return False
+        self._start = self._pos = quote + 1
+        return True
+
+    def result(self):
+        """Parse the complete JSON object, or return None if it is incomplete or invalid"""
+        try:
+            return json.loads(self.raw)
+        except ValueError:
+            return None
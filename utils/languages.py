@@ -0,0 +1,19 @@
+"""Languages the assistant can hold a call in.
+
+Kept free of heavy imports so the window can draw its language selector
+before the audio and API clients have loaded.
+"""
+
+# Supported languages with corresponding language codes
+LANGUAGES = {
+    "English": "en",
+    "Spanish": "es",
+    "French": "fr",
+    "German": "de",
+    "Mandarin": "zh",
+    "Hindi": "hi",
+    "Arabic": "ar",
+    "Russian": "ru",
+    "Japanese": "ja",
+    "Portuguese": "pt"
+}
@@ -0,0 +1,175 @@
+"""Streaming speech playback for a voice session.
+
+AudioPlayer keeps one callback-mode PyAudio output stream open for the whole
+session, fed from an AudioRingBuffer. Speech is written into the ring chunk
+by chunk as it arrives from the TTS provider, so the caller hears a sentence
+from its first chunk instead of after the whole response has downloaded.
+PortAudio's callback thread copies the next frames out of the ring (silence
+when there is nothing to play). Once the last frame of an utterance has been
+handed to the device, it schedules the utterance's completion on the event
+loop after the stream's output latency. Nothing polls, so there is no dead
+time between sentences.
+
+The TTS endpoints return raw 16-bit PCM (response_format="pcm"), so
+"decoding" a chunk is reinterpreting its bytes as samples. A byte left over
+when a network chunk ends mid-sample is carried into the next one.
+
+SpeechStream starts a sentence's request at once and buffers its chunks,
+so later sentences download while an earlier one plays.
+"""
+import asyncio
+import pyaudio
+import numpy as np
+from audio_buffer import AudioRingBuffer
+
+RING_SECONDS = 10  # Audio queued ahead of the device; writers wait when it is full
+DATA_TIMEOUT = 2.0  # Seconds without any callback before the device is considered gone
+
+
+async def pcm_chunks(pcm):
+    """An already-complete PCM buffer as a one-chunk stream"""
+    yield pcm
+
+
+class SpeechStream:
+    """Read an async iterator of PCM chunks in the background; iterate it to get the chunks in order"""
+
+    def __init__(self, chunks):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.ensure_future(self.fetch(chunks))
+
+    async def fetch(self, chunks):
+        try:
+            async for chunk in chunks:
+                self.queue.put_nowait(chunk)
+        except Exception as e:
+            self.queue.put_nowait(e)
+            return
+        self.queue.put_nowait(None)
+
+    async def __aiter__(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        self.task.cancel()
+
+
+class AudioPlayer:
+    """Callback-mode output stream that plays from a ring buffer"""
+
+    def __init__(self, audio, device_index, rate, chunk, loop, meter=None, seconds=RING_SECONDS):
+        self.audio = audio
+        self.device_index = device_index
+        self.rate = rate
+        self.chunk = chunk
+        self.loop = loop
+        self.meter = meter  # PlaybackMeter told about every frame as it is played
+        self.ring = AudioRingBuffer(int(rate * seconds))
+        self.play_pos = 0  # Next sample to play; only the callback thread moves it forward
+        self.stream = None
+        self.latency = 0.0  # Seconds from handing a frame to PortAudio until it is heard
+        self.underruns = 0  # Callbacks that ran out of audio in the middle of an utterance
+        self._space = asyncio.Event()
+        self._active = False  # An utterance is being played
+        self._ending = None  # (end position, future) once the utterance has been fully written
+        self._flush = False  # Set to drop everything queued, e.g. on barge-in
+        self._odd_byte = b""
+
+    def open(self):
+        """Open and start the output stream (blocking)"""
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.rate,
+            output=True,
+            output_device_index=self.device_index,
+            frames_per_buffer=self.chunk,
+            stream_callback=self._callback
+        )
+        self.stream.start_stream()
+        get_latency = getattr(self.stream, "get_output_latency", None)
+        self.latency = get_latency() if get_latency else 0.0
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """Runs on PortAudio's thread: hand the device the next frames and report finished utterances"""
+        if self._flush:
+            self._flush = False
+            self.play_pos = self.ring.write_pos
+        samples, self.play_pos = self.ring.read(self.play_pos, frame_count)
+        if len(samples) and self.meter is not None:
+            self.meter.add(samples.tobytes())
+        ending = self._ending
+        if len(samples) < frame_count:
+            if self._active and ending is None:
+                self.underruns += 1
+            samples = np.concatenate((samples, np.zeros(frame_count - len(samples), dtype=np.int16)))
+        try:
+            if ending is not None and self.play_pos >= ending[0]:
+                self._ending = None
+                # The last frame is now in PortAudio's buffer: it is heard after the output latency
+                self.loop.call_soon_threadsafe(self._finish, ending[1])
+            self.loop.call_soon_threadsafe(self._space.set)
+        except RuntimeError:
+            pass  # The loop has closed; the stream is about to be closed too
+        return (samples.tobytes(), pyaudio.paContinue)
+
+    def _finish(self, done):
+        if not done.done():
+            self.loop.call_later(self.latency, lambda: done.done() or done.set_result(None))
+
+    async def write(self, pcm):
+        """Queue 16-bit PCM bytes, waiting while the ring is full"""
+        data = self._odd_byte + pcm
+        usable = len(data) - len(data) % 2
+        self._odd_byte = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=np.int16)
+        while len(samples):
+            space = self.ring.capacity - (self.ring.write_pos - self.play_pos)
+            if space <= 0:
+                self._space.clear()
+                try:
+                    async with asyncio.timeout(DATA_TIMEOUT):  # wait_for() can drop a cancel() on 3.11
+                        await self._space.wait()
+                except TimeoutError:
+                    raise IOError(f"Output device {self.device_index} stopped playing")
+                continue
+            self.ring.write(samples[:space])
+            samples = samples[space:]
+
+    async def play(self, chunks):
+        """Play an async iterator of PCM chunks as one utterance; returns once its last sample has been heard"""
+        done = self.loop.create_future()
+        self._active = True
+        self._odd_byte = b""
+        try:
+            async for chunk in chunks:
+                await self.write(chunk)
+            self._ending = (self.ring.write_pos, done)
+            await done
+        except BaseException:
+            # Cancelled (barge-in, stop) or the stream failed: silence what is still queued
+            self.stop()
+            raise
+        finally:
+            self._active = False
+
+    def stop(self):
+        """Drop queued audio; the device goes quiet within one buffer"""
+        self._ending = None
+        self._flush = True
+
+    def close(self):
+        """Stop and close the output stream (blocking)"""
+        if self.stream is not None:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception:
+                pass
+            self.stream = None
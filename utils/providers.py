@@ -0,0 +1,316 @@
+"""Pluggable speech-to-text and text-to-speech providers.
+
+A session hears through an STT provider and speaks through a TTS provider,
+chosen by name (--stt / --tts, or the VOICE_STT / VOICE_TTS environment
+variables):
+
+    openai  whisper-1 and tts-1 through the shared OpenAIPool (the default)
+    local   CPU inference on this machine: faster-whisper (int8-quantized
+            CTranslate2) for STT and Piper (ONNX) for TTS, each in a pool of
+            worker processes that load their model once and stay warm
+
+Local providers never send audio off the box and keep working when the API
+is unreachable. They are optional dependencies:
+
+    pip install faster-whisper piper-tts
+
+and Piper needs a voice model, set with VOICE_PIPER_MODEL=/path/voice.onnx.
+A Piper model speaks one language, so give each language its own with
+VOICE_PIPER_MODEL_<CODE> (see routing.py); VOICE_PIPER_MODEL is the fallback.
+
+An STT provider has prepare(samples, rate), which is blocking and runs in a
+worker thread (resampling, encoding), and async transcribe(prepared,
+language_code, prompt=None) -> text. A TTS provider has model, default_voice
+and audio_format (which also key the speech cache), async speech(text, voice)
+-> 16-bit mono PCM at TTS_RATE, and speech_stream(text, voice), an async
+iterator of the same PCM in chunks as it is produced. The LLM provider is
+OpenAIPool's chat() and chat_stream(); OPENAI_BASE_URL points it at any
+OpenAI-compatible server.
+
+Compare transcription latency of the providers on real recordings:
+    python providers.py recordings/*.wav [--stt openai local] [--language Spanish]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import importlib.util
+import multiprocessing
+import concurrent.futures
+import numpy as np
+from upload import encode_upload, resample
+
+PROVIDERS = ["openai", "local"]
+STT_PROVIDER = os.environ.get("VOICE_STT", "openai")
+TTS_PROVIDER = os.environ.get("VOICE_TTS", "openai")
+
+# Remote models
+STT_MODEL = "whisper-1"
+TTS_MODEL = "tts-1"
+TTS_VOICE = "nova"
+TTS_FORMAT = "pcm"
+TTS_RATE = 24000  # The speech endpoint returns raw 24 kHz 16-bit mono for response_format="pcm"
+
+# Local models
+LOCAL_STT_MODEL = os.environ.get("VOICE_WHISPER_MODEL", "small")  # faster-whisper size or model directory
+LOCAL_STT_COMPUTE = "int8"  # Quantized weights: several times faster than float32 on CPU
+LOCAL_STT_RATE = 16000
+LOCAL_TTS_VOICE = os.environ.get("VOICE_PIPER_MODEL")  # Path to a Piper .onnx voice
+LOCAL_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 4))  # Processes per local model
+
+
+# Worker processes (everything here must be picklable, so it lives at module level)
+
+_model = None  # The model loaded in this worker process
+
+
+def _load_model(loader, args):
+    global _model
+    _model = loader(*args)
+
+
+def _call_model(function, *args):
+    return function(_model, *args)
+
+
+def _ready(model):
+    return True
+
+
+def load_whisper(model_size, compute_type, threads):
+    from faster_whisper import WhisperModel
+    return WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=threads)
+
+
+def run_whisper(model, samples, language, prompt=None):
+    """Transcribe float32 samples at LOCAL_STT_RATE"""
+    # Greedy decoding without conditioning on earlier text: intake answers are short and independent
+    segments, _ = model.transcribe(samples, language=language, initial_prompt=prompt, beam_size=1,
+                                   condition_on_previous_text=False)
+    return " ".join(segment.text.strip() for segment in segments)
+
+
+def load_piper():
+    return {}  # Voice models are loaded on first use and then kept, keyed by path
+
+
+def run_piper(voices, text, model_path):
+    """Synthesize text with a Piper voice; returns 16-bit PCM at TTS_RATE"""
+    voice = voices.get(model_path)
+    if voice is None:
+        from piper import PiperVoice
+        voice = voices[model_path] = PiperVoice.load(model_path)
+    if hasattr(voice, "synthesize_stream_raw"):  # piper-tts 1.2
+        pcm = b"".join(voice.synthesize_stream_raw(text))
+    else:
+        pcm = b"".join(chunk.audio_int16_bytes for chunk in voice.synthesize(text))
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    return resample(samples, voice.config.sample_rate, TTS_RATE).tobytes()
+
+
+class WorkerPool:
+    """Worker processes that each load a model once, then serve requests with it"""
+
+    def __init__(self, loader, args, workers=LOCAL_WORKERS):
+        # Spawned, not forked: the parent has audio and event-loop threads a fork would copy mid-flight
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_load_model, initargs=(loader, args)
+        )
+        # Start the workers and load the model now, not on the caller's first turn
+        self.warming = [self.executor.submit(_call_model, _ready) for _ in range(workers)]
+
+    async def run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, _call_model, function, *args)
+
+    def wait_ready(self, timeout=None):
+        for future in self.warming:
+            future.result(timeout)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def require(module, package):
+    if importlib.util.find_spec(module) is None:
+        raise RuntimeError(f"The local provider needs {package}: pip install {package}")
+
+
+# Speech to text
+
+class OpenAITranscriber:
+    """Whisper through the shared OpenAIPool"""
+
+    name = "openai"
+
+    def __init__(self, api, model=STT_MODEL):
+        self.api = api
+        self.model = model
+
+    def prepare(self, samples, rate):
+        return encode_upload(samples, rate)
+
+    async def transcribe(self, audio_file, language, prompt=None):
+        kwargs = {"prompt": prompt} if prompt else {}
+        return await self.api.transcribe(model=self.model, file=audio_file, language=language, **kwargs)
+
+    def wait_ready(self, timeout=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class LocalTranscriber:
+    """Quantized Whisper on this machine's CPUs, in warm worker processes"""
+
+    name = "local"
+
+    def __init__(self, model=LOCAL_STT_MODEL, workers=LOCAL_WORKERS, compute_type=LOCAL_STT_COMPUTE):
+        require("faster_whisper", "faster-whisper")
+        self.model = f"faster-whisper/{model}"
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        self.pool = WorkerPool(load_whisper, (model, compute_type, threads), workers)
+
+    def prepare(self, samples, rate):
+        return resample(samples, rate, LOCAL_STT_RATE).astype(np.float32) / 32768.0
+
+    async def transcribe(self, samples, language, prompt=None):
+        return await self.pool.run(run_whisper, samples, language, prompt)
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has loaded the model"""
+        self.pool.wait_ready(timeout)
+
+    def close(self):
+        self.pool.close()
+
+
+# Text to speech
+
+class OpenAISpeaker:
+    """tts-1 through the shared OpenAIPool"""
+
+    name = "openai"
+    audio_format = TTS_FORMAT
+
+    def __init__(self, api, model=TTS_MODEL, voice=TTS_VOICE):
+        self.api = api
+        self.model = model
+        self.default_voice = voice
+
+    async def speech(self, text, voice):
+        return await self.api.speech(model=self.model, voice=voice, input=text, response_format=TTS_FORMAT)
+
+    async def speech_stream(self, text, voice):
+        async for chunk in self.api.speech_stream(model=self.model, voice=voice, input=text,
+                                                  response_format=TTS_FORMAT):
+            yield chunk
+
+    def wait_ready(self, timeout=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class LocalSpeaker:
+    """Piper voices on this machine's CPUs, in warm worker processes"""
+
+    name = "local"
+    audio_format = TTS_FORMAT
+
+    def __init__(self, voice=LOCAL_TTS_VOICE, workers=LOCAL_WORKERS):
+        require("piper", "piper-tts")
+        if not voice:
+            raise RuntimeError("The local TTS provider needs a Piper voice: set VOICE_PIPER_MODEL=/path/voice.onnx")
+        self.model = "piper"
+        self.default_voice = voice
+        self.pool = WorkerPool(load_piper, (), workers)
+
+    async def speech(self, text, voice):
+        return await self.pool.run(run_piper, text, voice)
+
+    async def speech_stream(self, text, voice):
+        # Piper renders a sentence in a fraction of its playing time, so it comes as one chunk
+        yield await self.speech(text, voice)
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has loaded the model"""
+        self.pool.wait_ready(timeout)
+
+    def close(self):
+        self.pool.close()
+
+
+def create_transcriber(name, api):
+    if name == "openai":
+        return OpenAITranscriber(api)
+    if name == "local":
+        return LocalTranscriber()
+    raise ValueError(f"Unknown STT provider {name!r}; choose from {', '.join(PROVIDERS)}")
+
+
+def create_speaker(name, api):
+    if name == "openai":
+        return OpenAISpeaker(api)
+    if name == "local":
+        return LocalSpeaker()
+    raise ValueError(f"Unknown TTS provider {name!r}; choose from {', '.join(PROVIDERS)}")
+
+
+async def compare(names, utterances, language):
+    """Transcribe every (samples, rate) utterance with each provider in turn; returns {name: [seconds]}"""
+    from api import OpenAIPool
+    api = OpenAIPool() if "openai" in names else None
+    loop = asyncio.get_running_loop()
+    timings = {}
+    try:
+        for name in names:
+            stt = create_transcriber(name, api)
+            await loop.run_in_executor(None, stt.wait_ready)  # Model loading isn't per-turn latency
+            timings[name] = []
+            for samples, rate in utterances:
+                started = time.perf_counter()
+                prepared = await loop.run_in_executor(None, stt.prepare, samples, rate)
+                text = await stt.transcribe(prepared, language)
+                timings[name].append(time.perf_counter() - started)
+                print(f"  {name:<7} {timings[name][-1]:6.3f}s  {text}")
+            stt.close()
+    finally:
+        if api is not None:
+            await api.aclose()
+    return timings
+
+
+def main():
+    from vad import read_wav
+    from batch import split_utterances
+    from languages import LANGUAGES
+
+    parser = argparse.ArgumentParser(description="Compare transcription latency of the STT providers")
+    parser.add_argument("paths", nargs="+", help="WAV recordings; each is split into utterances")
+    parser.add_argument("--stt", nargs="+", default=PROVIDERS, choices=PROVIDERS)
+    parser.add_argument("--language", default="English", choices=list(LANGUAGES.keys()))
+    args = parser.parse_args()
+
+    utterances = []  # (samples, rate): recordings may differ in sample rate
+    for path in args.paths:
+        samples, rate = read_wav(path)
+        utterances.extend((utterance, rate) for utterance in split_utterances(samples, rate))
+    if not utterances:
+        print("No speech found")
+        sys.exit(1)
+    audio_seconds = sum(len(samples) / float(rate) for samples, rate in utterances)
+    print(f"{len(utterances)} utterance(s), {audio_seconds:.1f}s of speech")
+
+    timings = asyncio.run(compare(args.stt, utterances, LANGUAGES[args.language]))
+    # RTF: processing time per second of speech
+    print(f"\n{'provider':<10}{'p50':>8}{'p95':>8}{'max':>8}{'RTF':>8}")
+    for name, seconds in timings.items():
+        print(f"{name:<10}{np.percentile(seconds, 50):8.3f}{np.percentile(seconds, 95):8.3f}"
+              f"{max(seconds):8.3f}{sum(seconds) / audio_seconds:8.3f}")
+
+if __name__ == "__main__":
+    main()
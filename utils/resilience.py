@@ -0,0 +1,177 @@
+"""Rate limiting, retries and circuit breaking for OpenAI requests.
+
+RateLimiter is an asyncio token bucket that keeps a client under a
+requests-per-minute quota. It adapts: each 429 halves the rate and each
+success wins a little of it back, so a burst of callers settles just under
+the real limit instead of hammering it. retry() re-runs a request that
+failed for a transient reason (rate limited, timed out, connection dropped,
+server error) with exponential backoff and full jitter, honouring the
+server's Retry-After.
+
+CircuitBreaker stops sending requests to an endpoint that keeps failing,
+so callers get an immediate CircuitOpenError (and the session a cached
+fallback phrase) instead of waiting out every timeout. LatencyTracker keeps
+recent latencies so OpenAIPool can hedge requests that run past the p95.
+"""
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+import numpy as np
+import openai
+
+RETRY_ATTEMPTS = 4  # Tries in total, including the first
+RETRY_BASE_DELAY = 0.5  # Seconds before the first retry, doubled for each later one
+RETRY_MAX_DELAY = 20.0
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+MIN_RATE_SHARE = 0.05  # An adaptive limiter never drops below this share of its configured rate
+RECOVERY_STEPS = 50  # Successes needed to win back the configured rate after a 429
+BREAKER_FAILURES = 5  # Consecutive failed requests that open a circuit
+BREAKER_COOLDOWN = 30.0  # Seconds an open circuit waits before letting a trial request through
+LATENCY_WINDOW = 200  # Recent latencies kept per endpoint
+MIN_LATENCY_SAMPLES = 20  # Latencies needed before the measured p95 replaces the default
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request to an endpoint whose circuit is open"""
+
+
+class RateLimiter:
+    """Token bucket allowing rate requests per second on average and bursts of up to burst"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.max_rate = self.rate
+        self.burst = float(burst or max(1.0, rate))
+        self.tokens = self.burst
+        self.updated = None
+        self.lock = asyncio.Lock()  # Waiters are served in arrival order
+
+    @classmethod
+    def per_minute(cls, requests, burst=None):
+        return cls(requests / 60.0, burst)
+
+    async def acquire(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self.updated is not None:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    def decrease(self):
+        """The server said we are over the limit: halve the rate"""
+        self.rate = max(self.max_rate * MIN_RATE_SHARE, self.rate / 2.0)
+        self.tokens = min(self.tokens, 0.0)
+
+    def increase(self):
+        """A request succeeded: win back part of the configured rate"""
+        self.rate = min(self.max_rate, self.rate + self.max_rate / RECOVERY_STEPS)
+
+
+class CircuitBreaker:
+    """Fail fast after repeated failures; after a cooldown, let one trial request through"""
+
+    def __init__(self, name, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False  # A half-open trial request is in flight
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def check(self):
+        """Raise CircuitOpenError unless a request may be sent now; returns True for the half-open trial"""
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self.trial:
+                raise CircuitOpenError(f"{self.name} is unavailable (circuit open, next try in {max(remaining, 0):.0f}s)")
+            self.trial = True
+            return True
+
+    def end_trial(self):
+        """The trial request ended without a verdict (e.g. it was cancelled): let the next one try"""
+        with self.lock:
+            self.trial = False
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                print(f"{self.name} recovered; circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                if self.opened_at is None or self.trial:
+                    print(f"{self.name} failing; circuit open for {self.cooldown:.0f}s")
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+
+class LatencyTracker:
+    """Recent request latencies for one endpoint"""
+
+    def __init__(self, default, window=LATENCY_WINDOW):
+        self.default = default
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p=95):
+        """The p-th percentile of recent latencies, or the default until there are enough"""
+        if len(self.samples) < MIN_LATENCY_SAMPLES:
+            return self.default
+        return float(np.percentile(np.array(self.samples), p))
+
+
+def is_retryable(error):
+    """Whether a failed request is worth repeating"""
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError,
+                          TimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def retry(call, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                retryable=is_retryable):
+    """Await call() until it succeeds, a non-transient error occurs or attempts run out"""
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == attempts - 1 or not retryable(e):
+                raise
+            delay = retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"Request failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,154 @@
+"""Cache of LLM replies to turns that are the same for every caller.
+
+Many turns carry nothing specific to the caller: "hello", "can you repeat
+that?", "what do you need from me?" at the same point of the intake. Such a
+turn is answered from the cache instead of a chat completion. Only the
+phrases listed in INTENTS for the call's language are cached; anything else
+the caller says goes to the model. The key is the normalized (language,
+current task, names of the fields collected so far, assistant's previous
+turn, caller's words). So "yes" is only answered from the cache when it
+answers the same question at the same stage of the call.
+
+Nothing that could be PHI is looked up or stored:
+
+  - a turn whose words contain a digit or an e-mail address bypasses the cache
+  - a reply is only stored if its turn extracted no new intake field, and the
+    reply has no digits or e-mail addresses, repeats none of the caller's
+    collected values and has no capitalized word inside a sentence that
+    could be a name (other than the terms in KNOWN_TERMS)
+  - field values never enter a key, only which fields are known, and the
+    previous turn is only hashed
+
+Greetings don't need this: they are already kept per language in a PhraseBook
+(see cache.py).
+
+Entries expire after RESPONSE_TTL seconds, so prompt changes reach callers
+without a restart. Beyond MAX_RESPONSES the least recently used entries are
+evicted. The cache is in memory and shared by the sessions of one
+SessionManager.
+"""
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+RESPONSE_TTL = 6 * 3600  # Seconds a cached reply is served before the model is asked again
+MAX_RESPONSES = 5000  # Entries kept; least recently used are evicted first
+
+PHI_PATTERN = re.compile(r"\d|[^\s@]+@[^\s@]+")  # Numbers (phone, DOB, policy, address) and e-mail addresses
+# A capitalized word that doesn't start a sentence, e.g. a name or a condition the model repeated
+PROPER_NOUN = re.compile(r"(?<![.!?]\s)(?<!^)\b[A-ZÀ-ÖØ-ÞА-Я][\w'-]*")
+KNOWN_TERMS = {"I", "MRI", "CT", "PET", "X", "OK", "IRM", "MRT", "TC", "RM", "КТ", "МРТ"}
+
+# Caller turns that mean the same for every caller, per language code (compared after normalize())
+INTENT_PHRASES = {
+    "en": ["hello", "hi", "hey", "good morning", "good afternoon", "yes", "yeah", "yes please", "no",
+           "no thanks", "okay", "ok", "sure", "thank you", "thanks", "that's right", "correct",
+           "sorry", "what", "pardon", "can you repeat that", "could you repeat that", "say that again",
+           "what do you need", "what do you need from me", "i don't know", "i'm not sure", "one moment",
+           "hold on", "go ahead"],
+    "es": ["hola", "buenos días", "buenas tardes", "sí", "no", "vale", "de acuerdo", "gracias", "correcto",
+           "perdón", "puede repetir", "no sé", "un momento"],
+    "fr": ["bonjour", "salut", "oui", "non", "d'accord", "merci", "c'est ça", "correct", "pardon",
+           "vous pouvez répéter", "je ne sais pas", "un instant"],
+    "de": ["hallo", "guten tag", "ja", "nein", "okay", "danke", "genau", "richtig", "wie bitte",
+           "können sie das wiederholen", "ich weiß nicht", "einen moment"],
+    "pt": ["olá", "oi", "bom dia", "boa tarde", "sim", "não", "tá bom", "obrigado", "obrigada", "correto",
+           "desculpe", "pode repetir", "não sei", "um momento"],
+    "ru": ["здравствуйте", "привет", "да", "нет", "хорошо", "спасибо", "правильно", "повторите", "не знаю"],
+    "zh": ["你好", "是", "是的", "对", "不是", "好的", "谢谢", "请再说一遍", "不知道"],
+    "ja": ["こんにちは", "はい", "いいえ", "そうです", "ありがとう", "もう一度お願いします", "わかりません"],
+    "hi": ["नमस्ते", "हाँ", "हां", "नहीं", "ठीक है", "धन्यवाद", "फिर से बोलिए", "पता नहीं"],
+    "ar": ["مرحبا", "السلام عليكم", "نعم", "لا", "حسنا", "شكرا", "صحيح", "أعد من فضلك", "لا أعرف"]
+}
+
+
+def normalize(text):
+    """Lowercase words without punctuation, so "Hello!" and "hello" share an entry"""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+INTENTS = {code: {normalize(phrase) for phrase in phrases} for code, phrases in INTENT_PHRASES.items()}
+
+
+def contains_phi(text):
+    return PHI_PATTERN.search(text) is not None
+
+
+def is_shared_intent(code, text):
+    """Whether the caller's words are one of the language's caller-independent phrases"""
+    return normalize(text) in INTENTS.get(code, ())
+
+
+def response_key(language, task, fields, previous, text):
+    """Cache key for the reply to text at this point of a call; fields contributes only its names"""
+    known = sorted(name for name, value in fields.items() if value)
+    payload = json.dumps([language, task, known, normalize(previous or ""), normalize(text)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def storable(reply, fields):
+    """Whether a reply is free of the caller's details and may be served to other callers"""
+    if not reply or contains_phi(reply):
+        return False
+    if any(word not in KNOWN_TERMS for word in PROPER_NOUN.findall(re.sub(r"[¿¡]", "", reply).strip())):
+        return False
+    lowered = reply.lower()
+    return not any(str(value).lower() in lowered for value in fields.values() if value)
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of replies with a time to live"""
+
+    def __init__(self, ttl=RESPONSE_TTL, max_entries=MAX_RESPONSES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expiry time, reply), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0  # Turns not looked up because they may contain PHI
+        self.skipped = 0  # Turns not looked up because they aren't a shared intent
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, key):
+        """Return the cached reply, or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, reply):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl, reply)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evicted += 1
+
+    def bypass(self):
+        with self.lock:
+            self.bypassed += 1
+
+    def skip(self):
+        with self.lock:
+            self.skipped += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "bypassed": self.bypassed, "skipped": self.skipped, "expired": self.expired,
+                    "evicted": self.evicted,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
@@ -0,0 +1,181 @@
+"""Per-language routing of models, voices and transcription hints.
+
+ROUTES is keyed by language code (see languages.py). Each entry overrides
+DEFAULT_ROUTE:
+
+    model        chat model for replies
+    fast_model   used instead while the language is over its latency budget
+    max_tokens   cap on the structured reply (spoken text plus extracted fields)
+    voices       TTS voice per provider name; missing means the provider's default.
+                 The local (Piper) voice for a language is the model file named by
+                 VOICE_PIPER_MODEL_<CODE>, e.g. VOICE_PIPER_MODEL_ES; without one
+                 the language falls back to VOICE_PIPER_MODEL
+    stt_prompt   vocabulary hint passed to transcription (clinic terms, script)
+    instructions extra system prompt text for this language
+    p95_budget   seconds from end of speech to first audio the caller should wait at p95.
+                 The current values are placeholders that have not been measured yet
+
+The Router watches finished turns. When a language's recent p95 to first
+audio goes over its budget, its replies move to fast_model for
+DEGRADED_SECONDS, then go back to model with a fresh measurement window.
+
+The table is a starting point. Re-tune it from measured traces:
+    python routing.py traces.jsonl
+"""
+import os
+import sys
+import json
+import time
+import threading
+import numpy as np
+from resilience import LatencyTracker
+
+DEFAULT_ROUTE = {
+    "model": "gpt-4o",
+    "fast_model": "gpt-4o-mini",
+    "max_tokens": 500,
+    "voices": {"openai": "nova"},
+    "stt_prompt": None,
+    "instructions": None,
+    "p95_budget": 2.5  # Placeholder, not yet measured
+}
+
+# Scripts that cost more tokens per word get shorter replies, which also shortens synthesis
+BRIEF = "Keep each reply to one or two short sentences. Read numbers back digit by digit."
+
+
+def voices(code, openai):
+    """TTS voices of a language: an OpenAI voice name and the Piper model configured for it, if any"""
+    return {"openai": openai, "local": os.environ.get(f"VOICE_PIPER_MODEL_{code.upper()}")}
+
+
+# OpenAI voices are all multilingual; these are starting picks per language, to be checked by native speakers.
+# The p95 budgets here and in DEFAULT_ROUTE are placeholders until measured (see language_report)
+ROUTES = {
+    "en": {"voices": voices("en", "nova"),
+           "stt_prompt": "Radiology intake call: MRI, CT scan, X-ray, ultrasound, date of birth, insurance policy number."},
+    "es": {"voices": voices("es", "shimmer"),
+           "stt_prompt": "Llamada de admisión de radiología: resonancia magnética, tomografía, fecha de nacimiento, número de póliza."},
+    "fr": {"voices": voices("fr", "alloy"),
+           "stt_prompt": "Appel d'admission en radiologie : IRM, scanner, date de naissance, numéro de police d'assurance."},
+    "de": {"voices": voices("de", "onyx"),
+           "stt_prompt": "Aufnahmegespräch Radiologie: MRT, CT, Geburtsdatum, Versicherungsnummer."},
+    "zh": {"voices": voices("zh", "alloy"),
+           "stt_prompt": "放射科预约电话：核磁共振、CT、出生日期、保险单号。", "instructions": BRIEF},
+    "hi": {"voices": voices("hi", "shimmer"),
+           "max_tokens": 400, "p95_budget": 3.0, "instructions": BRIEF,
+           "stt_prompt": "रेडियोलॉजी अपॉइंटमेंट कॉल: MRI, CT scan, जन्म तिथि, insurance policy number, पता।"},
+    "ar": {"voices": voices("ar", "onyx"),
+           "max_tokens": 400, "p95_budget": 3.0, "instructions": BRIEF,
+           "stt_prompt": "مكالمة حجز في قسم الأشعة: الرنين المغناطيسي، الأشعة المقطعية، تاريخ الميلاد، رقم بوليصة التأمين."},
+    "ru": {"voices": voices("ru", "echo"),
+           "stt_prompt": "Звонок в отделение радиологии: МРТ, КТ, дата рождения, номер страхового полиса."},
+    "ja": {"voices": voices("ja", "shimmer"),
+           "stt_prompt": "放射線科の予約電話：MRI、CT、生年月日、保険証番号。", "instructions": BRIEF},
+    "pt": {"voices": voices("pt", "fable"),
+           "stt_prompt": "Ligação de admissão em radiologia: ressonância magnética, tomografia, data de nascimento, número da apólice."}
+}
+
+DEGRADED_SECONDS = 300  # How long a language stays on its fast model before trying the primary again
+LATENCY_METRIC = "first_audio"  # Trace mark compared with p95_budget
+
+
+class Router:
+    """Pick each language's route, switching to the fast model while it is over budget"""
+
+    def __init__(self, routes=None, degraded_seconds=DEGRADED_SECONDS):
+        self.routes = routes if routes is not None else ROUTES
+        self.degraded_seconds = degraded_seconds
+        self.latencies = {}  # language code -> LatencyTracker of recent first-audio times
+        self.degraded_until = {}  # language code -> time.monotonic() when the primary model is tried again
+        self.lock = threading.Lock()  # Sessions on the loop and callers on other threads share a router
+
+    def route(self, code):
+        """The effective route for a language code, with model set to the one to use now"""
+        route = dict(DEFAULT_ROUTE, **self.routes.get(code, {}))
+        with self.lock:
+            until = self.degraded_until.get(code)
+            if until is not None and time.monotonic() >= until:
+                # Give the primary model another chance, judged on fresh turns only
+                del self.degraded_until[code]
+                self.latencies.pop(code, None)
+                print(f"Routing: {code} back on {route['model']}")
+                until = None
+        route["degraded"] = until is not None
+        if route["degraded"]:
+            route["model"] = route["fast_model"]
+        return route
+
+    def voice(self, code, tts):
+        """The route's voice for a TTS provider, or the provider's default"""
+        route = dict(DEFAULT_ROUTE, **self.routes.get(code, {}))
+        return route["voices"].get(tts.name) or tts.default_voice
+
+    def observe(self, code, trace):
+        """Feed a finished turn's trace dict; may move the language to its fast model"""
+        seconds = (trace.get("marks") or {}).get(LATENCY_METRIC)
+        if seconds is None or trace.get("error") or trace.get("source") != "voice":
+            return
+        budget = dict(DEFAULT_ROUTE, **self.routes.get(code, {}))["p95_budget"]
+        with self.lock:
+            tracker = self.latencies.setdefault(code, LatencyTracker(0.0))
+            tracker.add(seconds)
+            if code in self.degraded_until:
+                return
+            p95 = tracker.percentile(95)
+            if p95 > budget:
+                self.degraded_until[code] = time.monotonic() + self.degraded_seconds
+                print(f"Routing: {code} p95 to first audio {p95:.2f}s is over its {budget:.1f}s budget; "
+                      f"using the fast model for {self.degraded_seconds}s")
+
+    def status(self):
+        """{language code: recent p95 and whether it is on the fast model}"""
+        with self.lock:
+            return {code: {"p95": round(tracker.percentile(95), 3), "degraded": code in self.degraded_until}
+                    for code, tracker in self.latencies.items()}
+
+
+def language_report(paths):
+    """Per-language latency from trace files, against each route's budget"""
+    from languages import LANGUAGES
+    values = {}  # code -> metric -> [seconds]
+    models = {}  # code -> set of models seen
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                trace = json.loads(line)
+                if trace.get("source") != "voice" or trace.get("error"):
+                    continue
+                code = LANGUAGES.get(trace.get("language"), trace.get("language"))
+                metrics = dict(trace.get("stages") or {}, **(trace.get("marks") or {}))
+                for name in ("stt", "llm_first_token", "tts", LATENCY_METRIC):
+                    if name in metrics:
+                        values.setdefault(code, {}).setdefault(name, []).append(metrics[name])
+                if trace.get("model"):
+                    models.setdefault(code, set()).add(trace["model"])
+
+    lines = [f"{'lang':<6}{'turns':>6}{'stt p95':>9}{'llm ft p95':>12}{'tts p95':>9}"
+             f"{'first audio p50':>17}{'p95':>7}{'budget':>8}  models"]
+    for code in sorted(values):
+        metrics = values[code]
+        p95 = lambda name: f"{np.percentile(metrics[name], 95):.2f}" if name in metrics else "-"
+        first_audio = metrics.get(LATENCY_METRIC, [])
+        budget = dict(DEFAULT_ROUTE, **ROUTES.get(code, {}))["p95_budget"]
+        over = first_audio and np.percentile(first_audio, 95) > budget
+        lines.append(f"{code:<6}{len(first_audio):>6}{p95('stt'):>9}{p95('llm_first_token'):>12}{p95('tts'):>9}"
+                     f"{np.percentile(first_audio, 50) if first_audio else float('nan'):>17.2f}"
+                     f"{p95(LATENCY_METRIC):>7}{budget:>8.1f}  {', '.join(sorted(models.get(code, [])))}"
+                     f"{'  OVER BUDGET' if over else ''}")
+    return "\n".join(lines)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python routing.py traces.jsonl [more.jsonl ...]")
+        sys.exit(1)
+    print(language_report(sys.argv[1:]))
+
+if __name__ == "__main__":
+    main()
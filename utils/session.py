@@ -0,0 +1,1504 @@
+"""Headless voice session engine.
+
+A VoiceSession holds everything about one caller's conversation (history,
+task progress, language, audio devices) and runs the listen -> transcribe ->
+respond loop as an asyncio task. It knows nothing about Tkinter: anything a UI
+wants to show is reported through the on_event callback as (session, event,
+data) with these events:
+
+    "message"   data = {"speaker": ..., "text": ...}   a new conversation line
+    "append"    data = {"text": ...}                   more text for the last line
+    "status"    data = {"text": ...}                   short status for a status bar
+    "tasks"     data = {"completed": [bool, ...]}      task checklist changed
+    "task"      data = {"index": ..., "task": ..., "evidence": [...]}  one task just completed
+    "fields"    data = {"fields": {...}}               intake fields collected so far
+    "trace"     data = {"trace": {...}}                stage timings for a finished turn (see tracing.py)
+    "barge_in"  data = {}                              the caller talked over the assistant; playback stopped
+    "stopped"   data = {"reason": "requested"|"error"}  the session has ended
+
+Synthesized speech and greeting texts are looked up in the manager's
+SpeechCache and PhraseBook first, so a pickup in a warmed-up language plays
+from local audio without any API call.
+
+A SessionManager runs many sessions on one event loop in a background thread,
+sharing one PyAudio instance and one OpenAIPool between them. Network calls
+are awaited on the loop. Each session keeps one callback-mode input stream
+(see capture.py) and one callback-mode output stream (see playback.py) open
+and segments utterances on the loop; only opening or closing devices runs in
+worker threads. Speech is streamed from the TTS provider straight into the
+output ring buffer, so each sentence starts playing with its first chunk.
+Stopping a session cancels its task, which aborts any HTTP request it is
+waiting on.
+
+With VoiceSession.speculative set, transcription and the LLM request start
+during a pause, before the endpoint is confirmed (see speculation.py).
+
+The microphone stays open while the assistant speaks. With
+VoiceSession.barge_in set, a caller who talks over the reply stops playback
+and any sentences still queued for synthesis, and their utterance is
+captured from where they started talking (see bargein.py).
+
+Each session's turns and intake fields are appended to the manager's
+ConversationStore as they happen, so after a crash the call can be resumed
+with SessionManager.resume_session (or session.py --resume).
+
+When a turn fails (an API outage, or a circuit opened by OpenAIPool), the
+session plays FALLBACK_TEXT in the call's language from the speech cache,
+with no API call, so the caller isn't left in silence. Each session renders
+the phrase for its language when it starts, and warm-up does so for every
+language.
+
+Transcription and speech go through the STT and TTS providers in
+providers.py: the OpenAI API by default, or on-box CPU models. The chat
+model, voice, reply length and transcription hints are chosen per language
+by the manager's Router (routing.py), which moves a language to a faster
+model while its p95 latency is over budget. Turns that are the same for
+every caller (an allowlist of phrases such as "yes" or "can you repeat
+that?") are answered from the manager's ResponseCache (responses.py)
+without a chat completion.
+
+Audio devices come from the manager's DeviceRegistry (devices.py). Starting a
+session checks its microphone and speaker against RATE and TTS_RATE and
+reserves them, so two concurrent calls can't share a headset. A device
+plugged in while calls are running is picked up once they have ended.
+
+Run directly for a single console session:
+    python session.py [--language Spanish] [--input-device 5] [--warm-up] [--stt local]
+"""
+import re
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+import concurrent.futures
+from collections import Counter
+import pyaudio
+import numpy as np
+from vad import VoiceActivityDetector
+from audio_buffer import CaptureBuffer
+from capture import AudioCapture
+from playback import AudioPlayer, SpeechStream, pcm_chunks
+from devices import DeviceRegistry, DeviceError
+from api import OpenAIPool
+from cache import SpeechCache, PhraseBook
+from responses import ResponseCache, response_key, contains_phi, is_shared_intent, storable
+from context import ConversationContext
+from tasks import TASKS, TASK_FIELDS, tasks_completed
+from extraction import INTAKE_RESPONSE_FORMAT, ReplyStreamParser
+from tracing import TurnTrace, LatencyRecorder
+from speculation import Speculation
+from bargein import BargeInDetector, PlaybackMeter
+from store import ConversationStore
+from languages import LANGUAGES
+from routing import Router
+from providers import (create_transcriber, create_speaker, OpenAITranscriber, OpenAISpeaker,
+                       PROVIDERS, STT_PROVIDER, TTS_PROVIDER, TTS_RATE)
+
+# Audio recording parameters
+FORMAT = pyaudio.paInt16
+CHANNELS = 1
+RATE = 44100
+CHUNK = 1024
+SILENCE_DURATION = 1  # Seconds of silence to consider speech ended
+CALIBRATION_CHUNKS = 10  # Chunks captured when the microphone opens, used to measure background noise
+MAX_UTTERANCE_DURATION = 15  # Force processing after this many seconds of speech
+PRE_ROLL_DURATION = 0.5  # Audio kept from before speech onset so the first syllable isn't clipped
+TRIM_MARGIN = 0.25  # Audio kept on either side of detected speech when trimming an utterance for upload
+SPECULATIVE = False  # Transcribe and start the reply during pauses, before the endpoint is confirmed
+SPECULATION_SILENCE = 0.4  # Pause after which a speculative transcript and reply are started
+BARGE_IN = True  # Let the caller interrupt the assistant by talking over it
+
+# Audio playback parameters (speech arrives as 16-bit mono PCM at providers.TTS_RATE)
+PLAYBACK_CHUNK = 1024  # Frames per output callback, so a stopped session goes quiet quickly
+
+# Played from the speech cache when a turn fails, e.g. because an endpoint's circuit is open
+FALLBACK_TEXT = "I'm sorry, I'm having a technical problem on my end. Could you please say that again?"
+
+# Streaming response parameters
+# Sentence ends: Latin punctuation needs trailing whitespace (so "3.5" or "Dr.Smith" don't split),
+# full-width CJK, Arabic and Devanagari terminators split immediately
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+|[。！？؟।]+\s*')
+# Sentences shorter than this when spoken are merged with the next, so TTS isn't called for "Yes."
+# Measured in estimated speaking time rather than characters: a Chinese sentence of ten characters
+# takes as long to say as an English one of fifty
+MIN_SENTENCE_SECONDS = 1.2
+WORD_SECONDS = 0.35  # Speaking time of a word in scripts that separate words with spaces (~170 a minute)
+SYLLABLE_SECONDS = 0.2  # Speaking time of a Chinese character or Japanese kana, each about a syllable
+SYLLABIC_CHARS = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+TTS_PREFETCH = 2  # Sentences synthesized ahead of the one currently playing
+# Ends a reply in the history when the caller didn't hear all of it, so the model knows what they missed
+CUT_OFF_MARK = "[cut off: the caller did not hear the rest of this reply]"
+
+# Worker threads for blocking PyAudio calls, shared by all sessions
+AUDIO_WORKERS = 64
+
+
+def speech_seconds(text):
+    """Rough speaking time of text: per character in Chinese and Japanese, per word elsewhere"""
+    syllables = len(SYLLABIC_CHARS.findall(text))
+    words = sum(1 for word in SYLLABIC_CHARS.sub(" ", text).split() if re.search(r"\w", word))
+    return syllables * SYLLABLE_SECONDS + words * WORD_SECONDS
+
+
+class SentenceSplitter:
+    """Cut a stream of LLM tokens into sentences that can be spoken one at a time"""
+
+    def __init__(self, min_seconds=MIN_SENTENCE_SECONDS):
+        self.min_seconds = min_seconds
+        self.buffer = ""
+
+    def feed(self, token):
+        """Add a token and return any sentences that are now complete"""
+        self.buffer += token
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()].strip()
+            if speech_seconds(candidate) >= self.min_seconds:
+                sentences.append(candidate)
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Return whatever text is left once the stream has ended"""
+        remainder = self.buffer.strip()
+        self.buffer = ""
+        return [remainder] if remainder else []
+
+
+async def generate_greeting(api, language):
+    """Use the LLM to write a natural greeting in the given language"""
+    response = await api.chat(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": f"You are a medical intake assistant for a clinic. Respond in {language} only."},
+            {"role": "user", "content": f"Generate a brief, friendly greeting in {language} for a patient calling a medical clinic. Introduce yourself as an AI assistant who will help collect information for their radiology appointment."}
+        ],
+        temperature=0.7
+    )
+    return response.choices[0].message.content
+
+
+async def translate_phrase(api, text, language):
+    """Use the LLM to translate a fixed phrase for the caller's language"""
+    if language == "English":
+        return text
+    response = await api.chat(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": f"Translate the user's message into {language}. Reply with the translation only."},
+            {"role": "user", "content": text}
+        ],
+        temperature=0
+    )
+    return response.choices[0].message.content.strip()
+
+
+async def prepare_fallback(api, tts, speech_cache, fallbacks, language, voice=None):
+    """Make sure the fallback phrase for language is written and in the speech cache"""
+    text = fallbacks.get(language)
+    if not text:
+        text = await translate_phrase(api, FALLBACK_TEXT, language)
+        await asyncio.get_running_loop().run_in_executor(None, fallbacks.put, language, text)
+    await synthesize(tts, speech_cache, text, voice)
+    return text
+
+
+async def cached_tokens(reply):
+    """A cached reply in the shape of the streamed structured response"""
+    yield json.dumps({"reply": reply, "fields": {}}, ensure_ascii=False)
+
+
+async def cached_speech(tts, speech_cache, text, voice):
+    """Speech for text from the cache, or None; a disk read runs in a worker thread.
+
+    On a miss, waits for a synthesis of the same phrase that another task has in flight.
+    """
+    audio, digest = speech_cache.lookup(text, voice, tts.model, tts.audio_format)
+    if digest is not None:
+        audio = await asyncio.get_running_loop().run_in_executor(None, speech_cache.read, digest)
+    if audio is not None:
+        return audio
+    key = speech_cache.key(text, voice, tts.model, tts.audio_format)
+    while (pending := speech_cache.inflight.get(key)) is not None:
+        # Shielded: a waiter being cancelled mustn't cancel the synthesis others are waiting for
+        audio = await asyncio.shield(pending)
+        if audio is not None:
+            return audio
+    return None
+
+
+def claim_synthesis(tts, speech_cache, text, voice):
+    """Register this task as the one synthesizing text; returns a callback taking the audio (None if it failed)"""
+    key = speech_cache.key(text, voice, tts.model, tts.audio_format)
+    pending = speech_cache.inflight[key] = asyncio.get_running_loop().create_future()
+
+    def finish(audio):
+        if speech_cache.inflight.get(key) is pending:
+            del speech_cache.inflight[key]
+        if not pending.done():
+            pending.set_result(audio)
+        if audio is not None:
+            # The disk write happens off the loop; playback doesn't wait for it
+            asyncio.get_running_loop().run_in_executor(None, speech_cache.put, text, voice, tts.model,
+                                                       tts.audio_format, audio)
+    return finish
+
+
+async def synthesize(tts, speech_cache, text, voice=None):
+    """Return speech for text from the cache, or synthesize it with the TTS provider and cache the result"""
+    voice = voice or tts.default_voice
+    if not speech_cache:
+        return await tts.speech(text, voice)
+    audio = await cached_speech(tts, speech_cache, text, voice)
+    if audio is not None:
+        return audio
+
+    finish = claim_synthesis(tts, speech_cache, text, voice)
+    audio = None
+    try:
+        audio = await tts.speech(text, voice)
+    finally:
+        finish(audio)
+    return audio
+
+
+async def synthesize_stream(tts, speech_cache, text, voice=None):
+    """Yield speech for text in chunks: all at once from the cache, or as the TTS provider streams it"""
+    voice = voice or tts.default_voice
+    if not speech_cache:
+        async for chunk in tts.speech_stream(text, voice):
+            yield chunk
+        return
+    audio = await cached_speech(tts, speech_cache, text, voice)
+    if audio is not None:
+        yield audio
+        return
+
+    finish = claim_synthesis(tts, speech_cache, text, voice)
+    chunks = []
+    audio = None
+    try:
+        async for chunk in tts.speech_stream(text, voice):
+            chunks.append(chunk)
+            yield chunk
+        audio = b"".join(chunks)
+    finally:
+        # Only a complete response is cached; waiters on a stream abandoned on barge-in synthesize it themselves
+        finish(audio)
+
+
+class VoiceSession:
+    """One caller's conversation with the assistant, independent of any UI"""
+
+    def __init__(self, api, audio, loop, language="English", input_device_index=None,
+                 output_device_index=None, on_event=None, session_id=None,
+                 speech_cache=None, greetings=None, latency=None, store=None, fallbacks=None,
+                 stt=None, tts=None, router=None, response_cache=None):
+        self.api = api  # LLM provider: chat() and chat_stream()
+        self.stt = stt or OpenAITranscriber(api)
+        self.tts = tts or OpenAISpeaker(api)
+        # Per-language model, voice and STT hints, shared so latency is measured across calls
+        self.router = router or Router()
+        self.audio = audio
+        self.loop = loop
+        self.session_id = session_id or uuid.uuid4().hex[:8]
+        self.language = language
+        self.input_device_index = input_device_index
+        self.output_device_index = output_device_index
+        self.on_event = on_event
+
+        # Shared caches of synthesized audio, greeting texts and fallback phrases (optional)
+        self.speech_cache = speech_cache
+        self.greetings = greetings
+        self.fallbacks = fallbacks
+
+        # Shared replies to turns that are the same for every caller (optional; see responses.py)
+        self.response_cache = response_cache
+
+        # Durable log of the conversation (optional)
+        self.store = store
+
+        # Per-turn timings; finished traces go to the shared LatencyRecorder (optional)
+        self.latency = latency
+        self.trace = None  # TurnTrace of the turn holding turn_lock
+        self.turns = 0
+
+        # Conversation state: the full transcript, and the bounded context sent to the LLM
+        self.conversation_history = []
+        self.context = ConversationContext()
+        self.current_task_index = 0
+        self.completed_tasks = [False] * len(TASKS)
+        self.active = False
+        self.stop_requested = False
+
+        # Voice activity detector used to find the end of each utterance
+        self.vad_factory = VoiceActivityDetector
+        self.vad = None
+
+        # Microphone stream, opened once and kept for the whole session
+        self.capture = None
+
+        # Speculative transcript and reply for the current pause (see speculation.py)
+        self.speculative = SPECULATIVE
+        self.speculation = None
+        self.speculation_stats = Counter()  # started, committed, cancelled
+
+        # Recorded audio is copied into this buffer instead of a list of chunks
+        self.capture_buffer = CaptureBuffer(RATE, PRE_ROLL_DURATION + MAX_UTTERANCE_DURATION + SILENCE_DURATION + 1)
+
+        # Speaker stream, opened on first playback and kept for the whole session
+        self.player = None
+        self.playback_meter = PlaybackMeter()  # Levels of played audio, for echo-aware barge-in detection
+        self.barge_in = BARGE_IN
+        self.interrupted = False  # Set when the caller talks over playback
+        self.barge_in_position = None  # Capture position where the interrupting speech began
+
+        self.turn_lock = asyncio.Lock()  # One reply at a time, even when text is injected
+        self.runs = set()  # asyncio Tasks of runs that haven't finished yet (only touched on the loop)
+        self.future = None  # concurrent.futures.Future that completes once that task has finished
+        self.submitted = set()  # Futures for work injected with submit(), cancelled by stop()
+
+    def emit(self, event, **data):
+        """Report an event to whoever is driving this session"""
+        if self.on_event:
+            try:
+                self.on_event(self, event, data)
+            except Exception as e:
+                print(f"[{self.session_id}] Event handler error: {e}")
+
+    def set_status(self, text):
+        self.emit("status", text=text)
+
+    def add_message(self, speaker, text):
+        self.emit("message", speaker=speaker, text=text)
+
+    @property
+    def running(self):
+        return self.future is not None and not self.future.done()
+
+    def start(self):
+        """Greet the caller and start listening (safe to call from any thread)"""
+        future = self.future = concurrent.futures.Future()
+        self.loop.call_soon_threadsafe(self.begin_run, future)
+        return future
+
+    def begin_run(self, future):
+        """Create the run task on the loop, after the previous one (if any).
+
+        future completes only when the task has finished its clean-up. A future
+        from run_coroutine_threadsafe reports done as soon as it is cancelled,
+        while the task may still be closing the audio devices.
+        """
+        task = self.loop.create_task(self.run(list(self.runs)))
+        self.runs.add(task)
+
+        def finished(task):
+            self.runs.discard(task)
+            if task.cancelled():
+                future.cancel()
+                future.set_running_or_notify_cancel()  # Wakes concurrent.futures.wait() callers such as join()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+        task.add_done_callback(finished)
+
+    def cancel_run(self):
+        for task in self.runs:
+            # Cancelling again would interrupt a run that is already cleaning up
+            if not task.cancelling():
+                task.cancel()
+
+    def stop(self):
+        """Stop the session and abort whatever request it is waiting on (safe to call from any thread)"""
+        self.stop_requested = True
+        self.active = False
+        if self.future is not None and not self.loop.is_closed():
+            # Runs after the begin_run() scheduled by start(), so the latest run is cancelled too
+            self.loop.call_soon_threadsafe(self.cancel_run)
+        for future in list(self.submitted):
+            future.cancel()
+        self.set_status("Assistant stopped")
+
+    def submit(self, coro):
+        """Schedule a coroutine for this session on its event loop; stop() cancels it"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        self.submitted.add(future)
+        future.add_done_callback(self.submitted.discard)
+        return future
+
+    async def run(self, previous=()):
+        """Greeting followed by the listen loop; previous are runs of this session still finishing"""
+        previous = [task for task in previous if not task.done()]
+        if previous:
+            # A restart right after stop(): let the old runs release the audio devices and finish
+            # their clean-up first. Until then this run has created nothing, so if it is cancelled
+            # meanwhile it ends without any clean-up of its own.
+            for task in previous:
+                if not task.cancelling():
+                    task.cancel()
+            await asyncio.wait(previous)
+        self.active = True
+        self.stop_requested = False
+        if self.store:
+            self.store.open_session(self.session_id, self.language)
+
+        fallback_ready = None
+        capture_ready = None
+        if self.speech_cache and self.fallbacks and self.audio is not None:
+            # Rendered once per language while the API is healthy, for when it isn't
+            fallback_ready = asyncio.ensure_future(self.prepare_fallback())
+        try:
+            # Open the microphone and measure background noise while the greeting is prepared
+            capture_ready = asyncio.ensure_future(self.open_capture())
+
+            # Start with a greeting based on the selected language
+            try:
+                async with self.turn_lock:
+                    self.trace = self.new_trace("greeting")
+                    greeting = await self.get_greeting()
+                    if not await capture_ready:
+                        return
+                    self.add_message("Assistant", greeting)
+                    await self.speak_text(greeting)
+                    self.finish_trace(self.trace)
+            except Exception as e:
+                capture_ready.cancel()
+                self.set_status(f"Error generating greeting: {str(e)}")
+                self.add_message("System", f"Error: {str(e)}")
+                self.active = False
+                return
+
+            await self.listen_loop()
+        finally:
+            self.active = False
+            if fallback_ready is not None:
+                fallback_ready.cancel()
+            if capture_ready is not None and not capture_ready.done():
+                # Stopped during start-up: let it close the microphone it is opening before ours are closed
+                capture_ready.cancel()
+                await asyncio.wait([capture_ready])
+            self.context.cancel()
+            self.drop_speculation()
+            await self.run_blocking(self.close)
+            reason = "requested" if self.stop_requested else "error"
+            if self.store:
+                self.store.end_session(self.session_id, reason)
+            self.emit("stopped", reason=reason)
+
+    def new_trace(self, source):
+        """Start timing a new turn"""
+        self.turns += 1
+        return TurnTrace(self.session_id, self.turns, self.language, source)
+
+    def finish_trace(self, trace, error=None):
+        """Record a finished turn's timings and report them"""
+        trace.finish(error)
+        if self.trace is trace:
+            self.trace = None
+        if self.latency:
+            self.latency.record(trace)
+        data = trace.to_dict()
+        self.router.observe(LANGUAGES.get(trace.language), data)
+        self.emit("trace", trace=data)
+
+    def route(self):
+        """Model, voice and transcription hints for the current language (see routing.py)"""
+        return self.router.route(LANGUAGES[self.language])
+
+    def voice(self):
+        return self.router.voice(LANGUAGES[self.language], self.tts)
+
+    async def run_blocking(self, func, *args):
+        """Run a blocking audio call in a worker thread.
+
+        If the session is cancelled meanwhile, wait for the call to return (they all
+        check self.active between chunks) so the devices are released before the
+        task finishes.
+        """
+        call = asyncio.ensure_future(self.loop.run_in_executor(None, func, *args))
+        try:
+            return await asyncio.shield(call)
+        except asyncio.CancelledError:
+            await asyncio.wait([call])
+            raise
+
+    def close(self):
+        """Release the session's audio streams"""
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        if self.player is not None:
+            self.player.close()
+            self.player = None
+
+    async def get_greeting(self):
+        """Return the greeting for the current language, generating it once if needed"""
+        if self.greetings:
+            greeting = self.greetings.get(self.language)
+            if greeting:
+                return greeting
+
+        try:
+            greeting = await generate_greeting(self.api, self.language)
+        except Exception as e:
+            self.set_status(f"API Error: {str(e)}")
+            raise
+
+        if self.greetings:
+            await self.loop.run_in_executor(None, self.greetings.put, self.language, greeting)
+        return greeting
+
+    async def listen_loop(self):
+        """Main loop for listening and processing speech"""
+        while self.active:
+            self.set_status("Listening...")
+
+            # Record audio
+            try:
+                audio_data = await self.capture_utterance()
+            except Exception as e:
+                self.set_status(f"Recording error: {str(e)}")
+                self.add_message("System", f"Recording error: {str(e)}")
+                continue
+
+            if not self.active:  # Check if stopped while recording
+                break
+
+            if audio_data is not None:
+                self.set_status("Processing speech...")
+
+                # The turn's clock starts when the end of speech is detected
+                trace = self.new_trace("voice")
+                trace.add("capture", len(audio_data) / float(RATE))
+                trace.add("endpoint", self.vad.trailing_silence)
+
+                # Process the audio
+                try:
+                    # 1. Transcribe speech to text, unless a speculation already covers exactly this speech
+                    prefetch = await self.commit_speculation()
+                    if prefetch is not None:
+                        transcript = prefetch.transcript.result()
+                        # Measured during the pause, before this turn's clock started
+                        for stage, seconds in prefetch.timings.items():
+                            trace.add(stage, seconds)
+                    else:
+                        # Resampling and encoding run off the loop
+                        with trace.stage("encode"):
+                            prepared = await self.loop.run_in_executor(None, self.stt.prepare, audio_data, RATE)
+                        with trace.stage("stt"):
+                            transcript = await self.transcribe_audio(prepared)
+
+                    if transcript.strip():
+                        await self.handle_text(transcript, trace=trace, prefetch=prefetch)
+                    else:
+                        self.finish_trace(trace)
+                except Exception as e:
+                    self.finish_trace(trace, e)
+                    self.set_status(f"Processing error: {str(e)}")
+                    self.add_message("System", f"Error: {str(e)}")
+                    await self.speak_fallback()
+
+    async def handle_text(self, text, speaker="You", trace=None, prefetch=None):
+        """Respond to one caller utterance, whether transcribed or typed in"""
+        if prefetch is not None and self.turn_lock.locked():
+            # Another turn is in progress, so the prefetched reply was built on a stale context
+            prefetch.cancel()
+            prefetch = None
+
+        async with self.turn_lock:
+            self.trace = trace or self.new_trace("text")
+
+            # Add to conversation display
+            self.add_message(speaker, text)
+
+            # 2-4. Stream the LLM reply and speak it sentence by sentence
+            await self.respond_streaming(text, prefetch)
+
+            # 5. Update task progress
+            self.update_task_progress()
+            self.finish_trace(self.trace)
+
+            # Fold older turns into the summary while the caller answers
+            self.context.schedule_compaction(self.api, self.record_summary_fields)
+
+    async def open_capture(self):
+        """Open the microphone and calibrate the detector; returns False if the device failed"""
+        if self.capture is not None:
+            await self.run_blocking(self.capture.close)
+        capture = AudioCapture(self.audio, self.input_device_index, RATE, CHUNK, self.loop)
+        try:
+            await self.run_blocking(capture.open)
+            print(f"[{self.session_id}] Recording from device {self.input_device_index}")
+
+            # The first chunks after opening measure the background noise level
+            start = capture.position
+            calibration = np.zeros(0, dtype=np.int16)
+            while len(calibration) < CALIBRATION_CHUNKS * CHUNK:
+                samples, _ = await capture.read(start + len(calibration))
+                calibration = np.concatenate((calibration, samples))
+        except BaseException as e:
+            await self.run_blocking(capture.close)
+            if not isinstance(e, Exception):
+                raise  # Cancelled: the stream isn't the session's yet, so nothing else would close it
+            self.set_status(f"Microphone error: {str(e)}")
+            self.add_message("System", f"Could not access microphone: {str(e)}\nTry changing the device index.")
+            self.active = False
+            return False
+
+        self.capture = capture
+        self.vad = self.vad_factory(RATE)
+        self.vad.calibrate(calibration)
+        return True
+
+    async def capture_utterance(self):
+        """Wait for the caller's next utterance and return its samples"""
+        if self.capture is None or self.capture.device_index != self.input_device_index:
+            # First turn, or the microphone was changed during the call
+            if not await self.open_capture():
+                return None
+
+        capture = self.capture
+        vad = self.vad
+        vad.reset()
+        buffer = self.capture_buffer
+        buffer.reset()
+        pre_roll = int(PRE_ROLL_DURATION * RATE)
+        status_interval = 10 * CHUNK
+        next_status = 0
+
+        # Audio captured while the assistant was speaking is not part of the utterance,
+        # unless the caller interrupted it: then start from where they began talking
+        position = capture.position
+        if self.barge_in_position is not None:
+            position = max(self.barge_in_position - pre_roll, position - capture.ring.capacity + CHUNK)
+            self.barge_in_position = None
+        while self.active:
+            try:
+                samples, position = await capture.read(position)
+            except IOError:
+                # The device stopped delivering audio; reopen it on the next turn
+                await self.run_blocking(capture.close)
+                self.capture = None
+                raise
+            vad.process(samples)
+
+            # Until speech starts only the pre-roll is worth keeping
+            if not vad.has_speech:
+                buffer.keep_last(pre_roll)
+            if not buffer.append(samples):
+                print(f"[{self.session_id}] Capture buffer full - processing")
+                break
+
+            # Debug output
+            if position >= next_status:  # Only update every 10 chunks
+                next_status = position + status_interval
+                self.set_status(f"Listening... (Level: {vad.level_db:.1f} dB, Silence: {vad.trailing_silence:.1f}s)")
+
+            # If we've collected speech and detected silence, stop recording
+            if vad.has_speech and vad.trailing_silence >= SILENCE_DURATION:
+                print(f"[{self.session_id}] Speech followed by silence detected - processing")
+                break
+
+            if vad.speech_duration >= MAX_UTTERANCE_DURATION:
+                print(f"[{self.session_id}] Maximum utterance length reached - processing")
+                break
+
+            if self.speculative and vad.has_speech:
+                self.update_speculation(vad)
+
+        if not vad.has_speech:
+            self.drop_speculation()
+            return None
+
+        return self.speech_samples(vad)
+
+    def speech_samples(self, vad):
+        """The recorded utterance without the pre-roll and trailing silence the detector didn't count as speech"""
+        samples = self.capture_buffer.samples()
+        end = len(samples) - int(max(vad.trailing_silence - TRIM_MARGIN, 0.0) * RATE)
+        start = len(samples) - int((vad.trailing_silence + vad.speech_duration + TRIM_MARGIN) * RATE)
+        return samples[max(start, 0):end]
+
+    def update_speculation(self, vad):
+        """Cancel the speculation if the caller kept talking; start one once a pause is long enough"""
+        if self.speculation is not None and not self.speculation.matches(vad.speech_duration):
+            self.drop_speculation()
+        if self.speculation is None and vad.trailing_silence >= SPECULATION_SILENCE:
+            # Copied, since the capture buffer keeps filling while the speculation runs
+            samples = self.speech_samples(vad).copy()
+            speculation = Speculation(vad.speech_duration)
+
+            async def transcribe():
+                started = time.perf_counter()
+                prepared = await self.loop.run_in_executor(None, self.stt.prepare, samples, RATE)
+                speculation.timings["encode"] = time.perf_counter() - started
+                started = time.perf_counter()
+                transcript = await self.transcribe_audio(prepared, report=False)
+                speculation.timings["stt"] = time.perf_counter() - started
+                return transcript
+
+            def stream(transcript):
+                speculation.key, speculation.cached = self.lookup_response(transcript)
+                if speculation.cached is not None:
+                    return cached_tokens(speculation.cached)
+                return self.llm_tokens(self.build_llm_messages(transcript))
+
+            self.speculation = speculation.start(transcribe, stream)
+            self.speculation_stats["started"] += 1
+
+    def drop_speculation(self):
+        if self.speculation is not None:
+            self.speculation.cancel()
+            self.speculation = None
+            self.speculation_stats["cancelled"] += 1
+
+    async def commit_speculation(self):
+        """Return the speculation if it covers the utterance just captured and its transcript succeeded"""
+        speculation = self.speculation
+        if speculation is None:
+            return None
+        if not speculation.matches(self.vad.speech_duration):
+            self.drop_speculation()
+            return None
+        self.speculation = None
+        try:
+            await speculation.transcript
+        except Exception as e:
+            print(f"[{self.session_id}] Speculative transcription failed: {e}")
+            speculation.cancel()
+            self.speculation_stats["cancelled"] += 1
+            return None
+        self.speculation_stats["committed"] += 1
+        return speculation
+
+    async def transcribe_audio(self, audio, report=True):
+        """Transcribe audio made ready by self.stt.prepare to text"""
+        try:
+            return await self.stt.transcribe(audio, LANGUAGES[self.language], self.route()["stt_prompt"])
+        except Exception as e:
+            if report:
+                self.set_status(f"Transcription error: {str(e)}")
+            raise
+
+    def build_system_message(self):
+        """Build the system prompt, which stays the same for the whole call so it can be cached"""
+        return {
+            "role": "system",
+            "content": f"""
+                You are a medical intake assistant for a radiology clinic.
+                Respond in {self.language} only.
+
+                Complete these tasks in order:
+                - Confirm the patient's phone number
+                - Collect patient demographic information (name, DOB, address)
+                - Collect insurance information (provider, policy number)
+                - Verify insurance eligibility
+                - Confirm imaging requirements
+                - Check availability for pre-op consultation
+
+                Be professional, friendly, and HIPAA compliant. Ask ONE question at a time.
+                Keep responses brief and conversational.
+                Never ask again for information listed as already collected.
+                {self.route()["instructions"] or ""}
+                """
+        }
+
+    def build_state_message(self):
+        """Build the per-turn state (current task and collected fields), sent after the turns"""
+        # Determine which task we're working on
+        current_task = TASKS[self.current_task_index] if self.current_task_index < len(TASKS) else "Follow-up"
+
+        return {
+            "role": "system",
+            "content": f"Current task: {current_task}\nCollected so far:\n{self.context.fields_text()}"
+        }
+
+    def add_to_history(self, role, content):
+        """Record a message in both the full transcript and the LLM context"""
+        self.conversation_history.append({"role": role, "content": content})
+        self.context.add(role, content)
+        if self.store:
+            self.store.message(self.session_id, role, content)
+
+    def restore(self, record):
+        """Rehydrate the conversation from a ConversationStore record (before start())"""
+        self.language = record["language"]
+        for message in record["messages"]:
+            self.conversation_history.append(dict(message))
+            self.context.add(message["role"], message["content"])
+            self.add_message("You" if message["role"] == "user" else "Assistant", message["content"])
+        self.context.update_fields(record["fields"])
+        if self.context.fields:
+            self.emit("fields", fields=dict(self.context.fields))
+        self.update_task_progress()
+
+    def build_llm_messages(self, text):
+        """Messages for the reply to text, without recording text in the history"""
+        return self.context.build_messages(self.build_system_message(), self.build_state_message(),
+                                           pending=[{"role": "user", "content": text}])
+
+    def response_key(self, text):
+        """Response cache key for the reply to text, or None if the turn must go to the model"""
+        if self.response_cache is None:
+            return None
+        if contains_phi(text):
+            self.response_cache.bypass()
+            return None
+        if not is_shared_intent(LANGUAGES[self.language], text):
+            self.response_cache.skip()
+            return None
+        current_task = TASKS[self.current_task_index] if self.current_task_index < len(TASKS) else "Follow-up"
+        # What the caller is answering: "yes" to one question isn't "yes" to another
+        previous = next((m["content"] for m in reversed(self.conversation_history) if m["role"] == "assistant"), "")
+        return response_key(self.language, current_task, self.context.fields, previous, text)
+
+    def lookup_response(self, text):
+        """(key, cached reply) for text; the key is None if the turn must go to the model"""
+        key = self.response_key(text)
+        return key, (self.response_cache.get(key) if key is not None else None)
+
+    def remember_response(self, key, reply, fields_before):
+        """Cache a reply if its turn collected nothing new and it says nothing about the caller"""
+        if key is not None and self.context.fields == fields_before and storable(reply, self.context.fields):
+            self.response_cache.put(key, reply)
+
+    async def process_with_llm(self, text):
+        """Process text with GPT; returns (reply, fields) from a single structured response"""
+        try:
+            key, cached = self.lookup_response(text)
+            if cached is not None:
+                self.add_to_history("user", text)
+                self.add_to_history("assistant", cached)
+                return cached, {}
+
+            # Generate a response from the LLM
+            fields_before = dict(self.context.fields)
+            route = self.route()
+            response = await self.api.chat(
+                model=route["model"],
+                messages=self.build_llm_messages(text),
+                temperature=0.7,
+                max_tokens=route["max_tokens"],
+                response_format=INTAKE_RESPONSE_FORMAT
+            )
+
+            # Extract the AI's response and the fields it collected
+            result = json.loads(response.choices[0].message.content)
+            ai_message = result["reply"]
+            fields = result.get("fields") or {}
+
+            # Record the exchange only once it succeeded, so a retried call isn't recorded twice
+            self.add_to_history("user", text)
+            self.add_to_history("assistant", ai_message)
+            self.record_fields(fields)
+            self.remember_response(key, ai_message, fields_before)
+
+            return ai_message, fields
+        except Exception as e:
+            self.set_status(f"Processing error: {str(e)}")
+            raise
+
+    async def llm_tokens(self, messages):
+        """Stream the structured intake reply for messages, yielding raw JSON text"""
+        route = self.route()
+        async for chunk in self.api.chat_stream(model=route["model"], messages=messages, temperature=0.7,
+                                                max_tokens=route["max_tokens"],
+                                                response_format=INTAKE_RESPONSE_FORMAT):
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+
+    async def stream_llm_sentences(self, text, prefetch=None, outcome=None):
+        """Stream the LLM reply and yield it one complete sentence at a time.
+
+        The response is JSON with the reply first and the extracted fields after
+        it; sentences are spoken from the reply while the fields are still being
+        generated. A committed speculation (prefetch) supplies the tokens instead
+        of a new request, and a turn found in the response cache is answered
+        without one. The reply isn't recorded here, since only the caller's
+        playback knows how much of it was heard: when the stream ends, outcome
+        (a dict) receives what record_reply() needs.
+        """
+        fields_before = dict(self.context.fields)
+        if prefetch is not None:
+            # The speculation already looked the transcript up in the response cache
+            key, cached = prefetch.key, prefetch.cached
+            tokens = prefetch.tokens()
+        else:
+            key, cached = self.lookup_response(text)
+            if cached is not None:
+                tokens = cached_tokens(cached)
+            else:
+                tokens = self.llm_tokens(self.build_llm_messages(text))
+
+        # Add the user's text to the conversation history
+        self.add_to_history("user", text)
+
+        splitter = SentenceSplitter()
+        parser = ReplyStreamParser()
+        trace = self.trace
+        trace.model = "cache" if cached is not None else self.route()["model"]
+        start = time.perf_counter()
+        complete = False
+        try:
+            async for token in tokens:
+                trace.mark("llm_first_token")
+                for sentence in splitter.feed(parser.feed(token)):
+                    yield sentence
+            for sentence in splitter.flush():
+                yield sentence
+            complete = True
+        finally:
+            if prefetch is not None:
+                prefetch.cancel()
+            trace.add("llm", time.perf_counter() - start)
+            if outcome is not None:
+                result = parser.result()
+                outcome.update(reply=parser.reply, fields=(result or {}).get("fields") or {}, complete=complete,
+                               key=key if cached is None else None, fields_before=fields_before)
+
+    def record_reply(self, text, outcome, heard):
+        """Record the assistant's turn as the caller heard it, and the fields it may keep.
+
+        heard are the sentences that reached the speaker. If that isn't the whole
+        reply (barge-in, a failed synthesis, a stopped session), the history gets
+        only those sentences and CUT_OFF_MARK. A field is then kept only if its
+        value appears in the caller's words or in what they heard; the rest are
+        extracted again on a later turn.
+        """
+        if not outcome:
+            return  # The LLM stage never ran
+        fields = outcome["fields"]
+        # Sentences are stripped when split, so compare without whitespace (CJK replies have none)
+        whole = "".join("".join(heard).split()) == "".join(outcome["reply"].split())
+        if outcome["complete"] and not self.interrupted and whole:
+            self.add_to_history("assistant", outcome["reply"])
+            self.record_fields(fields)
+            self.remember_response(outcome["key"], outcome["reply"], outcome["fields_before"])
+            return
+        spoken = " ".join(heard)
+        if spoken:
+            self.add_to_history("assistant", f"{spoken} {CUT_OFF_MARK}")
+        said = f"{text} {spoken}".lower()
+        self.record_fields({name: value for name, value in fields.items() if value and str(value).lower() in said})
+
+    def record_fields(self, fields):
+        """Merge fields extracted by the LLM and update the task checklist"""
+        before = dict(self.context.fields)
+        self.context.update_fields(fields)
+        if self.context.fields != before:
+            if self.store:
+                self.store.fields(self.session_id, self.context.fields)
+            self.emit("fields", fields=dict(self.context.fields))
+
+    def record_summary_fields(self, fields):
+        """Fields the context summarizer found in folded turns: saved and reported like any others"""
+        before = dict(self.context.fields)
+        self.record_fields(fields)
+        if self.context.fields != before:
+            self.update_task_progress()
+
+    async def respond_streaming(self, text, prefetch=None):
+        """Generate, synthesize and play the reply as overlapping stages.
+
+        The LLM streams sentences into one queue, a TTS task starts streaming
+        each sentence's audio as soon as it arrives, and this coroutine plays the
+        audio in order, each sentence from its first chunk. Sentence N plays while
+        N+1 is being synthesized and later ones are still being generated, so the
+        caller hears the first sentence long before the full reply exists. If
+        the caller talks over the reply, playback stops and the sentences still
+        being generated or synthesized are dropped.
+        """
+        sentence_queue = asyncio.Queue()
+        audio_queue = asyncio.Queue(maxsize=TTS_PREFETCH)
+        errors = []
+        done = object()
+
+        async def llm_stage():
+            try:
+                async for sentence in self.stream_llm_sentences(text, prefetch, outcome):
+                    sentence_queue.put_nowait(sentence)
+            except Exception as e:
+                errors.append(e)
+            sentence_queue.put_nowait(done)
+
+        async def tts_stage():
+            try:
+                while True:
+                    sentence = await sentence_queue.get()
+                    if sentence is done:
+                        break
+                    speech = self.synthesize_speech(sentence)
+                    try:
+                        await audio_queue.put((sentence, speech))
+                    except asyncio.CancelledError:
+                        speech.cancel()
+                        raise
+            except Exception as e:
+                errors.append(e)
+            await audio_queue.put(done)
+
+        async def playback_stage():
+            while True:
+                item = await audio_queue.get()
+                if item is done:
+                    break
+                sentence, speech = item
+
+                def show(sentence=sentence):
+                    if not heard:
+                        self.add_message("Assistant", "")
+                        started.set()
+                    heard.append(sentence)
+                    self.emit("append", text=sentence)
+
+                try:
+                    await self.play_traced(speech, show)
+                except Exception as e:
+                    errors.append(e)  # Synthesis failed; the sentences already played stand
+                    break
+                spoken.append(sentence)
+
+        outcome = {}
+        stages = [asyncio.ensure_future(llm_stage()), asyncio.ensure_future(tts_stage())]
+        spoken = []  # Sentences played to the end
+        heard = []  # Sentences that reached the speaker, including one cut off by a barge-in
+        started = asyncio.Event()  # Only talking over the assistant is a barge-in, not talking while it thinks
+        try:
+            await self.interruptible(playback_stage(), started)
+        finally:
+            # Stop generating and synthesizing if playback ended early or the session was stopped
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            while not audio_queue.empty():
+                item = audio_queue.get_nowait()
+                if item is not done:
+                    item[1].cancel()
+            self.record_reply(text, outcome, heard)
+
+        self.trace.mark("playback_end")
+        self.set_status("Listening...")
+        if errors:
+            self.set_status(f"Processing error: {str(errors[0])}")
+            self.add_message("System", f"Error: {str(errors[0])}")
+            self.trace.finish(errors[0])
+            if not spoken:
+                await self.speak_fallback()
+
+        return " ".join(spoken)
+
+    def synthesize_speech(self, text):
+        """Start synthesizing text; returns a SpeechStream of raw 16-bit PCM chunks at TTS_RATE"""
+        return SpeechStream(self.traced_speech(text))
+
+    async def traced_speech(self, text):
+        """Stream speech for text, timing synthesis up to its first chunk as part of the current turn"""
+        trace = self.trace
+        started = time.perf_counter()
+        first = True
+        async for chunk in synthesize_stream(self.tts, self.speech_cache, text, self.voice()):
+            if first:
+                trace.add("tts", time.perf_counter() - started)
+                trace.mark("first_audio")
+                first = False
+            yield chunk
+
+    async def play_traced(self, speech, on_start=None):
+        """Play a speech stream as it arrives, timing it as part of the current turn.
+
+        on_start() is called when the first chunk goes to the speaker.
+        """
+        trace = self.trace
+        timing = {}
+
+        async def chunks():
+            async for chunk in speech:
+                if not timing:
+                    trace.mark("playback_start")
+                    timing["started"] = time.perf_counter()
+                    if on_start:
+                        on_start()
+                yield chunk
+
+        try:
+            await self.play(chunks())
+        finally:
+            speech.cancel()
+            if timing:
+                trace.add("playback", time.perf_counter() - timing["started"])
+
+    async def play(self, chunks):
+        """Play an async iterator of PCM chunks on this session's output device; returns once it has been heard"""
+        self.set_status("Speaking...")
+        if self.player is None or self.player.device_index != self.output_device_index:
+            # First playback, or the speaker was changed during the call
+            if self.player is not None:
+                await self.run_blocking(self.player.close)
+            player = AudioPlayer(self.audio, self.output_device_index, TTS_RATE, PLAYBACK_CHUNK, self.loop,
+                                 self.playback_meter)
+            await self.run_blocking(player.open)
+            self.player = player
+        await self.player.play(chunks)
+
+    async def interruptible(self, playback, started=None):
+        """Run a playback coroutine, stopping it if the caller talks over the assistant.
+
+        Barge-in detection begins once started is set (immediately if it is None).
+        """
+        self.interrupted = False
+        task = asyncio.ensure_future(playback)
+        watcher = asyncio.ensure_future(self.watch_for_barge_in(started))
+        try:
+            done, _ = await asyncio.wait([task, watcher], return_when=asyncio.FIRST_COMPLETED)
+            if task not in done:
+                if watcher.result():
+                    # The player drops what is queued and goes quiet within one buffer
+                    task.cancel()
+                await asyncio.wait([task])
+            if not task.cancelled():
+                task.result()
+        finally:
+            watcher.cancel()
+            task.cancel()
+            await asyncio.gather(task, watcher, return_exceptions=True)
+
+    async def watch_for_barge_in(self, started=None):
+        """Listen for the caller talking over playback; returns True once they do"""
+        if started is not None:
+            await started.wait()
+        capture = self.capture
+        if not self.barge_in or capture is None or self.vad is None:
+            return False
+        detector = BargeInDetector(RATE, self.vad.noise_floor_db, self.playback_meter)
+        start = position = capture.position
+        while True:
+            try:
+                samples, position = await capture.read(position)
+            except IOError:
+                return False
+            onset = detector.process(samples)
+            if onset is not None:
+                break
+
+        self.interrupted = True
+        self.barge_in_position = start + onset
+        print(f"[{self.session_id}] Caller interrupted - stopping playback")
+        if self.trace is not None:
+            self.trace.mark("barge_in")
+        self.emit("barge_in")
+        return True
+
+    async def speak_text(self, text):
+        """Convert text to speech and play it"""
+        try:
+            self.set_status("Speaking...")
+            await self.interruptible(self.play_traced(self.synthesize_speech(text)))
+            self.trace.mark("playback_end")
+            self.set_status("Listening...")
+        except Exception as e:
+            self.set_status(f"Speech error: {str(e)}")
+            self.add_message("System", f"Speech error: {str(e)}")
+
+    async def prepare_fallback(self):
+        try:
+            await prepare_fallback(self.api, self.tts, self.speech_cache, self.fallbacks, self.language,
+                                   self.voice())
+        except Exception as e:
+            print(f"[{self.session_id}] Could not prepare fallback phrase: {e}")
+
+    async def speak_fallback(self):
+        """Apologise from the speech cache after a failed turn; returns False if nothing is cached"""
+        if not self.speech_cache or not self.fallbacks or self.audio is None:
+            return False
+        text = self.fallbacks.get(self.language)
+        audio = await cached_speech(self.tts, self.speech_cache, text, self.voice()) if text else None
+        if audio is None:
+            return False
+        self.add_message("Assistant", text)
+        try:
+            await self.interruptible(self.play(pcm_chunks(audio)))
+        except Exception as e:
+            print(f"[{self.session_id}] Could not play fallback phrase: {e}")
+            return False
+        self.set_status("Listening...")
+        return True
+
+    def update_task_progress(self):
+        """Update the task checklist from the collected fields"""
+        completed = tasks_completed(self.context.fields)
+        for index, (was_done, done) in enumerate(zip(self.completed_tasks, completed)):
+            if done and not was_done:
+                evidence = [self.context.fields[name] for name in TASK_FIELDS[index]]
+                self.emit("task", index=index, task=TASKS[index], evidence=evidence)
+        self.completed_tasks = completed
+
+        # Work on the first task that still has missing fields
+        self.current_task_index = next((i for i, done in enumerate(completed) if not done), len(TASKS))
+
+        self.emit("tasks", completed=list(completed))
+
+
+class SessionManager:
+    """Run many voice sessions on one event loop with shared audio and API clients"""
+
+    def __init__(self, api, audio=None, cache_dir=None, trace_path=None, store_path=None, stt=None, tts=None,
+                 watch_devices=True, response_cache=True):
+        self.api = api
+        self.stt = stt or create_transcriber(STT_PROVIDER, api)
+        self.tts = tts or create_speaker(TTS_PROVIDER, api)
+        self.router = Router()
+        self.audio = audio or pyaudio.PyAudio()
+        # Cached device list, format checks and one microphone/speaker pair per running session
+        self.devices = DeviceRegistry(self.audio)
+        self.devices.add_listener(self.devices_changed)
+        if watch_devices and isinstance(self.audio, pyaudio.PyAudio):
+            # A stand-in audio object (e.g. the benchmark's) has no hardware to watch
+            self.devices.start()
+        self.speech_cache = SpeechCache(cache_dir)
+        self.greetings = PhraseBook("greetings", cache_dir)
+        self.fallbacks = PhraseBook("fallbacks", cache_dir)
+        self.responses = ResponseCache() if response_cache else None
+        self.latency = LatencyRecorder(trace_path)
+        self.store = ConversationStore(store_path)
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+        # Sessions are tasks on this loop, which runs in a background thread
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+            max_workers=AUDIO_WORKERS, thread_name_prefix="audio"))
+        self.thread = threading.Thread(target=self.loop.run_forever, name="session-loop")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the session loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def create_session(self, **kwargs):
+        """Create a session that shares this manager's clients; call start() on it to begin"""
+        kwargs.setdefault("speech_cache", self.speech_cache)
+        kwargs.setdefault("greetings", self.greetings)
+        kwargs.setdefault("fallbacks", self.fallbacks)
+        kwargs.setdefault("response_cache", self.responses)
+        kwargs.setdefault("stt", self.stt)
+        kwargs.setdefault("tts", self.tts)
+        kwargs.setdefault("router", self.router)
+        kwargs.setdefault("latency", self.latency)
+        kwargs.setdefault("store", self.store)
+        session = VoiceSession(self.api, self.audio, self.loop, **kwargs)
+        with self.lock:
+            self.prune()
+            self.sessions[session.session_id] = session
+        return session
+
+    def start_session(self, session=None, **kwargs):
+        """Start a new session, or restart a stopped one and keep its conversation.
+
+        Raises DeviceError if its microphone or speaker is missing, can't handle
+        the pipeline's format or belongs to another running session.
+        """
+        if session is None:
+            session = self.create_session(**kwargs)
+        with self.lock:
+            self.bind_devices(session, session.input_device_index, session.output_device_index)
+            self.sessions[session.session_id] = session
+        session.start()
+        return session
+
+    def set_devices(self, session, input_device_index, output_device_index):
+        """Move a session to other devices, mid-call or not; raises DeviceError and leaves it unchanged"""
+        with self.lock:
+            if session.running:
+                self.devices.bind(session.session_id, input_device_index, output_device_index, RATE, TTS_RATE)
+            else:
+                self.devices.validate(input_device_index, RATE, input=True)
+                self.devices.validate(output_device_index, TTS_RATE, input=False)
+        # The session reopens its streams on the new devices at its next turn
+        session.input_device_index = input_device_index
+        session.output_device_index = output_device_index
+
+    def bind_devices(self, session, input_device_index, output_device_index):
+        """Reserve devices for a session about to start (call with the lock held)"""
+        # Devices of sessions that have ended are free again
+        for session_id in self.devices.bound():
+            other = self.sessions.get(session_id)
+            if other is None or not other.running:
+                self.devices.release(session_id)
+        if self.devices.stale and not any(s.running for s in self.sessions.values()):
+            # Hardware changed while calls were running; no stream is open now, so pick it up
+            self.devices.reinitialize()
+        self.devices.bind(session.session_id, input_device_index, output_device_index, RATE, TTS_RATE)
+
+    def devices_changed(self, changes):
+        """A device was plugged in or out, or a default changed (called on the device watcher thread)"""
+        with self.lock:
+            running = [s for s in self.sessions.values() if s.running]
+            if not running:
+                self.devices.reinitialize()
+                return
+        # Restarting PortAudio would cut off every call, so that waits until they have ended
+        removed = set(changes["removed"])
+        bound = self.devices.bound()
+        for session in running:
+            names = [self.devices.name(index) for index in bound.get(session.session_id, {}).values()]
+            lost = [name for name in names if name in removed]
+            if lost:
+                print(f"[{session.session_id}] Audio device unplugged: {', '.join(lost)}")
+                session.add_message("System", f"Audio device unplugged: {', '.join(lost)}. "
+                                              f"Plug it back in or choose another device.")
+
+    def resume_session(self, session_id, **kwargs):
+        """Start a session again from the conversation store, e.g. after a crash"""
+        record = self.store.load(session_id)
+        if record is None:
+            raise KeyError(f"No stored session {session_id}")
+        kwargs.setdefault("language", record["language"])
+        session = self.create_session(session_id=session_id, **kwargs)
+        session.restore(record)
+        return self.start_session(session)
+
+    async def warm_up(self, languages=None, voice=None):
+        """Pre-render the greeting and fallback phrase for every language so they play from the cache"""
+        async def warm(language):
+            language_voice = voice or self.router.voice(LANGUAGES[language], self.tts)
+            greeting = self.greetings.get(language)
+            if not greeting:
+                greeting = await generate_greeting(self.api, language)
+                await self.loop.run_in_executor(None, self.greetings.put, language, greeting)
+            await synthesize(self.tts, self.speech_cache, greeting, language_voice)
+            await prepare_fallback(self.api, self.tts, self.speech_cache, self.fallbacks, language, language_voice)
+
+        languages = list(languages or LANGUAGES.keys())
+        results = await asyncio.gather(*(warm(language) for language in languages), return_exceptions=True)
+        for language, result in zip(languages, results):
+            if isinstance(result, Exception):
+                print(f"Could not warm up greeting for {language}: {result}")
+        print(f"Greeting cache warmed up: {self.speech_cache.stats()}")
+
+    def prune(self):
+        """Forget sessions that have finished (call with the lock held)"""
+        for session_id in [sid for sid, s in self.sessions.items() if s.future and not s.running]:
+            del self.sessions[session_id]
+            self.devices.release(session_id)
+
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def stop_session(self, session_id):
+        session = self.get(session_id)
+        if session:
+            session.stop()
+
+    def stop_all(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.stop()
+
+    def join(self, timeout=None):
+        """Wait for every running session to finish"""
+        with self.lock:
+            futures = [s.future for s in self.sessions.values() if s.future]
+        concurrent.futures.wait(futures, timeout)
+
+    def close(self):
+        self.stop_all()
+        self.join(timeout=5)
+        try:
+            self.submit(self.api.aclose()).result(timeout=5)
+        except Exception as e:
+            print(f"Error closing API client: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.stt.close()
+        self.tts.close()
+        self.devices.stop()
+        self.audio.terminate()
+        self.latency.close()
+        self.store.close()
+
+
+def print_event(session, event, data):
+    """Console event handler for headless sessions"""
+    if event == "message":
+        print(f"\n[{session.session_id}] {data['speaker']}: {data['text']}", end="", flush=True)
+    elif event == "append":
+        print(f" {data['text']}", end="", flush=True)
+    elif event == "tasks":
+        done = sum(data["completed"])
+        print(f"\n[{session.session_id}] Tasks completed: {done}/{len(TASKS)}")
+    elif event == "stopped":
+        print(f"\n[{session.session_id}] Session ended")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a headless voice assistant session")
+    parser.add_argument("--language", default="English", choices=list(LANGUAGES.keys()))
+    parser.add_argument("--input-device", type=int, default=None)
+    parser.add_argument("--output-device", type=int, default=None)
+    parser.add_argument("--warm-up", action="store_true", help="pre-render greetings for every language first")
+    parser.add_argument("--trace", default=None, help="append per-turn timings to this JSON lines file")
+    parser.add_argument("--resume", metavar="SESSION_ID", default=None,
+                        help="continue a stored session; \"last\" picks the most recent unfinished one")
+    parser.add_argument("--unfinished", action="store_true", help="list sessions that never ended cleanly and exit")
+    parser.add_argument("--stt", default=STT_PROVIDER, choices=PROVIDERS, help="speech-to-text provider")
+    parser.add_argument("--tts", default=TTS_PROVIDER, choices=PROVIDERS, help="text-to-speech provider")
+    parser.add_argument("--no-response-cache", action="store_true",
+                        help="send every turn to the model, even ones other callers have had answered")
+    args = parser.parse_args()
+
+    api = OpenAIPool()  # Uses the OPENAI_API_KEY environment variable
+    manager = SessionManager(api, trace_path=args.trace, stt=create_transcriber(args.stt, api),
+                             tts=create_speaker(args.tts, api), response_cache=not args.no_response_cache)
+    if args.unfinished:
+        for record in manager.store.unfinished():
+            print(f"{record['session_id']}  {record['language']:<10} last active {time.ctime(record['updated'])}")
+        manager.close()
+        return
+    if args.warm_up:
+        manager.submit(manager.warm_up()).result()
+
+    devices = dict(input_device_index=args.input_device, output_device_index=args.output_device, on_event=print_event)
+    if args.resume:
+        session_id = args.resume
+        if session_id == "last":
+            unfinished = manager.store.unfinished()
+            if not unfinished:
+                print("No unfinished sessions to resume")
+                manager.close()
+                return
+            session_id = unfinished[0]["session_id"]
+    try:
+        if args.resume:
+            manager.resume_session(session_id, **devices)
+        else:
+            manager.start_session(language=args.language, **devices)
+    except DeviceError as e:
+        print(f"Audio device error: {e}\nList the devices with: python devices.py")
+        manager.close()
+        sys.exit(1)
+    try:
+        manager.join()
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        if manager.latency.count:
+            print(f"\nLatency over {manager.latency.count} turn(s):\n{manager.latency.format_summary()}")
+        if manager.responses:
+            print(f"Response cache: {manager.responses.stats()}")
+        manager.close()
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
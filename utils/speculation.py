@@ -0,0 +1,75 @@
+"""Speculative transcription and LLM prefetch.
+
+When the caller pauses, the endpointer still waits SILENCE_DURATION before it
+ends the turn. With speculation enabled, the session uses that wait: once the
+pause reaches SPECULATION_SILENCE it transcribes what has been said so far
+and starts the LLM request for that transcript, buffering the reply tokens.
+
+If the caller keeps talking, the speculation is cancelled (which aborts its
+HTTP requests) and a new one starts at the next pause. If the endpoint then
+confirms the same speech, the speculative transcript is the final one and
+the turn replays the buffered tokens instead of making a second request, so
+short answers like a date of birth get their reply almost immediately.
+
+The session records what a committed turn needs from the speculation on it:
+the encode and stt times in timings, and the response cache key and cached
+reply (if the reply came from the cache rather than the model).
+"""
+import time
+import asyncio
+
+_END = object()
+
+
+class Speculation:
+    """A transcript and reply stream started before the end of the utterance was confirmed"""
+
+    def __init__(self, speech_duration):
+        self.speech_duration = speech_duration  # Speech the transcript covers, in seconds of audio
+        self.started = time.perf_counter()
+        self.transcript = asyncio.get_running_loop().create_future()
+        # Nobody awaits the transcript if the speculation is dropped; don't log its error
+        self.transcript.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.timings = {}  # Pipeline stage -> seconds, for the turn's trace
+        self.key = None  # Response cache key of the transcript, if it may be cached
+        self.cached = None  # Cached reply the tokens replay, if any
+
+    def start(self, transcribe, stream):
+        """Run transcribe() and then stream(transcript) in the background, buffering tokens"""
+        self.task = asyncio.ensure_future(self._run(transcribe, stream))
+        return self
+
+    async def _run(self, transcribe, stream):
+        try:
+            transcript = await transcribe()
+            self.transcript.set_result(transcript)
+            if transcript.strip():
+                async for token in stream(transcript):
+                    self.queue.put_nowait(token)
+            self.queue.put_nowait(_END)
+        except Exception as e:
+            if not self.transcript.done():
+                self.transcript.set_exception(e)
+            self.queue.put_nowait(e)
+
+    def matches(self, speech_duration):
+        """Whether the speculation covers exactly this much speech"""
+        return abs(self.speech_duration - speech_duration) < 1e-6
+
+    async def tokens(self):
+        """Yield the reply tokens, including those that arrived before the turn was committed"""
+        while True:
+            item = await self.queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+        if not self.transcript.done():
+            self.transcript.cancel()
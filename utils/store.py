@@ -0,0 +1,194 @@
+"""Durable conversation store.
+
+Every session's turns and collected intake fields are appended to a SQLite
+database in WAL mode, so a call survives a crash or restart of the
+assistant and can be picked up where it left off (SessionManager.resume_session).
+
+Writes never block the event loop: sessions put rows on a queue and one
+writer thread commits them in batches, so a burst of turns from many callers
+costs one fsync per batch rather than one per row. A row is durable at most
+FLUSH_INTERVAL after it was queued.
+
+The database holds patient information; keep VOICE_DB_PATH on encrypted
+storage with the same access controls as the clinic's other records.
+"""
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+
+DEFAULT_DB_PATH = os.environ.get(
+    "VOICE_DB_PATH",
+    os.path.join(os.path.expanduser("~"), ".local", "share", "healthcare-voice-assistant", "conversations.db")
+)
+FLUSH_INTERVAL = 0.2  # Seconds the writer waits to gather more rows into one transaction
+BATCH_SIZE = 256  # Rows committed per transaction at most
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    language TEXT NOT NULL,
+    started REAL NOT NULL,
+    updated REAL NOT NULL,
+    ended REAL,
+    status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL REFERENCES sessions(session_id),
+    time REAL NOT NULL,
+    kind TEXT NOT NULL,
+    role TEXT,
+    content TEXT
+);
+CREATE INDEX IF NOT EXISTS events_by_session ON events (session_id, time);
+CREATE INDEX IF NOT EXISTS sessions_by_time ON sessions (updated);
+"""
+
+_STOP = object()
+
+
+class ConversationStore:
+    """Append-only SQLite log of sessions, written in batches by a background thread"""
+
+    def __init__(self, path=None, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE):
+        self.path = path or DEFAULT_DB_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.errors = 0
+
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        conn.close()
+
+        self.thread = threading.Thread(target=self._write_loop, name="conversation-store")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Each batch's commit is fsynced; batching keeps that to one fsync per FLUSH_INTERVAL
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    # Writes (non-blocking; safe from any thread)
+
+    def open_session(self, session_id, language):
+        """Record that a session started (or restarted after a stop or crash)"""
+        now = time.time()
+        self.queue.put((
+            "INSERT INTO sessions (session_id, language, started, updated, ended, status) "
+            "VALUES (?, ?, ?, ?, NULL, 'active') "
+            "ON CONFLICT(session_id) DO UPDATE SET language = excluded.language, "
+            "updated = excluded.updated, ended = NULL, status = 'active'",
+            (session_id, language, now, now)
+        ))
+
+    def end_session(self, session_id, status):
+        now = time.time()
+        self.queue.put(("UPDATE sessions SET ended = ?, updated = ?, status = ? WHERE session_id = ?",
+                        (now, now, status, session_id)))
+
+    def append(self, session_id, kind, role=None, content=None):
+        now = time.time()
+        self.queue.put(("INSERT INTO events (session_id, time, kind, role, content) VALUES (?, ?, ?, ?, ?)",
+                        (session_id, now, kind, role, content)))
+        self.queue.put(("UPDATE sessions SET updated = ? WHERE session_id = ?", (now, session_id)))
+
+    def message(self, session_id, role, content):
+        self.append(session_id, "message", role, content)
+
+    def fields(self, session_id, fields):
+        """Record the full set of fields collected so far"""
+        self.append(session_id, "fields", content=json.dumps(fields, ensure_ascii=False))
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            statements = [item for item in batch if isinstance(item, tuple)]
+            try:
+                with conn:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"Conversation store write failed ({len(statements)} rows lost): {e}")
+
+            # Wake flush() callers once everything queued before them is committed
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if batch[-1] is _STOP:
+                conn.close()
+                return
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been committed"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.thread.join(timeout=10)
+
+    # Reads (blocking; run them off the event loop)
+
+    def sessions(self, since=None, until=None, unfinished=False):
+        """Sessions updated within [since, until], most recent first"""
+        query = "SELECT session_id, language, started, updated, ended, status FROM sessions WHERE updated >= ? AND updated <= ?"
+        if unfinished:
+            query += " AND ended IS NULL"
+        query += " ORDER BY updated DESC"
+        conn = self._connect()
+        try:
+            rows = conn.execute(query, (since or 0, until or float("inf"))).fetchall()
+        finally:
+            conn.close()
+        keys = ("session_id", "language", "started", "updated", "ended", "status")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def unfinished(self):
+        """Sessions that never ended cleanly, e.g. because the process crashed"""
+        return self.sessions(unfinished=True)
+
+    def load(self, session_id):
+        """Return a session's language, messages and collected fields, or None"""
+        conn = self._connect()
+        try:
+            session = conn.execute("SELECT language, status FROM sessions WHERE session_id = ?",
+                                   (session_id,)).fetchone()
+            if session is None:
+                return None
+            events = conn.execute("SELECT kind, role, content FROM events WHERE session_id = ? ORDER BY id",
+                                  (session_id,)).fetchall()
+        finally:
+            conn.close()
+
+        messages = []
+        fields = {}
+        for kind, role, content in events:
+            if kind == "message":
+                messages.append({"role": role, "content": content})
+            elif kind == "fields":
+                fields = json.loads(content)
+        return {"session_id": session_id, "language": session[0], "status": session[1],
+                "messages": messages, "fields": fields}
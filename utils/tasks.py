@@ -0,0 +1,37 @@
+"""Task progress for intake calls.
+
+During a call the checklist is driven by the structured fields the LLM
+extracts every turn: a task is complete once all of its TASK_FIELDS are
+known (see tasks_completed).
+
+Progress is not guessed from keywords in the transcript. A keyword can't
+tell the assistant asking for a phone number from the caller giving one,
+and the extracted field is what the intake needs anyway. Checking the
+fields costs the same on the first turn and the fiftieth, and
+VoiceSession.update_task_progress keeps each task's state and emits a
+"task" event, with the field values as evidence, when one completes.
+"""
+# Define the tasks from your mockup
+TASKS = [
+    "Greeting,find out reason for call",
+    "Collect patient demographic information",
+    "Collect insurance information",
+    "Verify insurance eligibility",
+    "Confirm imaging requirements",
+    "Check availability for pre-op consult"
+]
+
+# Intake fields (see context.FIELDS) that must all be known for each task to be complete
+TASK_FIELDS = [
+    ["reason_for_call"],
+    ["phone", "name", "date_of_birth", "address"],
+    ["insurance_provider", "policy_number"],
+    ["eligibility"],
+    ["imaging"],
+    ["availability"]
+]
+
+
+def tasks_completed(fields):
+    """Return the completion state of each task given the collected fields"""
+    return [all(fields.get(name) for name in required) for required in TASK_FIELDS]
@@ -1,11 +1,5 @@
-import pyaudio
+"""List the audio devices and check them against the assistant's formats (same as python devices.py)"""
+from devices import main
 
-p = pyaudio.PyAudio()
-info = p.get_host_api_info_by_index(0)
-numdevices = info.get('deviceCount')
-
-for i in range(0, numdevices):
-    if p.get_device_info_by_host_api_device_index(0, i).get('maxInputChannels') > 0:
-        print(f"Input Device id {i} - {p.get_device_info_by_host_api_device_index(0, i).get('name')}")
-
-p.terminate()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Per-turn latency tracing for the voice pipeline.
+
+Every turn gets a TurnTrace with its own trace ID. The session records how
+long each stage took and when the milestones the caller notices were reached,
+all in seconds:
+
+    stages  capture      speech in the utterance (audio time)
+            endpoint     silence waited through before the turn ended (audio time)
+            encode       resampling and encoding the upload
+            stt          transcription request
+            llm          LLM request, from sending it to the end of the stream
+            tts          synthesis up to the first audio chunk, summed over the
+                         reply's sentences (the rest streams while it plays)
+            playback     from the first chunk reaching the speaker until the last
+                         sample has been heard, summed over the sentences
+    marks   llm_first_token, first_audio, playback_start, playback_end
+            (time since the turn started, i.e. since the endpoint was detected)
+
+A LatencyRecorder collects finished traces, appends them to a JSON lines file
+and keeps recent values per stage for p50/p95/p99 summaries and histograms.
+
+Run directly to summarize a trace file:
+    python tracing.py traces.jsonl
+"""
+import sys
+import json
+import time
+import uuid
+import threading
+import contextlib
+from collections import deque
+import numpy as np
+
+STAGES = ["capture", "endpoint", "encode", "stt", "llm", "tts", "playback"]
+MARKS = ["llm_first_token", "first_audio", "playback_start", "playback_end"]
+PERCENTILES = [50, 95, 99]
+WINDOW = 1000  # Recent values kept per stage for percentiles
+HISTOGRAM_EDGES = [0, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, float("inf")]
+
+
+class TurnTrace:
+    """Stage timings and milestones for one turn"""
+
+    def __init__(self, session_id, turn, language, source="voice"):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.turn = turn
+        self.language = language
+        self.source = source  # "voice", "text" or "greeting"
+        self.model = None  # Chat model that wrote the reply
+        self.wall_time = time.time()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.marks = {}
+        self.total = None
+        self.error = None
+
+    def add(self, stage, seconds):
+        """Add time to a stage (repeated stages such as tts are summed)"""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed block as part of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def mark(self, name):
+        """Record the first time a milestone is reached"""
+        self.marks.setdefault(name, time.perf_counter() - self.started)
+
+    def finish(self, error=None):
+        if self.total is None:
+            self.total = time.perf_counter() - self.started
+        if error is not None and self.error is None:
+            self.error = str(error)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "session_id": self.session_id,
+            "turn": self.turn,
+            "language": self.language,
+            "source": self.source,
+            "model": self.model,
+            "time": self.wall_time,
+            "total": self.total,
+            "stages": {name: round(value, 4) for name, value in self.stages.items()},
+            "marks": {name: round(value, 4) for name, value in self.marks.items()},
+            "error": self.error
+        }
+
+
+class LatencyRecorder:
+    """Collect finished traces, export them as JSON lines and summarize them per stage"""
+
+    def __init__(self, path=None, window=WINDOW):
+        self.path = path
+        self.window = window
+        self.values = {}  # metric -> deque of recent seconds
+        self.count = 0
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8", buffering=1) if path else None
+
+    def record(self, trace):
+        """Add a finished trace (TurnTrace or its dict form)"""
+        data = trace.to_dict() if isinstance(trace, TurnTrace) else trace
+        with self.lock:
+            self.count += 1
+            for name, value in metrics(data).items():
+                self.values.setdefault(name, deque(maxlen=self.window)).append(value)
+            if self.file:
+                # Line buffered: one short write per turn, visible to readers immediately
+                self.file.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+    def summary(self):
+        """Return {metric: {"count", "p50", "p95", "p99", "max"}} over recent turns"""
+        with self.lock:
+            values = {name: np.array(series) for name, series in self.values.items()}
+        result = {}
+        for name in ordered(values):
+            series = values[name]
+            row = {"count": len(series)}
+            for p, value in zip(PERCENTILES, np.percentile(series, PERCENTILES)):
+                row[f"p{p}"] = float(value)
+            row["max"] = float(series.max())
+            result[name] = row
+        return result
+
+    def histogram(self, metric, edges=HISTOGRAM_EDGES):
+        """Return [(low, high, count)] for one metric"""
+        with self.lock:
+            series = np.array(self.values.get(metric, ()))
+        counts, _ = np.histogram(series, bins=edges)
+        return [(low, high, int(count)) for low, high, count in zip(edges[:-1], edges[1:], counts)]
+
+    def format_summary(self):
+        lines = [f"{'stage':<16}{'count':>7}" + "".join(f"{f'p{p}':>9}" for p in PERCENTILES) + f"{'max':>9}"]
+        for name, row in self.summary().items():
+            lines.append(f"{name:<16}{row['count']:>7}"
+                         + "".join(f"{row[f'p{p}']:>9.3f}" for p in PERCENTILES) + f"{row['max']:>9.3f}")
+        return "\n".join(lines)
+
+    def format_histogram(self, metric, width=40):
+        rows = [row for row in self.histogram(metric) if row[2]]
+        if not rows:
+            return f"{metric}: no data"
+        peak = max(count for _, _, count in rows)
+        lines = [f"{metric}:"]
+        for low, high, count in rows:
+            label = f"{low:g}-{high:g}s" if high != float("inf") else f">{low:g}s"
+            lines.append(f"  {label:>10} {'#' * max(1, count * width // peak)} {count}")
+        return "\n".join(lines)
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+def metrics(data):
+    """Flatten a trace dict into {metric: seconds}"""
+    values = dict(data.get("stages") or {})
+    values.update(data.get("marks") or {})
+    if data.get("total") is not None:
+        values["total"] = data["total"]
+    return values
+
+
+def ordered(names):
+    """Known stages and marks in pipeline order, then anything else"""
+    known = [name for name in STAGES + MARKS + ["total"] if name in names]
+    return known + sorted(set(names) - set(known))
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python tracing.py traces.jsonl [more.jsonl ...]")
+        sys.exit(1)
+
+    recorder = LatencyRecorder()
+    for path in sys.argv[1:]:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    recorder.record(json.loads(line))
+    print(f"{recorder.count} turn(s)\n")
+    print(recorder.format_summary())
+    for name in ("llm_first_token", "first_audio", "total"):
+        print()
+        print(recorder.format_histogram(name))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compact audio for Whisper uploads.
+
+The microphone runs at 44.1 kHz, but Whisper works on 16 kHz audio and
+resamples everything it receives, so each utterance is resampled here before
+upload: 2.75x fewer bytes on the wire for the same transcript. The resampler
+is a windowed-sinc polyphase filter evaluated with NumPy, one block of output
+samples at a time.
+
+The resampled audio is encoded as FLAC (lossless, roughly half the size of
+WAV for speech) or Opus when the optional soundfile package is installed,
+and as WAV otherwise.
+"""
+import io
+import math
+import functools
+import numpy as np
+from audio_buffer import encode_wav
+
+try:
+    import soundfile
+except Exception:  # Also raised as OSError when libsndfile itself is missing
+    soundfile = None
+
+UPLOAD_RATE = 16000  # Whisper's native sample rate
+UPLOAD_FORMAT = "flac"  # "flac", "opus" or "wav"
+HALF_ZERO_CROSSINGS = 8  # Sinc lobes on each side of the filter centre
+CUTOFF = 0.9  # Low-pass cutoff as a fraction of the lower of the two Nyquist frequencies
+BLOCK_SAMPLES = 8192  # Output samples computed per block, bounding the temporary tap matrix
+
+# format -> (soundfile format, subtype, upload file name)
+ENCODINGS = {
+    "flac": ("FLAC", "PCM_16", "speech.flac"),
+    "opus": ("OGG", "OPUS", "speech.ogg")
+}
+
+_warned = set()
+
+
+@functools.lru_cache(maxsize=8)
+def polyphase_filter(rate, target_rate):
+    """Return (up, down, taps, offsets, weights) for resampling rate to target_rate"""
+    divisor = math.gcd(rate, target_rate)
+    up, down = target_rate // divisor, rate // divisor
+
+    # Cutoff in cycles per input sample; downsampling must remove everything above the new Nyquist
+    cutoff = CUTOFF * 0.5 * min(1.0, target_rate / float(rate))
+    half = int(math.ceil(HALF_ZERO_CROSSINGS / (2.0 * cutoff)))
+    taps = np.arange(-half + 1, half + 1)
+
+    # Output sample k sits at input position k * down / up; its fractional part repeats every up outputs
+    phases = np.arange(up)
+    offsets = phases * down // up
+    fractions = (phases * down % up) / float(up)
+    t = taps[np.newaxis, :] - fractions[:, np.newaxis]
+    window = 0.5 * (1.0 + np.cos(np.pi * t / half))
+    weights = np.sinc(2.0 * cutoff * t) * window
+    # Unity gain at DC for every phase
+    weights /= weights.sum(axis=1, keepdims=True)
+    return up, down, taps, offsets, weights.astype(np.float32)
+
+
+def resample(samples, rate, target_rate=UPLOAD_RATE):
+    """Resample int16 mono samples to target_rate"""
+    samples = np.asarray(samples, dtype=np.int16)
+    if rate == target_rate or len(samples) == 0:
+        return samples
+
+    up, down, taps, offsets, weights = polyphase_filter(rate, target_rate)
+    half = len(taps) // 2
+    padded = np.pad(samples.astype(np.float32), (half, half))
+    count = len(samples) * up // down
+    output = np.empty(count, dtype=np.int16)
+
+    for start in range(0, count, BLOCK_SAMPLES):
+        k = np.arange(start, min(start + BLOCK_SAMPLES, count))
+        phase = k % up
+        base = (k // up) * down + offsets[phase] + half
+        block = padded[base[:, np.newaxis] + taps[np.newaxis, :]]
+        values = np.einsum("ij,ij->i", block, weights[phase])
+        output[start:start + len(k)] = np.clip(np.rint(values), -32768, 32767)
+    return output
+
+
+def encode_upload(samples, rate, target_rate=UPLOAD_RATE, audio_format=UPLOAD_FORMAT):
+    """Resample and encode an utterance in memory, ready for the transcription endpoint"""
+    samples = resample(samples, rate, target_rate)
+    if audio_format in ENCODINGS:
+        if soundfile is not None:
+            container, subtype, name = ENCODINGS[audio_format]
+            try:
+                upload = io.BytesIO()
+                soundfile.write(upload, samples, target_rate, format=container, subtype=subtype)
+                upload.seek(0)
+                # The OpenAI client uses the name to tell Whisper the file format
+                upload.name = name
+                return upload
+            except Exception as e:
+                _warn(audio_format, f"{audio_format} encoding failed ({e}); uploading WAV")
+        else:
+            _warn(audio_format, f"soundfile is not installed; uploading WAV instead of {audio_format}")
+    return encode_wav(samples, target_rate)
+
+
+def _warn(key, message):
+    """Print a fallback warning once per format"""
+    if key not in _warned:
+        _warned.add(key)
+        print(message)
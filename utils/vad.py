@@ -0,0 +1,214 @@
+"""Voice activity detection for the voice assistant.
+
+The detector works on fixed-length frames of 16-bit mono audio. For every
+frame it computes the energy (in dB) and the zero-crossing rate, compares them
+against a noise floor measured during calibration, and smooths the raw
+decisions with an onset requirement and a hangover so short pauses between
+words don't end the utterance.
+
+Any object with the same calibrate/process/reset methods and the
+has_speech/trailing_silence/speech_duration properties can be plugged into
+VoiceSession.vad_factory (session.py) instead.
+
+Run directly to check a recording offline:
+    python vad.py recording.wav
+"""
+import sys
+import wave
+import numpy as np
+
+# Detector parameters
+FRAME_MS = 20  # Analysis frame length
+MARGIN_DB = 9.0  # How far above the noise floor a frame must be to count as speech
+FRICATIVE_MARGIN_DB = 4.5  # Lower margin for frames with a high zero-crossing rate ("s", "f", "sh")
+FRICATIVE_ZCR = 0.25  # Zero crossings per sample above which a quiet frame may still be speech
+MIN_NOISE_FLOOR_DB = -60.0  # Digital silence would otherwise make every click look like speech
+DEFAULT_NOISE_FLOOR_DB = -50.0  # Used until calibrate() is called
+NOISE_ADAPT_RATE = 0.05  # Per-frame weight of non-speech frames when tracking the noise floor
+ONSET_MS = 60  # Consecutive speech needed before an utterance starts
+HANGOVER_MS = 300  # Speech state is held this long after the last speech frame
+HISTORY_FRAMES = 50  # Frames of features kept in the ring buffer (1 second at 20 ms)
+
+
+def frame_features(frames):
+    """Return (energy_db, zero_crossing_rate) for a 2-D array of int16 frames"""
+    samples = frames.astype(np.float32) / 32768.0
+    energy = np.mean(samples * samples, axis=1)
+    energy_db = 10.0 * np.log10(energy + 1e-10)
+    signs = np.signbit(samples)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / float(frames.shape[1] - 1)
+    return energy_db, zcr
+
+
+class VoiceActivityDetector:
+    """Energy and zero-crossing voice activity detector with an adaptive noise floor"""
+
+    def __init__(self, rate, frame_ms=FRAME_MS, margin_db=MARGIN_DB,
+                 onset_ms=ONSET_MS, hangover_ms=HANGOVER_MS):
+        self.rate = rate
+        self.frame_length = int(rate * frame_ms / 1000)
+        self.frame_duration = self.frame_length / float(rate)
+        self.margin_db = margin_db
+        self.onset_frames = max(1, int(round(onset_ms / frame_ms)))
+        self.hangover_frames = max(0, int(round(hangover_ms / frame_ms)))
+        self.noise_floor_db = DEFAULT_NOISE_FLOOR_DB
+
+        # Ring buffer of per-frame features, used for level reporting
+        self.energy_history = np.full(HISTORY_FRAMES, DEFAULT_NOISE_FLOOR_DB, dtype=np.float32)
+        self.zcr_history = np.zeros(HISTORY_FRAMES, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        """Forget the current utterance but keep the calibrated noise floor"""
+        self._pending = np.zeros(0, dtype=np.int16)  # Samples that don't fill a whole frame yet
+        self._frame_count = 0
+        self._run = 0  # Consecutive raw speech frames at the end of the last batch
+        self._last_confirmed = -self.hangover_frames - 1  # Frame index of the last confirmed speech frame
+        self._first_speech = None
+        self._last_speech = None
+        self.energy_history.fill(self.noise_floor_db)
+        self.zcr_history.fill(0)
+
+    def calibrate(self, samples):
+        """Measure the noise floor from audio that is known not to contain speech"""
+        frames = self._split_frames(np.asarray(samples, dtype=np.int16))
+        if len(frames) == 0:
+            return
+        energy_db, _ = frame_features(frames)
+        # The median ignores a stray click or the tail of the previous prompt
+        self.noise_floor_db = max(float(np.median(energy_db)), MIN_NOISE_FLOOR_DB)
+        print(f"VAD noise floor calibrated to {self.noise_floor_db:.1f} dB")
+
+    def process(self, samples):
+        """Feed int16 samples and return the smoothed speech decision for each completed frame"""
+        samples = np.concatenate((self._pending, np.asarray(samples, dtype=np.int16)))
+        frames = self._split_frames(samples)
+        self._pending = samples[len(frames) * self.frame_length:]
+        if len(frames) == 0:
+            return np.zeros(0, dtype=bool)
+
+        energy_db, zcr = frame_features(frames)
+        self._record_history(energy_db, zcr)
+
+        threshold = self.noise_floor_db + self.margin_db
+        fricative_threshold = self.noise_floor_db + FRICATIVE_MARGIN_DB
+        raw = (energy_db > threshold) | ((energy_db > fricative_threshold) & (zcr > FRICATIVE_ZCR))
+
+        speech = self._smooth(raw)
+        self._adapt_noise_floor(energy_db[~raw])
+        return speech
+
+    def _split_frames(self, samples):
+        count = len(samples) // self.frame_length
+        return samples[:count * self.frame_length].reshape(count, self.frame_length)
+
+    def _record_history(self, energy_db, zcr):
+        count = min(len(energy_db), HISTORY_FRAMES)
+        positions = (self._frame_count + np.arange(len(energy_db) - count, len(energy_db))) % HISTORY_FRAMES
+        self.energy_history[positions] = energy_db[-count:]
+        self.zcr_history[positions] = zcr[-count:]
+
+    def _smooth(self, raw):
+        """Apply the onset requirement and hangover to raw frame decisions"""
+        count = len(raw)
+        indices = self._frame_count + np.arange(count)
+
+        # Length of the run of consecutive speech frames ending at each frame
+        totals = np.cumsum(raw)
+        at_last_gap = np.maximum.accumulate(np.where(raw, 0, totals))
+        runs = totals - at_last_gap
+        runs = runs + np.where(np.logical_or.accumulate(~raw), 0, self._run)
+
+        # Speech is confirmed after the onset run and held for the hangover
+        confirmed = runs >= self.onset_frames
+        last_confirmed = np.maximum.accumulate(np.where(confirmed, indices, self._last_confirmed))
+        speech = (indices - last_confirmed) <= self.hangover_frames
+
+        if confirmed.any():
+            if self._first_speech is None:
+                self._first_speech = int(indices[np.argmax(confirmed)]) - self.onset_frames + 1
+            self._last_speech = int(indices[confirmed][-1])
+        self._run = int(runs[-1])
+        self._last_confirmed = int(last_confirmed[-1])
+        self._frame_count += count
+        return speech
+
+    def _adapt_noise_floor(self, noise_db):
+        """Track slow changes in background noise using frames classified as non-speech"""
+        if len(noise_db) == 0:
+            return
+        keep = (1.0 - NOISE_ADAPT_RATE) ** len(noise_db)
+        floor = keep * self.noise_floor_db + (1.0 - keep) * float(np.mean(noise_db))
+        self.noise_floor_db = max(floor, MIN_NOISE_FLOOR_DB)
+
+    @property
+    def has_speech(self):
+        """Whether speech has been confirmed since the last reset"""
+        return self._first_speech is not None
+
+    @property
+    def trailing_silence(self):
+        """Seconds since the last confirmed speech frame (0 before any speech)"""
+        if self._last_speech is None:
+            return 0.0
+        return (self._frame_count - 1 - self._last_speech) * self.frame_duration
+
+    @property
+    def speech_duration(self):
+        """Seconds from the onset of speech to the last confirmed speech frame"""
+        if self._first_speech is None:
+            return 0.0
+        return (self._last_speech - self._first_speech + 1) * self.frame_duration
+
+    @property
+    def level_db(self):
+        """Average energy over the ring buffer, relative to the noise floor"""
+        return float(np.mean(self.energy_history)) - self.noise_floor_db
+
+
+def read_wav(path):
+    """Read a 16-bit mono WAV file and return (samples, rate)"""
+    with wave.open(path, 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16-bit samples, got {8 * wf.getsampwidth()}-bit")
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        if wf.getnchannels() > 1:
+            samples = samples.reshape(-1, wf.getnchannels())[:, 0]
+        return samples, wf.getframerate()
+
+
+def detect_segments(samples, rate, calibration_seconds=0.25, detector=None):
+    """Run the detector over a whole recording and return speech segments as (start, end) seconds.
+
+    The first calibration_seconds of audio are used to measure the noise floor,
+    the same way VoiceSession.open_capture calibrates before listening.
+    """
+    vad = detector or VoiceActivityDetector(rate)
+    calibration = int(calibration_seconds * rate)
+    if calibration:
+        vad.calibrate(samples[:calibration])
+    speech = vad.process(samples)
+
+    # Edges of the smoothed speech mask give the segment boundaries
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    # Segments open once the onset run is complete, so move the start back to where the run began
+    starts = np.maximum(np.flatnonzero(edges == 1) - vad.onset_frames + 1, 0)
+    ends = np.flatnonzero(edges == -1)
+    return [(float(start * vad.frame_duration), float(end * vad.frame_duration))
+            for start, end in zip(starts, ends)]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python vad.py recording.wav [more.wav ...]")
+        sys.exit(1)
+
+    for path in sys.argv[1:]:
+        samples, rate = read_wav(path)
+        segments = detect_segments(samples, rate)
+        print(f"{path}: {len(samples) / rate:.2f}s, {len(segments)} speech segment(s)")
+        for start, end in segments:
+            print(f"  {start:7.2f}s - {end:7.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,36 @@
-import os
 import sys
-import time
+import queue
 import threading
-import tempfile
+import importlib.util
 import tkinter as tk
 from tkinter import ttk, messagebox
-import pyaudio
-import wave
-import numpy as np
-import pygame
-from openai import OpenAI
+# Only light modules here: pyaudio, numpy, openai and the session engine are
+# imported by load_backend, after the window is up
+from languages import LANGUAGES
+from tasks import TASKS
 
 # ========== API KEY CONFIGURATION ==========
 # IMPORTANT: Delete this key after testing and use environment variables in production
 API_KEY = "API HERE"  # Set your API key here if not using environment variables
 
-# Initialize OpenAI client with either environment variable or direct API key
-try:
-    if API_KEY:
-        client = OpenAI(api_key=API_KEY)
-    else:
-        client = OpenAI()  # Will use OPENAI_API_KEY environment variable
-except Exception as e:
-    print(f"Error initializing OpenAI client: {e}")
-    print("\nPlease set your API key in one of these ways:")
-    print("1. Edit this file and add your key to the API_KEY variable")
-    print("2. Set the OPENAI_API_KEY environment variable and restart your terminal")
-    print("   Windows: set OPENAI_API_KEY=your_api_key_here")
-    print("   Mac/Linux: export OPENAI_API_KEY=your_api_key_here")
-    sys.exit(1)
-
-# Supported languages with corresponding language codes
-LANGUAGES = {
-    "English": "en",
-    "Spanish": "es",
-    "French": "fr",
-    "German": "de", 
-    "Mandarin": "zh",
-    "Hindi": "hi",
-    "Arabic": "ar",
-    "Russian": "ru",
-    "Japanese": "ja",
-    "Portuguese": "pt"
-}
-
-# Define the tasks from your mockup
-TASKS = [
-    "Greeting,find out reason for call",
-    "Collect patient demographic information",
-    "Collect insurance information",
-    "Verify insurance eligibility",
-    "Confirm imaging requirements",
-    "Check availability for pre-op consult"
-]
-
-# Audio recording parameters
-FORMAT = pyaudio.paInt16
-CHANNELS = 1
-RATE = 44100
-CHUNK = 1024
-SILENCE_THRESHOLD = 1000  # Adjust based on your microphone sensitivity
-SILENCE_DURATION = 1  # Seconds of silence to consider speech ended
+API_KEY_HELP = """Please set your API key in one of these ways:
+1. Edit this file and add your key to the API_KEY variable
+2. Set the OPENAI_API_KEY environment variable and restart your terminal
+   Windows: set OPENAI_API_KEY=your_api_key_here
+   Mac/Linux: export OPENAI_API_KEY=your_api_key_here"""
+
+# Show the window at once and load audio, the API client and the session engine on a worker thread.
+# Set to False to load everything before the window appears.
+FAST_START = True
+
+# Pre-render greetings for every language in the background once the API key is confirmed
+WARM_UP_GREETINGS = True
+
+# Session events are queued by the session thread and drawn on the Tk thread in batches
+UI_POLL_MS = 50  # How often queued events are drawn
+MAX_EVENTS_PER_DRAIN = 500  # Leave the rest for the next poll so a burst can't freeze the window
+MAX_TRANSCRIPT_LINES = 2000  # Older lines are trimmed from the window (the full call is in the conversation store)
+
 
 class HealthcareVoiceAssistant:
     def __init__(self, root):
@@ -69,32 +39,26 @@ class HealthcareVoiceAssistant:
         self.root.geometry("900x650")
         self.root.configure(bg="#f0f0f0")
         
-        # Initialize PyAudio
-        try:
-            self.audio = pyaudio.PyAudio()
-        except Exception as e:
-            tk.messagebox.showerror("Error", f"Could not initialize audio: {e}\n\nMake sure you have a working microphone.")
-            sys.exit(1)
-        
-        # Set the desired input device (default to 5 but will be customizable)
-        self.input_device_index = 5  # Your headset is device 5
-        
-        # List audio devices to console
-        self.list_audio_devices()
-        
-        # Initialize pygame for audio playback
-        try:
-            pygame.mixer.init()
-        except Exception as e:
-            tk.messagebox.showerror("Error", f"Could not initialize audio playback: {e}")
-            sys.exit(1)
-        
+        # Microphone and speaker for the call; None follows the system default device
+        self.input_device_index = None
+        self.output_device_index = None
+
+        # Filled in by backend_ready once load_backend has finished
+        self.audio = None
+        self.api = None
+        self.devices = None  # The manager's DeviceRegistry
+        # Conversations run in a headless session engine; this window is one client of it
+        self.manager = None
+        self.session = None
+        
+        # Events from the session thread, drawn by drain_ui_queue on the Tk thread
+        self.ui_queue = queue.SimpleQueue()
+
         # Setup UI
         self.setup_ui()
+        self.root.after(UI_POLL_MS, self.drain_ui_queue)
         
-        # Initialize conversation state
-        self.conversation_history = []
-        self.current_task_index = 0
+        # Initialize UI state
         self.recording = False
         self.current_language = "English"
         
@@ -112,51 +76,116 @@ class HealthcareVoiceAssistant:
             "pt": {"start": "Iniciar Assistente", "stop": "Parar Assistente"}
         }
         
+        # Load audio and API clients; the connection check starts once they are ready
+        self.status_var.set("Starting up...")
+        if FAST_START:
+            threading.Thread(target=self.load_backend, name="startup", daemon=True).start()
+        else:
+            self.load_backend()
+
+    def load_backend(self):
+        """Import and create the audio, API and session clients (runs on a worker thread in fast-start mode)"""
+        step = "audio"
+        try:
+            import pyaudio
+            audio = pyaudio.PyAudio()
+
+            step = "api"
+            from api import OpenAIPool
+            from session import SessionManager
+            api = OpenAIPool(api_key=API_KEY)  # Falls back to the OPENAI_API_KEY environment variable
+            manager = SessionManager(api, audio)
+        except Exception as e:
+            self.ui_queue.put(("backend", {"step": step, "error": e}))
+            return
+        # Hot-plug notices arrive on the device watcher thread; the dropdowns are refreshed on the Tk thread
+        manager.devices.add_listener(lambda changes: self.ui_queue.put(("devices", changes)))
+        self.ui_queue.put(("backend", {"audio": audio, "api": api, "manager": manager}))
+
+    def backend_ready(self, data):
+        """Finish startup on the Tk thread once load_backend is done"""
+        if "error" in data:
+            if data["step"] == "audio":
+                tk.messagebox.showerror("Error", f"Could not initialize audio: {data['error']}\n\nMake sure you have a working microphone.")
+            else:
+                print(f"Error initializing OpenAI client: {data['error']}\n\n{API_KEY_HELP}")
+                tk.messagebox.showerror("API Error", f"Error initializing OpenAI client: {data['error']}\n\n{API_KEY_HELP}")
+            self.root.destroy()
+            return
+
+        self.audio = data["audio"]
+        self.api = data["api"]
+        self.manager = data["manager"]
+        self.devices = self.manager.devices
+        self.list_audio_devices()
+        self.refresh_devices()
+        self.start_button.config(state=tk.NORMAL)
+        self.test_button.config(state=tk.NORMAL)
+
         # Test OpenAI connection
         self.test_openai_connection()
 
     def list_audio_devices(self):
-        """List all available audio input devices"""
-        info = self.audio.get_host_api_info_by_index(0)
-        numdevices = info.get('deviceCount')
-        
+        """List all available audio input and output devices"""
         print("\nAvailable audio input devices:")
-        for i in range(0, numdevices):
-            if self.audio.get_device_info_by_host_api_device_index(0, i).get('maxInputChannels') > 0:
-                print(f"Input Device id {i} - {self.audio.get_device_info_by_host_api_device_index(0, i).get('name')}")
-        print(f"Currently using device: {self.input_device_index}\n")
+        for device in self.devices.inputs():
+            print(f"Input Device id {device['index']} - {device['name']}")
+        print("Available audio output devices:")
+        for device in self.devices.outputs():
+            print(f"Output Device id {device['index']} - {device['name']}")
+        print(f"Currently using devices: {self.device_label(self.input_device_index, True)}, "
+              f"{self.device_label(self.output_device_index, False)}\n")
 
     def get_input_devices(self):
-        """Get a list of available input devices"""
-        devices = []
-        info = self.audio.get_host_api_info_by_index(0)
-        numdevices = info.get('deviceCount')
-        
-        for i in range(0, numdevices):
-            if self.audio.get_device_info_by_host_api_device_index(0, i).get('maxInputChannels') > 0:
-                name = self.audio.get_device_info_by_host_api_device_index(0, i).get('name')
-                devices.append((i, name))
-        
-        return devices
+        """Get a list of available input devices (cached by the device registry)"""
+        return [(device["index"], device["name"]) for device in self.devices.inputs()]
+
+    def device_label(self, index, input):
+        """Dropdown text for a device index, with None meaning the system default"""
+        if index is None:
+            default = self.devices.default_input if input else self.devices.default_output
+            return f"Default ({self.devices.name(default) if default is not None else 'none'})"
+        return f"Device {index}: {self.devices.name(index)}"
+
+    def refresh_devices(self):
+        """Fill the microphone and speaker dropdowns from the device registry"""
+        for input, dropdown, var, index, devices in (
+                (True, self.device_dropdown, self.device_var, self.input_device_index, self.devices.inputs()),
+                (False, self.output_dropdown, self.output_var, self.output_device_index, self.devices.outputs())):
+            dropdown.config(values=[self.device_label(None, input)] +
+                                   [self.device_label(device["index"], input) for device in devices])
+            var.set(self.device_label(index, input))
+
+    def devices_changed(self, changes):
+        """Show plugged and unplugged devices (on the Tk thread)"""
+        for name in changes["added"]:
+            self.add_to_conversation("System", f"Audio device connected: {name}")
+        for name in changes["removed"]:
+            self.add_to_conversation("System", f"Audio device disconnected: {name}")
+        self.refresh_devices()
 
     def test_openai_connection(self):
-        """Test the OpenAI connection to make sure the API key works"""
+        """Test the OpenAI connection in the background to make sure the API key works"""
+        self.status_var.set("Testing OpenAI connection...")
+        self.when_done(self.manager.submit(self.api.check_connection()), self.connection_checked)
+
+    def connection_checked(self, future):
         try:
-            self.status_var.set("Testing OpenAI connection...")
-            self.root.update()
-            
-            # Simple test API call
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": "Hello"}],
-                max_tokens=5
-            )
-            
+            future.result()
             self.status_var.set("OpenAI connection successful. Ready.")
+            if WARM_UP_GREETINGS:
+                self.manager.submit(self.manager.warm_up())
         except Exception as e:
             self.status_var.set("OpenAI connection failed!")
             tk.messagebox.showerror("API Error", f"OpenAI API connection failed: {e}\n\nPlease check your API key.")
 
+    def when_done(self, future, callback, interval=50):
+        """Call callback(future) on the Tk thread once a background future has finished"""
+        if future.done():
+            callback(future)
+        else:
+            self.root.after(interval, self.when_done, future, callback, interval)
+
     def setup_ui(self):
         # Top frame for language selection
         top_frame = tk.Frame(self.root, bg="#f0f0f0")
@@ -178,28 +207,28 @@ class HealthcareVoiceAssistant:
         device_label = tk.Label(device_frame, text="Microphone:", bg="#f0f0f0", font=("Arial", 12))
         device_label.pack(side=tk.LEFT, padx=5)
 
-        # Get device list
-        input_devices = self.get_input_devices()
-        device_names = [f"Device {idx}: {name}" for idx, name in input_devices]
+        # Device lists are filled in by backend_ready
+        self.device_var = tk.StringVar(value="Loading devices...")
+        self.device_dropdown = ttk.Combobox(device_frame, textvariable=self.device_var, values=[], state="readonly", width=25)
+        self.device_dropdown.pack(side=tk.LEFT, padx=5)
+        self.device_dropdown.bind("<<ComboboxSelected>>", self.change_device)
 
-        self.device_var = tk.StringVar()
-        if input_devices:
-            # Find name for current device index
-            device_name = next((name for idx, name in input_devices if idx == self.input_device_index), "Unknown")
-            self.device_var.set(f"Device {self.input_device_index}: {device_name}")
+        output_label = tk.Label(device_frame, text="Speaker:", bg="#f0f0f0", font=("Arial", 12))
+        output_label.pack(side=tk.LEFT, padx=5)
 
-        device_dropdown = ttk.Combobox(device_frame, textvariable=self.device_var, values=device_names, state="readonly", width=25)
-        device_dropdown.pack(side=tk.LEFT, padx=5)
-        device_dropdown.bind("<<ComboboxSelected>>", self.change_device)
+        self.output_var = tk.StringVar(value="Loading devices...")
+        self.output_dropdown = ttk.Combobox(device_frame, textvariable=self.output_var, values=[], state="readonly", width=25)
+        self.output_dropdown.pack(side=tk.LEFT, padx=5)
+        self.output_dropdown.bind("<<ComboboxSelected>>", self.change_device)
         
-        # Test Mode button
+        # Test Mode button (enabled once the backend has loaded)
         self.test_button = tk.Button(top_frame, text="Test Mode", command=self.test_mode, 
-                                    bg="#FFA500", fg="white", font=("Arial", 12), padx=10)
+                                    bg="#FFA500", fg="white", font=("Arial", 12), padx=10, state=tk.DISABLED)
         self.test_button.pack(side=tk.RIGHT, padx=5)
         
         # Start/Stop button
         self.start_button = tk.Button(top_frame, text="Start Assistant", command=self.toggle_assistant, 
-                                      bg="#4CAF50", fg="white", font=("Arial", 12), padx=10)
+                                      bg="#4CAF50", fg="white", font=("Arial", 12), padx=10, state=tk.DISABLED)
         self.start_button.pack(side=tk.RIGHT, padx=5)
         
         # Middle frame for conversation display
@@ -209,6 +238,9 @@ class HealthcareVoiceAssistant:
         # Conversation text area
         self.conversation_text = tk.Text(self.conversation_frame, wrap=tk.WORD, bg="white", font=("Arial", 12))
         self.conversation_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.conversation_text.tag_configure("speaker_assistant", foreground="blue", font=("Arial", 12, "bold"))
+        self.conversation_text.tag_configure("speaker_you", foreground="green", font=("Arial", 12, "bold"))
+        self.conversation_text.tag_configure("speaker_system", foreground="gray", font=("Arial", 10, "italic"))
         
         # Add scrollbar
         scrollbar = tk.Scrollbar(self.conversation_text)
@@ -238,6 +270,8 @@ class HealthcareVoiceAssistant:
         """Handle language change"""
         self.current_language = self.language_var.get()
         lang_code = LANGUAGES[self.current_language]
+        if self.session:
+            self.session.language = self.current_language
         
         # Update UI text elements based on selected language
         self.start_button.config(text=self.translations[lang_code]["start" if not self.recording else "stop"])
@@ -246,38 +280,39 @@ class HealthcareVoiceAssistant:
         self.add_to_conversation("System", f"Language changed to {self.current_language}")
 
     def change_device(self, event=None):
-        """Handle audio device change"""
-        selected = self.device_var.get()
+        """Handle microphone or speaker change; the registry checks the device before it is used"""
+        from devices import DeviceError
+        from session import RATE, TTS_RATE
+        parse = lambda selected: None if selected.startswith("Default") else int(selected.split(':')[0].replace('Device ', ''))
+        input_index, output_index = parse(self.device_var.get()), parse(self.output_var.get())
         try:
-            device_index = int(selected.split(':')[0].replace('Device ', ''))
-            self.input_device_index = device_index
-            print(f"Changed input device to {device_index}")
-            self.add_to_conversation("System", f"Microphone changed to {selected}")
-        except Exception as e:
+            if self.session:
+                self.manager.set_devices(self.session, input_index, output_index)
+            else:
+                self.devices.validate(input_index, RATE, input=True)
+                self.devices.validate(output_index, TTS_RATE, input=False)
+        except DeviceError as e:
             print(f"Error changing device: {e}")
+            tk.messagebox.showerror("Audio Device", str(e))
+            self.refresh_devices()  # Back to the devices in use
+            return
+        if input_index != self.input_device_index:
+            self.add_to_conversation("System", f"Microphone changed to {self.device_var.get()}")
+        if output_index != self.output_device_index:
+            self.add_to_conversation("System", f"Speaker changed to {self.output_var.get()}")
+        self.input_device_index, self.output_device_index = input_index, output_index
+        print(f"Changed devices to input {input_index}, output {output_index}")
 
     def test_mode(self):
         """Process a test input without using the microphone"""
-        if not self.recording:
-            self.start_assistant()
+        if not self.recording and not self.start_assistant():
+            return
         
         # Simulate user input
         test_input = "Hello, I'm calling about my MRI appointment next week."
         
-        # Add to conversation display
-        self.add_to_conversation("You (Test)", test_input)
-        
-        # Process with LLM
-        response = self.process_with_llm(test_input)
-        
-        # Add to conversation display
-        self.add_to_conversation("Assistant", response)
-        
-        # Speak the response
-        self.speak_text(response)
-        
-        # Update task progress
-        self.update_task_progress()
+        # Respond on the session loop so the window stays responsive
+        self.session.submit(self.session.handle_text(test_input, "You (Test)"))
 
     def toggle_assistant(self):
         if not self.recording:
@@ -287,365 +322,131 @@ class HealthcareVoiceAssistant:
 
     def start_assistant(self):
         """Start the voice assistant"""
+        from devices import DeviceError
+        if self.session is None:
+            self.session = self.manager.create_session(
+                language=self.current_language,
+                input_device_index=self.input_device_index,
+                output_device_index=self.output_device_index,
+                on_event=self.handle_session_event
+            )
+        fresh = not self.session.conversation_history
+
+        # The session greets the caller and listens on its own thread
+        try:
+            self.manager.start_session(self.session)
+        except DeviceError as e:
+            self.status_var.set("Audio device error")
+            tk.messagebox.showerror("Audio Device", f"{e}\n\nChoose another microphone or speaker.")
+            return False
+
         self.recording = True
         lang_code = LANGUAGES[self.current_language]
         self.start_button.config(text=self.translations[lang_code]["stop"], bg="#F44336")
         self.status_var.set("Assistant active - listening...")
         
         # Clear previous conversation if starting fresh
-        if not self.conversation_history:
+        if fresh:
+            self.conversation_text.config(state=tk.NORMAL)
             self.conversation_text.delete(1.0, tk.END)
-        
-        # Start with a greeting based on the selected language
-        try:
-            greeting = self.get_greeting()
-            self.add_to_conversation("Assistant", greeting)
-            self.speak_text(greeting)
-        except Exception as e:
-            self.status_var.set(f"Error generating greeting: {str(e)}")
-            self.add_to_conversation("System", f"Error: {str(e)}")
-            self.recording = False
-            return
-        
-        # Start listening thread
-        self.listen_thread = threading.Thread(target=self.listen_loop)
-        self.listen_thread.daemon = True
-        self.listen_thread.start()
+            self.conversation_text.config(state=tk.DISABLED)
+        return True
 
     def stop_assistant(self):
         """Stop the voice assistant"""
         self.recording = False
+        if self.session:
+            self.session.stop()
         lang_code = LANGUAGES[self.current_language]
         self.start_button.config(text=self.translations[lang_code]["start"], bg="#4CAF50")
         self.status_var.set("Assistant stopped")
 
-    def get_greeting(self):
-        """Generate an appropriate greeting based on the current language"""
-        lang_code = LANGUAGES[self.current_language]
-        
-        try:
-            # Use LLM to generate a natural greeting in the selected language
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": f"You are a medical intake assistant for a clinic. Respond in {self.current_language} only."},
-                    {"role": "user", "content": f"Generate a brief, friendly greeting in {self.current_language} for a patient calling a medical clinic. Introduce yourself as an AI assistant who will help collect information for their radiology appointment."}
-                ],
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content
-        except Exception as e:
-            self.status_var.set(f"API Error: {str(e)}")
-            raise
-
-    def listen_loop(self):
-        """Main loop for listening and processing speech"""
-        while self.recording:
-            self.status_var.set("Listening...")
-            
-            # Record audio
-            try:
-                audio_data = self.record_audio()
-            except Exception as e:
-                self.status_var.set(f"Recording error: {str(e)}")
-                self.add_to_conversation("System", f"Recording error: {str(e)}")
-                continue
-            
-            if not self.recording:  # Check if stopped while recording
-                break
-                
-            if audio_data:
-                self.status_var.set("Processing speech...")
-                
-                # Save audio to temporary file
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-                try:
-                    with wave.open(temp_file.name, 'wb') as wf:
-                        wf.setnchannels(CHANNELS)
-                        wf.setsampwidth(self.audio.get_sample_size(FORMAT))
-                        wf.setframerate(RATE)
-                        wf.writeframes(b''.join(audio_data))
-                
-                    # Process the audio
-                    try:
-                        # 1. Transcribe speech to text
-                        transcript = self.transcribe_audio(temp_file.name)
-                        
-                        if transcript.strip():
-                            # Add to conversation display
-                            self.add_to_conversation("You", transcript)
-                            
-                            # 2. Process with LLM
-                            response = self.process_with_llm(transcript)
-                            
-                            # 3. Add to conversation display
-                            self.add_to_conversation("Assistant", response)
-                            
-                            # 4. Speak the response
-                            self.speak_text(response)
-                            
-                            # 5. Update task progress
-                            self.update_task_progress()
-                    except Exception as e:
-                        self.status_var.set(f"Processing error: {str(e)}")
-                        self.add_to_conversation("System", f"Error: {str(e)}")
-                finally:
-                    # Clean up temp file
-                    try:
-                        os.unlink(temp_file.name)
-                    except:
-                        pass
-
-    def record_audio(self):
-        """Record audio until silence is detected"""
-        try:
-            # Open stream with the specified device index
-            stream = self.audio.open(
-                format=FORMAT, 
-                channels=CHANNELS,
-                rate=RATE, 
-                input=True,
-                input_device_index=self.input_device_index,  # Use selected device
-                frames_per_buffer=CHUNK
-            )
-            print(f"Recording from device {self.input_device_index}")
-        except Exception as e:
-            self.status_var.set(f"Microphone error: {str(e)}")
-            self.add_to_conversation("System", f"Could not access microphone: {str(e)}\nTry changing the device index.")
-            self.recording = False
-            return None
-        
-        frames = []
-        silent_chunks = 0
-        silent_threshold = int(SILENCE_DURATION * RATE / CHUNK)
-        has_speech = False
-        volume_levels = []
-        recording_start_time = time.time()
-        MAX_RECORDING_TIME = 5  # Force processing after 5 seconds
-        
-        self.root.update()  # Update UI
-        
-        try:
-            # Pre-listen to calibrate
-            for _ in range(10):
-                if not self.recording:
-                    stream.stop_stream()
-                    stream.close()
-                    return None
-                
-                data = stream.read(CHUNK, exception_on_overflow=False)
-                
-            # Main recording loop    
-            while self.recording:
-                data = stream.read(CHUNK, exception_on_overflow=False)
-                frames.append(data)
-                
-                # Check audio level
-                audio_data = np.frombuffer(data, dtype=np.int16)
-                volume_norm = np.linalg.norm(audio_data / 32768.0) * 10
-                volume_levels.append(volume_norm)
-                
-                # Debug output
-                if len(frames) % 10 == 0:  # Only update every 10 frames
-                    avg_volume = sum(volume_levels[-10:]) / min(len(volume_levels), 10)
-                    self.status_var.set(f"Listening... (Vol: {avg_volume:.2f}, Silent: {silent_chunks})")
-                    print(f"Volume: {volume_norm:.4f}, Silent chunks: {silent_chunks}, Has speech: {has_speech}")
-                
-                # Detect speech/silence (lower threshold for more sensitivity)
-                if volume_norm > 0.05:  # More sensitive threshold
-                    silent_chunks = 0
-                    has_speech = True
-                else:
-                    silent_chunks += 1
-                
-                # If we've collected speech and detected silence, stop recording
-                if has_speech and silent_chunks > silent_threshold:
-                    print("Speech followed by silence detected - processing")
-                    break
-                         
-                self.root.update()  # Keep UI responsive
-                
-        except Exception as e:
-            self.status_var.set(f"Recording error: {str(e)}")
-            print(f"Recording exception: {e}")
-        finally:
-            stream.stop_stream()
-            stream.close()
-            
-        # Provide feedback about speech detection
-        if not has_speech and len(frames) > 0:
-            print("No speech detected in recording")
-            self.status_var.set("No speech detected - Try speaking louder")
-            max_volume = max(volume_levels) if volume_levels else 0
-            print(f"Maximum volume detected: {max_volume:.4f}")
-            return None
-            
-        return frames if (has_speech or len(frames) > 20) else None
-
-    def transcribe_audio(self, audio_file_path):
-        """Transcribe audio file to text using Whisper API"""
-        try:
-            with open(audio_file_path, "rb") as audio_file:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language=LANGUAGES[self.current_language]
-                )
-            return transcript.text
-        except Exception as e:
-            self.status_var.set(f"Transcription error: {str(e)}")
-            raise
+    def handle_session_event(self, session, event, data):
+        """Queue events from the voice session; called on the session thread, so no Tk calls here"""
+        if event in ("message", "append", "status", "tasks", "stopped"):
+            self.ui_queue.put((event, data))
 
-    def process_with_llm(self, text):
-        """Process text with GPT to understand intent and extract information"""
+    def drain_ui_queue(self):
+        """Draw queued events on the Tk thread: one batched insert, and only the latest status and tasks"""
+        lines = []
+        status = tasks = None
         try:
-            # Add the user's text to the conversation history
-            self.conversation_history.append({"role": "user", "content": text})
-            
-            # Determine which task we're working on
-            current_task = TASKS[self.current_task_index] if self.current_task_index < len(TASKS) else "Follow-up"
-            
-            # System message to guide the AI's behavior
-            system_message = {
-                "role": "system", 
-                "content": f"""
-                You are a medical intake assistant for a radiology clinic.
-                Respond in {self.current_language} only.
-                
-                Current task: {current_task}
-                
-                Complete these tasks in order:
-                - Confirm the patient's phone number
-                - Collect patient demographic information (name, DOB, address)
-                - Collect insurance information (provider, policy number)
-                - Verify insurance eligibility
-                - Confirm imaging requirements
-                - Check availability for pre-op consultation
-                
-                Be professional, friendly, and HIPAA compliant. Ask ONE question at a time.
-                Keep responses brief and conversational.
-                """
-            }
-            
-            # Generate a response from the LLM
-            messages = [system_message] + self.conversation_history
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                temperature=0.7
-            )
-            
-            # Extract the AI's response
-            ai_message = response.choices[0].message.content
-            
-            # Add the AI's response to the conversation history
-            self.conversation_history.append({"role": "assistant", "content": ai_message})
-            
-            return ai_message
-        except Exception as e:
-            self.status_var.set(f"Processing error: {str(e)}")
-            raise
+            for _ in range(MAX_EVENTS_PER_DRAIN):
+                event, data = self.ui_queue.get_nowait()
+                if event in ("message", "append"):
+                    lines.append((event, data))
+                elif event == "status":
+                    status = data["text"]
+                elif event == "tasks":
+                    tasks = data["completed"]
+                elif event == "devices":
+                    self.devices_changed(data)
+                elif event == "backend":
+                    self.backend_ready(data)
+                    if self.manager is None:
+                        return  # Startup failed and the window is gone
+                elif event == "stopped" and data["reason"] == "error" and self.recording:
+                    # The session ended on its own (e.g. microphone or greeting error)
+                    self.stop_assistant()
+                    status = None  # Statuses queued before the stop are stale
+        except queue.Empty:
+            pass
 
-    def speak_text(self, text):
-        """Convert text to speech and play it"""
-        try:
-            self.status_var.set("Speaking...")
-            
-            # Determine which voice to use based on language
-            voice = "nova"  # Default English voice
-            
-            # Use TTS to generate audio
-            response = client.audio.speech.create(
-                model="tts-1",
-                voice=voice,
-                input=text
-            )
-            
-            # Save to temporary file and play
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-            temp_file.close()
-            
-            with open(temp_file.name, 'wb') as f:
-                for chunk in response.iter_bytes(chunk_size=1024 * 1024):
-                    f.write(chunk)
-            
-            # Play the audio
-            pygame.mixer.music.load(temp_file.name)
-            pygame.mixer.music.play()
-            
-            # Wait for playback to finish
-            while pygame.mixer.music.get_busy():
-                self.root.update()
-                time.sleep(0.1)
-            
-            # Clean up temp file
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
-                
-            self.status_var.set("Listening...")
-        except Exception as e:
-            self.status_var.set(f"Speech error: {str(e)}")
-            self.add_to_conversation("System", f"Speech error: {str(e)}")
+        if lines:
+            self.render_conversation(lines)
+        if status is not None:
+            self.status_var.set(status)
+        if tasks is not None:
+            for var, completed in zip(self.task_vars, tasks):
+                var.set(1 if completed else 0)
+        self.root.after(UI_POLL_MS, self.drain_ui_queue)
+
+    def close(self):
+        """Stop any running session and close the window"""
+        if self.manager is not None:
+            self.manager.close()
+        self.root.destroy()
 
     def add_to_conversation(self, speaker, text):
         """Add a message to the conversation display"""
-        self.conversation_text.config(state=tk.NORMAL)
-        self.conversation_text.insert(tk.END, f"\n{speaker}: ", f"speaker_{speaker.lower()}")
-        self.conversation_text.insert(tk.END, f"{text}\n")
-        self.conversation_text.tag_configure("speaker_assistant", foreground="blue", font=("Arial", 12, "bold"))
-        self.conversation_text.tag_configure("speaker_you", foreground="green", font=("Arial", 12, "bold"))
-        self.conversation_text.tag_configure("speaker_system", foreground="gray", font=("Arial", 10, "italic"))
-        self.conversation_text.see(tk.END)
-        self.conversation_text.config(state=tk.DISABLED)
-        self.root.update()
-
-    def update_task_progress(self):
-        """Update the task progress based on conversation"""
-        # This would be more sophisticated in a real app
-        # For this demo, we'll use a simple approach
-        
-        conversation_text = " ".join([msg["content"] for msg in self.conversation_history])
-        
-        # Check for task completion markers in the conversation
-        if "phone" in conversation_text.lower() and "confirm" in conversation_text.lower():
-            self.task_vars[0].set(1)
-            
-        if any(term in conversation_text.lower() for term in ["name", "birth", "address"]):
-            self.task_vars[1].set(1)
-            
-        if any(term in conversation_text.lower() for term in ["insurance", "policy", "coverage"]):
-            self.task_vars[2].set(1)
-            
-        if "eligib" in conversation_text.lower():
-            self.task_vars[3].set(1)
-            
-        if any(term in conversation_text.lower() for term in ["imaging", "mri", "ct", "xray", "x-ray"]):
-            self.task_vars[4].set(1)
-            
-        if any(term in conversation_text.lower() for term in ["consult", "appointment", "schedule"]):
-            self.task_vars[5].set(1)
-            
-        # Update the current task index
-        completed_tasks = sum(var.get() for var in self.task_vars)
-        if completed_tasks > self.current_task_index:
-            self.current_task_index = completed_tasks
+        self.ui_queue.put(("message", {"speaker": speaker, "text": text}))
+
+    def render_conversation(self, lines):
+        """Insert a batch of messages and appended text with a single widget update"""
+        widget = self.conversation_text
+        widget.config(state=tk.NORMAL)
+        segments = []  # [text, tags] pairs to insert at the end, in order
+        for event, data in lines:
+            if event == "message":
+                segments.append([f"\n{data['speaker']}: ", f"speaker_{data['speaker'].lower()}"])
+                segments.append([f"{data['text']}\n", ()])
+            elif segments:
+                # More text for a message in this batch: add it before the message's trailing newline
+                segments[-1][0] = f"{segments[-1][0][:-1]}{data['text']} \n"
+            else:
+                # More text for a message already on screen
+                widget.insert("end-2c", f"{data['text']} ")
+        if segments:
+            widget.insert(tk.END, *[part for segment in segments for part in segment])
+
+        # Keep the scrollback bounded over a long shift
+        line_count = int(widget.index("end-1c").split(".")[0])
+        if line_count > MAX_TRANSCRIPT_LINES:
+            widget.delete("1.0", f"{line_count - MAX_TRANSCRIPT_LINES + 1}.0")
+        widget.see(tk.END)
+        widget.config(state=tk.DISABLED)
 
 def main():
-    # Check for required libraries
-    try:
-        import pyaudio
-        import pygame
-    except ImportError:
+    # Check for required libraries without paying for importing them yet
+    if any(importlib.util.find_spec(name) is None for name in ("pyaudio", "numpy", "openai")):
         print("Error: Required libraries not installed.")
-        print("Please install them with: pip install pyaudio pygame numpy")
+        print("Please install them with: pip install pyaudio numpy openai")
         sys.exit(1)
         
     # Create and run the application
     root = tk.Tk()
     app = HealthcareVoiceAssistant(root)
+    root.protocol("WM_DELETE_WINDOW", app.close)
     root.mainloop()
 
 if __name__ == "__main__":